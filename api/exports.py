@@ -0,0 +1,233 @@
+import csv
+from collections import namedtuple
+import xlsxwriter
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import CharField, DecimalField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+from office.models import Reimburse, VoucherRetailerDiscount
+from retailer.models import RetailerPhoto, Voucher
+from wholesales.models import VoucherRedeem, WholesaleTransaction
+
+# Satu kolom laporan: judul kolom, nama field di values() dan formatter opsional
+Column = namedtuple('Column', ['header', 'field', 'format'], defaults=[None])
+
+
+def _datetime(value):
+    return timezone.localtime(value).isoformat() if value else None
+
+
+def _date(value):
+    return timezone.localtime(value).date().isoformat() if value else None
+
+
+def _file_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _first(queryset, field):
+    return Subquery(queryset.order_by('pk').values(field)[:1])
+
+
+def _amount(expression):
+    return Coalesce(expression, Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def _rendition(field):
+    # Sama dengan RetailerPhoto.thumbnail_url / medium_url: fallback ke gambar asli
+    return Coalesce(NullIf(field, Value('')), 'image', output_field=CharField())
+
+
+class Report:
+    """
+    A report definition: a queryset factory plus the columns to export.
+
+    Rows are read with `values()` over annotations/subqueries, so every row
+    comes from the main query and no per-row queries are issued.
+    """
+
+    def __init__(self, queryset, columns):
+        self._queryset = queryset
+        self.columns = columns
+
+    @property
+    def headers(self):
+        return [column.header for column in self.columns]
+
+    def queryset(self):
+        return self._queryset().values(*[column.field for column in self.columns])
+
+    def rows(self, chunk_size=None):
+        """Yield each row as a list, streaming from the database in chunks"""
+        chunk_size = chunk_size or getattr(settings, 'REPORT_EXPORT_CHUNK_SIZE', 2000)
+        for values in self.queryset().iterator(chunk_size=chunk_size):
+            yield [
+                column.format(values[column.field]) if column.format else values[column.field]
+                for column in self.columns
+            ]
+
+
+def _redeem_report():
+    return VoucherRedeem.objects.annotate(
+        export_voucher=F('voucher__code'),
+        export_wholesaler=F('wholesaler__name'),
+        export_retailer=F('voucher__retailer__name'),
+    ).order_by('pk')
+
+
+def _list_photos():
+    return RetailerPhoto.objects.annotate(
+        export_thumbnail=_rendition('thumbnail'),
+        export_medium=_rendition('medium'),
+    ).order_by('pk')
+
+
+def _list_vouchers():
+    transactions = WholesaleTransaction.objects.filter(voucher_redeem__voucher=OuterRef('pk'))
+    redeems = VoucherRedeem.objects.filter(voucher=OuterRef('pk'))
+    reimburses = Reimburse.objects.filter(voucher=OuterRef('pk'))
+    return Voucher.objects.annotate(
+        export_wholesaler_name=F('retailer__wholesale__name'),
+        export_retailer_name=F('retailer__name'),
+        export_total_price=_amount(_first(transactions, 'total_price')),
+        export_total_after_discount=_amount(_first(transactions, 'total_price_after_discount')),
+        export_redeemed_at=_first(redeems, 'redeemed_at'),
+        export_reimburse_at=_first(reimburses, 'reimbursed_at'),
+        export_reimburse_status=_first(reimburses, 'status__status'),
+    ).order_by('pk')
+
+
+def _list_reimburse():
+    discounts = VoucherRetailerDiscount.objects.filter(voucher_project_id=OuterRef('voucher__project_id'))
+    return Reimburse.objects.annotate(
+        export_voucher_code=F('voucher__code'),
+        export_wholesaler_name=F('wholesaler__name'),
+        export_retailer_name=F('retailer__name'),
+        export_status=F('status__status'),
+        export_status_at=F('status__status_at'),
+        export_project_name=F('voucher__project__name'),
+        export_discount_amount=_amount(_first(discounts, 'discount_amount')),
+        export_agen_fee=_amount(_first(discounts, 'agen_fee')),
+    ).order_by('pk')
+
+
+# Kolom mengikuti output serializer lama (VoucherRedeemSerializer, RetailerPhotoSerializer, dst.)
+REPORTS = {
+    'redeem_report': Report(_redeem_report, [
+        Column('voucher', 'export_voucher'),
+        Column('wholesaler', 'export_wholesaler'),
+        Column('redeemed_at', 'redeemed_at', _date),
+        Column('retailer', 'export_retailer'),
+    ]),
+    'list_photos': Report(_list_photos, [
+        Column('retailer_id', 'retailer_id'),
+        Column('id', 'id'),
+        Column('image', 'image', _file_url),
+        Column('thumbnail_url', 'export_thumbnail', _file_url),
+        Column('medium_url', 'export_medium', _file_url),
+        Column('is_verified', 'is_verified'),
+        Column('is_approved', 'is_approved'),
+        Column('remarks', 'remarks'),
+    ]),
+    'list_vouchers': Report(_list_vouchers, [
+        Column('id', 'id'),
+        Column('voucher_code', 'code'),
+        Column('wholesaler_name', 'export_wholesaler_name'),
+        Column('total_price', 'export_total_price'),
+        Column('total_after_discount', 'export_total_after_discount'),
+        Column('retailer_name', 'export_retailer_name'),
+        Column('redeemed', 'redeemed'),
+        Column('redeemed_at', 'export_redeemed_at', _datetime),
+        Column('reimburse_at', 'export_reimburse_at', _datetime),
+        Column('reimburse_status', 'export_reimburse_status'),
+        Column('lifecycle_state', 'lifecycle_state'),
+        Column('lifecycle_state_at', 'lifecycle_state_at', _datetime),
+    ]),
+    'list_reimburse': Report(_list_reimburse, [
+        Column('id', 'id'),
+        Column('voucher_code', 'export_voucher_code'),
+        Column('wholesaler_name', 'export_wholesaler_name'),
+        Column('retailer_name', 'export_retailer_name'),
+        Column('reimbursed_at', 'reimbursed_at', _datetime),
+        Column('reimbursed_by', 'reimbursed_by'),
+        Column('status', 'export_status'),
+        Column('status_at', 'export_status_at', _datetime),
+        Column('project', 'export_project_name'),
+        Column('project_name', 'export_project_name'),
+        Column('discount_amount', 'export_discount_amount', float),
+        Column('agen_fee', 'export_agen_fee', float),
+    ]),
+}
+
+# Interval (baris) untuk callback progress export
+PROGRESS_EVERY = 5000
+
+FILE_TYPES = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+}
+
+
+def _track(rows, progress, every):
+    """Pass rows through, calling progress(row_count) every `every` rows and at the end"""
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        if progress and count % every == 0:
+            progress(count)
+        yield row
+    if progress:
+        progress(count)
+
+
+def write_xlsx(report, fileobj, progress=None):
+    """
+    Write the report to `fileobj` with xlsxwriter in constant_memory mode:
+    each row is flushed to a temp file as soon as it is written, so memory
+    stays flat regardless of the row count.
+    """
+    workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Sheet1')
+    worksheet.write_row(0, 0, report.headers)
+    row_count = 0
+    for row_count, row in enumerate(_track(report.rows(), progress, PROGRESS_EVERY), start=1):
+        worksheet.write_row(row_count, 0, row)
+    workbook.close()
+    return row_count
+
+
+class _Echo:
+    """File-like object whose write() just returns the line, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(report, progress=None):
+    """Yield the report as CSV lines, one database chunk at a time"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(report.headers)
+    for row in _track(report.rows(), progress, PROGRESS_EVERY):
+        yield writer.writerow(row)
+
+
+def write_csv(report, fileobj, progress=None):
+    row_count = -1
+    for row_count, line in enumerate(iter_csv(report, progress)):
+        fileobj.write(line.encode('utf-8'))
+    return row_count
+
+
+def write_report(report, file_type, fileobj, progress=None):
+    """
+    Write the report in `file_type` (xlsx / csv) to a binary file object.
+    `progress(row_count)` is called every PROGRESS_EVERY rows. Returns the row count.
+    """
+    if file_type == 'csv':
+        return write_csv(report, fileobj, progress)
+    return write_xlsx(report, fileobj, progress)
+
+
+def export_filename(view_name, file_type):
+    timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
+    return f'{view_name}-{timestamp}.{FILE_TYPES[file_type][0]}'
@@ -0,0 +1,116 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status as http_status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_hash(request):
+    """Hash of the request body (uploaded files by name and size, not content)"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {key: values for key, values in data.lists() if key not in request.FILES}
+    files = {key: [(f.name, f.size) for f in request.FILES.getlist(key)] for key in request.FILES}
+    raw = json.dumps([request.method, request.path, data, files], sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lease_start(now):
+    # Baris in-progress yang lebih tua dari ini dianggap milik worker yang mati (timeout/kill)
+    return now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 60))
+
+
+def _claim(request, endpoint, key, fingerprint, now):
+    """
+    Insert the in-progress row for this key. Returns None when the request
+    should run, or the stored IdempotencyKey when another request won the race.
+    Expired rows and in-progress rows older than IDEMPOTENCY_KEY_LEASE
+    seconds are taken over.
+    """
+    expires_at = now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                user=request.user, endpoint=endpoint, key=key, request_hash=fingerprint, expires_at=expires_at
+            )
+        return None
+    except IntegrityError:
+        pass
+    # Baris yang expired atau lease-nya habis diambil alih (UPDATE bersyarat: hanya satu request yang menang)
+    reclaimed = IdempotencyKey.objects.filter(
+        Q(expires_at__lte=now) | Q(status_code__isnull=True, created_at__lte=_lease_start(now)),
+        user=request.user, endpoint=endpoint, key=key,
+    ).update(request_hash=fingerprint, status_code=None, response_body=None, created_at=now, expires_at=expires_at)
+    if reclaimed:
+        return None
+    return IdempotencyKey.objects.filter(user=request.user, endpoint=endpoint, key=key).first()
+
+
+def idempotent(endpoint):
+    """
+    Answer retries of a POST carrying an Idempotency-Key header from storage.
+
+    The first request with a key (per user and endpoint) runs the view and
+    its response (status < 500) is stored for IDEMPOTENCY_KEY_TTL seconds;
+    a retry with the same key and body gets that response back after one
+    lookup, without running the view. A retry while the first request is
+    still running gets 409 (for at most IDEMPOTENCY_KEY_LEASE seconds, in
+    case that worker died), the same key with another body gets 422.
+    Requests without the header are not affected.
+    Place it under @api_view / @permission_classes.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"}, status=http_status.HTTP_400_BAD_REQUEST)
+
+            now = timezone.now()
+            fingerprint = request_hash(request)
+            record = IdempotencyKey.objects.filter(
+                user=request.user, endpoint=endpoint, key=key, expires_at__gt=now
+            ).first()
+            if record is None or (record.status_code is None and record.created_at <= _lease_start(now)):
+                record = _claim(request, endpoint, key, fingerprint, now)
+
+            if record is not None:
+                if record.request_hash != fingerprint:
+                    return Response({"error": f"{HEADER} was already used with a different request"}, status=http_status.HTTP_422_UNPROCESSABLE_ENTITY)
+                if record.status_code is None:
+                    return Response({"error": f"A request with this {HEADER} is still being processed"}, status=http_status.HTTP_409_CONFLICT)
+                return _replay(record)
+
+            claimed = IdempotencyKey.objects.filter(user=request.user, endpoint=endpoint, key=key)
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                # Gagal tanpa response: key dilepas supaya retry bisa menjalankan ulang
+                claimed.delete()
+                raise
+            if response.status_code >= 500 or not hasattr(response, 'data'):
+                claimed.delete()
+                return response
+            body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+            claimed.update(status_code=response.status_code, response_body=body)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,57 @@
+from collections import defaultdict
+from django.db.models import F
+from office import discounts
+from wholesales.models import WholesaleTransaction, WholesaleTransactionDetail
+from .serializers import ReimburseSerializer, WholesaleTransactionSerializer, WholesaleTransactionDetailSerializer
+
+
+def reimburse_queryset(reimburses):
+    """Join the relations read by ReimburseSerializer and reimburse_list into the main query"""
+    return reimburses.select_related('voucher__retailer', 'voucher__project', 'wholesaler', 'retailer', 'status')
+
+
+def reimburse_list(reimburses):
+    """
+    Build the list_reimburse response for rows from reimburse_queryset().
+
+    Loads the wholesale transactions and their details+items with one query
+    each (project discounts come from office.discounts), then assembles the
+    nested payload in memory.
+    """
+    reimburses = list(reimburses)
+    if not reimburses:
+        return []
+
+    voucher_ids = {reimburse.voucher_id for reimburse in reimburses}
+
+    transactions = list(
+        WholesaleTransaction.objects.filter(voucher_redeem__voucher_id__in=voucher_ids)
+        .annotate(loader_voucher_id=F('voucher_redeem__voucher_id'))
+        .order_by('pk')
+    )
+    details_by_transaction = defaultdict(list)
+    if transactions:
+        details = WholesaleTransactionDetail.objects.filter(transaction__in=transactions).select_related('item')
+        for detail in details.order_by('pk'):
+            details_by_transaction[detail.transaction_id].append(detail)
+
+    transactions_by_voucher = defaultdict(list)
+    for transaction in transactions:
+        data = WholesaleTransactionSerializer(transaction).data
+        data['details'] = WholesaleTransactionDetailSerializer(details_by_transaction[transaction.id], many=True).data
+        transactions_by_voucher[transaction.loader_voucher_id].append(data)
+
+    reimburse_data = ReimburseSerializer(
+        reimburses, many=True, context={'discounts': discounts.table()}
+    ).data
+    for reimburse, data in zip(reimburses, reimburse_data):
+        # Add retailer address details
+        retailer = reimburse.voucher.retailer
+        if retailer:
+            data['retailer_address'] = retailer.address
+            data['retailer_kelurahan'] = retailer.kelurahan
+            data['retailer_kecamatan'] = retailer.kecamatan
+            data['retailer_kota'] = retailer.kota
+            data['retailer_provinsi'] = retailer.provinsi
+        data['transactions'] = transactions_by_voucher[reimburse.voucher_id]
+    return reimburse_data
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Hapus Idempotency-Key yang sudah expired (IDEMPOTENCY_KEY_TTL); bisa dijalankan berkala lewat cron"
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} expired idempotency keys deleted"))
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 00:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=50)),
+                ('file_type', models.CharField(default='xlsx', max_length=10)),
+                ('params_hash', models.CharField(help_text='Hash dari view_name + parameter, untuk dedup request yang sama', max_length=64)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('progress', models.PositiveIntegerField(default=0, help_text='Jumlah baris yang sudah ditulis')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True)),
+                ('file', models.FileField(blank=True, null=True, upload_to='reports/')),
+                ('error', models.TextField(blank=True, null=True)),
+                ('requested_by', models.CharField(blank=True, max_length=50, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reportexport',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('params_hash',), name='api_reportexport_unique_in_flight'),
+        ),
+    ]
@@ -1,3 +1,64 @@
 from django.db import models
+from django.db.models import Q
 
 # Create your models here.
+
+# Export laporan yang digenerate di background (ReportView.post -> api.tasks.generate_report)
+class ReportExport(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    IN_FLIGHT = [STATUS_QUEUED, STATUS_RUNNING]
+
+    view_name = models.CharField(max_length=50)
+    file_type = models.CharField(max_length=10, default='xlsx')
+    params_hash = models.CharField(max_length=64, help_text="Hash dari view_name + parameter, untuk dedup request yang sama")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.PositiveIntegerField(default=0, help_text="Jumlah baris yang sudah ditulis")
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    file = models.FileField(upload_to='reports/', null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    requested_by = models.CharField(max_length=50, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Hanya satu export yang sedang berjalan untuk parameter yang sama
+            models.UniqueConstraint(
+                fields=['params_hash'],
+                condition=Q(status__in=['queued', 'running']),
+                name='api_reportexport_unique_in_flight',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.view_name}.{self.file_type} #{self.pk} ({self.status})"
+
+
+# Response yang disimpan per Idempotency-Key (lihat api/idempotency.py)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey('office.User', on_delete=models.CASCADE)
+    endpoint = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64, help_text="Hash dari isi request, untuk menolak key yang dipakai ulang dengan request lain")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Kosong selama request pertama masih diproses")
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='api_idempotencykey_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key} ({self.status_code or 'in progress'})"
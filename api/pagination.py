@@ -0,0 +1,54 @@
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination on (created_at, id), opt-in per request.
+
+    Pagination is only applied when the client sends `cursor` or `page_size`,
+    so existing clients that expect the full list keep working. `count=true`
+    adds the total row count (one extra COUNT query) to the response.
+    """
+    page_size = getattr(settings, 'API_PAGE_SIZE', 100)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+    ordering = ('-created_at', '-id')
+    count_query_param = 'count'
+
+    def __init__(self, ordering=None):
+        if ordering:
+            self.ordering = ordering
+        self.count = None
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_ordering(self, request, queryset, view):
+        # ViewSet bisa menentukan urutan sendiri lewat atribut `pagination_ordering`
+        return getattr(view, 'pagination_ordering', None) or self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response_schema
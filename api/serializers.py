@@ -1,18 +1,18 @@
 from rest_framework import serializers
-from office.models import User, Kodepos, Item, Reimburse, ReimburseStatus, VoucherLimit, VoucherProject, VoucherRetailerDiscount
+from office.models import User, Kodepos, Item, Reimburse, ReimburseStatus, ReimburseStatusEvent, VoucherLimit, VoucherProject, VoucherRetailerDiscount
 from wholesales.models import Wholesale, VoucherRedeem, WholesaleTransaction, WholesaleTransactionDetail
 from retailer.models import Voucher, Retailer, RetailerPhoto
+from retailer.voucher_status import voucher_status
+from jobs.queue import enqueue, stage_file
+from office import discounts
+from .models import ReportExport
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-import random, string, threading, logging
+import random, string, logging
 from datetime import datetime, time
 from django.utils import timezone
-from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from django.core.mail import send_mail, EmailMessage
-from django.conf import settings
-import os
+from django.db import transaction
 import pytz
 
 # Konfigurasi logger
@@ -107,7 +107,9 @@ class WholesaleSerializer(serializers.ModelSerializer):
         ref_name = 'APIWholesale'
 
     def get_children_count(self, obj):
-        """Get count of direct children that are active"""
+        """Get count of direct children that are active (annotation dari Wholesale.objects.with_hierarchy())"""
+        if hasattr(obj, 'active_children_count'):
+            return obj.active_children_count
         return obj.get_children(active_only=True).count()
         
     def get_level(self, obj):
@@ -116,12 +118,28 @@ class WholesaleSerializer(serializers.ModelSerializer):
         
     def get_is_root(self, obj):
         """Check if is root"""
+        if hasattr(obj, 'hierarchy_is_root'):
+            return obj.hierarchy_is_root
         return obj.is_root()
         
     def get_is_leaf(self, obj):
         """Check if is leaf (has no active children)"""
+        if hasattr(obj, 'hierarchy_is_leaf'):
+            return obj.hierarchy_is_leaf
+        if hasattr(obj, 'active_children_count'):
+            return obj.active_children_count == 0
         return obj.is_leaf(active_only=True)
 
+    def validate_parent(self, value):
+        """Parent tidak boleh wholesale itu sendiri atau salah satu turunannya"""
+        if value is not None and self.instance is not None:
+            try:
+                self.instance.check_parent(value)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
+        return value
+
+
     def validate_phone_number(self, value):
         return '62' + value[1:] if value.startswith('0') else value
 
@@ -174,19 +192,25 @@ class VoucherRedeemSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         voucher = validated_data['voucher']
         wholesaler = validated_data['wholesaler']
-        voucher.redeemed = True
-        voucher.save()
-        return VoucherRedeem.objects.create(
-            voucher=voucher,
-            wholesaler=wholesaler,
-            redeemed_at=timezone.now()
-        )
+        with transaction.atomic():
+            voucher_redeem = VoucherRedeem.objects.create(
+                voucher=voucher,
+                wholesaler=wholesaler,
+                redeemed_at=timezone.now()
+            )
+            voucher.redeemed = True
+            voucher.set_lifecycle_state(Voucher.STATE_REDEEMED, voucher_redeem.redeemed_at)
+            voucher.save()
+        return voucher_redeem
 
 # Retailer Photo Serializer
 class RetailerPhotoSerializer(serializers.ModelSerializer):
+    thumbnail_url = serializers.ReadOnlyField()
+    medium_url = serializers.ReadOnlyField()
+
     class Meta:
         model = RetailerPhoto
-        fields = ['retailer_id', 'id', 'image', 'is_verified', 'is_approved', 'remarks']
+        fields = ['retailer_id', 'id', 'image', 'thumbnail_url', 'medium_url', 'is_verified', 'is_approved', 'remarks']
 
 # Retailer Serializer
 class RetailerSerializer(serializers.ModelSerializer):
@@ -251,6 +275,39 @@ class RetailerPhotoRejectionSerializer(serializers.Serializer):
         photo.save()
         return photo
 
+# Retailer Bulk Verification Serializer
+class RetailerBulkVerificationSerializer(serializers.Serializer):
+    MAX_BATCH_SIZE = 1000
+
+    retailer_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
+    ws_id = serializers.IntegerField(required=False)
+    project_id = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(required=False, default=MAX_BATCH_SIZE, min_value=1, max_value=MAX_BATCH_SIZE)
+
+    def validate(self, data):
+        if not data.get('retailer_ids') and not data.get('ws_id') and not data.get('project_id'):
+            raise serializers.ValidationError("Provide retailer_ids or a filter (ws_id, project_id).")
+        return data
+
+    def get_retailer_ids(self):
+        """Resolve retailer ids from the explicit list or from the pending verification queue"""
+        data = self.validated_data
+        if data.get('retailer_ids'):
+            return list(dict.fromkeys(data['retailer_ids']))
+
+        retailers = Retailer.objects.filter(retailerphoto__is_verified=False)
+        if data.get('ws_id'):
+            retailers = retailers.filter(wholesale_id=data['ws_id'])
+        if data.get('project_id'):
+            retailers = retailers.filter(voucher__project_id=data['project_id'])
+        retailer_ids = retailers.order_by('created_at', 'id').values_list('id', flat=True).distinct()
+        return list(retailer_ids[:data['limit']])
+
 # Retailer Registration Serializer
 class RetailerRegistrationSerializer(serializers.Serializer):
     ws_name = serializers.CharField(required=True)
@@ -296,26 +353,6 @@ class RetailerRegistrationSerializer(serializers.Serializer):
         data['wholesale'] = wholesale
         return data
 
-    def compress_image(self, image):
-        img = Image.open(image)
-        img_format = img.format
-        img_io = BytesIO()
-        img.save(img_io, format=img_format, quality=85)
-        img_size = img_io.tell()
-
-        while img_size > 500 * 1024:  # 500 KB
-            img_io = BytesIO()
-            img.save(img_io, format=img_format, quality=85)
-            img_size = img_io.tell()
-            if img_size <= 500 * 1024:
-                break
-            img = img.resize((int(img.width * 0.9), int(img.height * 0.9)), Image.LANCZOS)
-
-        img_io.seek(0)
-        return InMemoryUploadedFile(
-            img_io, None, image.name, 'image/jpeg', img_io.tell(), None
-        )
-
     def create(self, validated_data):
         logger.info("Starting retailer registration process...")
 
@@ -326,104 +363,57 @@ class RetailerRegistrationSerializer(serializers.Serializer):
         project_id = validated_data.get('project_id')
         voucher_project = VoucherProject.objects.filter(id=project_id).first()
         expired_at = voucher_project.periode_end if voucher_project and voucher_project.periode_end else None
-        
-        retailer = Retailer.objects.create(
-            name=validated_data["name"],
-            phone_number=validated_data["phone_number"],
-            address=validated_data.get("address"),
-            wholesale=wholesale,
-            kecamatan=validated_data["kecamatan"],
-            kelurahan=validated_data.get("kelurahan"),
-            kota=validated_data.get("kota"),
-            provinsi=validated_data.get("provinsi")
-        )
-
-        logger.info(f"Retailer {retailer.name} created successfully.")
 
-        for index, photo in enumerate(photos):
-            compressed_photo = self.compress_image(photo)
-            remarks = photo_remarks[index] if index < len(photo_remarks) else ''
-            RetailerPhoto.objects.create(retailer=retailer, image=photo, remarks=remarks)
+        with transaction.atomic():
+            retailer = Retailer.objects.create(
+                name=validated_data["name"],
+                phone_number=validated_data["phone_number"],
+                address=validated_data.get("address"),
+                wholesale=wholesale,
+                kecamatan=validated_data["kecamatan"],
+                kelurahan=validated_data.get("kelurahan"),
+                kota=validated_data.get("kota"),
+                provinsi=validated_data.get("provinsi")
+            )
+
+            logger.info(f"Retailer {retailer.name} created successfully.")
+
+            # Foto mentah disimpan di tabel staging (bukan S3); kompresi dan upload ke S3
+            # dikerjakan oleh worker (retailer.tasks.store_retailer_photo)
+            for index, photo in enumerate(photos):
+                remarks = photo_remarks[index] if index < len(photo_remarks) else ''
+                retailer_photo = RetailerPhoto.objects.create(retailer=retailer, image='', remarks=remarks)
+                enqueue(
+                    'retailer.tasks.store_retailer_photo',
+                    {'photo_id': retailer_photo.id, 'name': photo.name, 'staged_file_id': stage_file(photo.name, photo.read())},
+                )
 
-        logger.info(f"Uploaded {len(photos)} photos for retailer {retailer.name}")
+            logger.info(f"Queued {len(photos)} photos for retailer {retailer.name}")
 
-        voucher_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-        Voucher.objects.create(code=voucher_code, retailer=retailer, expired_at=expired_at, project_id=project_id)
+            voucher_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+            Voucher.objects.create(code=voucher_code, retailer=retailer, expired_at=expired_at, project_id=project_id)
 
-        logger.info(f"Voucher {voucher_code} generated for retailer {retailer.name}")
+            logger.info(f"Voucher {voucher_code} generated for retailer {retailer.name}")
 
-        # Send email asynchronously using threading
-        self.send_email_async(retailer, wholesale)
+            enqueue('retailer.tasks.send_registration_email', {'retailer_id': retailer.id})
 
         return {
             "voucher_code": voucher_code,
             "retailer_id": retailer.id
         }
 
-    def send_email_async(self, retailer, wholesale):
-        """Mengirim email secara asynchronous menggunakan threading"""
+# Report Export Serializer
+class ReportExportSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
 
-        def email_task():
-            subject = 'Verifikasi Retailer'
-            
-            # ✅ Fix: Use request host instead of sites framework
-            request = self.context.get('request')
-            frontend_url = os.getenv('FRONTEND_URL','')
-
-            verification_url = f"{frontend_url}/verification"
-
-            html_content = f"""
-                <html>
-                <body>
-                    <p>Dear Admin,</p>
-                    <p>Berkaitan dengan program Super Perdana, Retailer telah melakukan pendaftaran dengan detail berikut:</p>
-                    <table>
-                        <tr><td><strong>Nama Retailer</strong></td><td>: {retailer.name}</td></tr>
-                        <tr><td><strong>No WhatsApp</strong></td><td>: {retailer.phone_number}</td></tr>
-                        <tr><td><strong>Nama Agen</strong></td><td>: {wholesale.name}</td></tr>
-                        <tr><td><strong>Tanggal Pengisian</strong></td><td>: {timezone.now().strftime('%Y-%m-%d')}</td></tr>
-                        <tr><td><strong>Status</strong></td><td>: Menunggu Verifikasi</td></tr>
-                    </table>
-                    <p>Mohon segera melakukan verifikasi data mereka dengan klik tombol di bawah ini:</p>
-                    <p><a href="{verification_url}">Verifikasi Sekarang</a></p>
-                </body>
-                </html>
-            """
-
-            email_from = settings.DEFAULT_FROM_EMAIL
-            to_emails = os.getenv('RETAILER_REGISTRATION_TO_EMAILS', 'banyu.senjana@limamail.net').split(',')
-            cc_emails = [email.strip() for email in os.getenv('RETAILER_REGISTRATION_CC_EMAILS', 'dimas.rosadi@limamail.net').split(',') if email.strip()]
-
-            logger.info(f"Email from: {email_from}")
-            logger.info(f"To emails: {to_emails}")
-            logger.info(f"CC emails: {cc_emails}")
+    class Meta:
+        model = ReportExport
+        fields = ['id', 'view_name', 'file_type', 'status', 'progress', 'total_rows', 'download_url', 'error', 'requested_by', 'created_at', 'finished_at']
 
-            try:
-                email = EmailMessage(
-                    subject=subject,
-                    body=html_content,
-                    from_email=email_from,
-                    to=to_emails,
-                    cc=cc_emails,
-                )
-                email.content_subtype = 'html'  # Agar email dikirim dalam format HTML
-                email.send(fail_silently=False)
-                logger.info(f"Email sent successfully to {to_emails} with CC to {cc_emails}")
-                logger.info("Email sent successfully!")
-                logger.info(f"Email sent to {to_emails} with CC to {cc_emails}")
-            except Exception as e:
-                logger.exception("Error sending email")
-                logger.exception("Email sending exception details:")
-
-            logger.info("=== EMAIL SENDING END ===")
-
-        # Jalankan fungsi `email_task` dalam thread terpisah
-        try:
-            email_thread = threading.Thread(target=email_task)
-            email_thread.start()
-            logger.info("Email thread started successfully")
-        except Exception as e:
-            logger.error(f"Error starting email thread: {str(e)}")    
+    def get_download_url(self, obj):
+        if obj.status == ReportExport.STATUS_DONE and obj.file:
+            return obj.file.url
+        return None
 
 # Voucher Serializer
 class VoucherSerializer(serializers.ModelSerializer):
@@ -438,7 +428,7 @@ class VoucherSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Voucher
-        fields = ['id', 'voucher_code', 'wholesaler_name', 'total_price', 'total_after_discount', 'retailer_name', 'redeemed', 'redeemed_at', 'reimburse_at', 'reimburse_status']
+        fields = ['id', 'voucher_code', 'wholesaler_name', 'total_price', 'total_after_discount', 'retailer_name', 'redeemed', 'redeemed_at', 'reimburse_at', 'reimburse_status', 'lifecycle_state', 'lifecycle_state_at']
         read_only_fields = ['id', 'created_at']
 
     def get_transaction_field(self, obj, field):
@@ -491,21 +481,22 @@ class ReimburseSerializer(serializers.ModelSerializer):
     discount_amount = serializers.SerializerMethodField()
     agen_fee = serializers.SerializerMethodField()
 
-    def get_discount_amount(self, obj):
+    def get_discount(self, obj):
         # Get discount from VoucherRetailerDiscount (office_voucherretaildiscount)
-        if obj.voucher and obj.voucher.project_id:
-            discount = VoucherRetailerDiscount.objects.filter(voucher_project_id=obj.voucher.project_id).first()
-            if discount:
-                return float(discount.discount_amount)
-        return 0
-    
+        if not (obj.voucher and obj.voucher.project_id):
+            return None
+        # Tabel diskon diambil sekali per serializer (many=True berbagi context), lalu lookup di memori
+        if 'discounts' not in self.context:
+            self.context['discounts'] = discounts.table()
+        return discounts.get(obj.voucher.project_id, self.context['discounts'])
+
+    def get_discount_amount(self, obj):
+        discount = self.get_discount(obj)
+        return float(discount.discount_amount) if discount else 0
+
     def get_agen_fee(self, obj):
-        # Get agen fee from VoucherRetailerDiscount (office_voucherretaildiscount)
-        if obj.voucher and obj.voucher.project_id:
-            discount = VoucherRetailerDiscount.objects.filter(voucher_project_id=obj.voucher.project_id).first()
-            if discount:
-                return float(discount.agen_fee)
-        return 0
+        discount = self.get_discount(obj)
+        return float(discount.agen_fee) if discount else 0
 
     class Meta:
         model = Reimburse
@@ -525,24 +516,74 @@ class ReimburseSerializer(serializers.ModelSerializer):
         if not request:
             raise serializers.ValidationError("Request context is required.")
         
-        status = ReimburseStatus.objects.create(
-            status='waiting',
-            status_at=timezone.now(),
-            status_by=request.user.username
-        )
-
         # Remove reimbursed_by from validated_data to avoid duplication
         validated_data.pop('reimbursed_by', None)
 
-        return Reimburse.objects.create(
-            voucher=voucher,
-            wholesaler=wholesaler,
-            retailer=retailer,
-            status=status,  # Set status
-            reimbursed_by=request.user.username,
-            **validated_data 
-        )
-    
+        with transaction.atomic():
+            status = ReimburseStatus.objects.create(
+                status='waiting',
+                status_at=timezone.now(),
+                status_by=request.user.username
+            )
+
+            reimburse = Reimburse.objects.create(
+                voucher=voucher,
+                wholesaler=wholesaler,
+                retailer=retailer,
+                status=status,  # Set status
+                current_status=status.status,
+                current_status_at=status.status_at,
+                reimbursed_by=request.user.username,
+                **validated_data 
+            )
+            ReimburseStatusEvent.objects.create(reimburse=reimburse, status=status.status, at=status.status_at, by=status.status_by)
+
+            if voucher.set_lifecycle_state(Voucher.STATE_WAITING, status.status_at):
+                voucher.save(update_fields=['lifecycle_state', 'lifecycle_state_at'])
+        return reimburse
+
+# Reimburse Bulk Status Serializer
+class ReimburseBulkStatusSerializer(serializers.Serializer):
+    MAX_BATCH_SIZE = 10000
+
+    status = serializers.ChoiceField(choices=['completed', 'paid'])
+    reimburse_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE
+    )
+    project_id = serializers.IntegerField(required=False)
+    wholesaler_id = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        filters = ('reimburse_ids', 'project_id', 'wholesaler_id', 'date_from', 'date_to')
+        if not any(data.get(name) for name in filters):
+            raise serializers.ValidationError(
+                "Provide reimburse_ids or a filter (project_id, wholesaler_id, date_from, date_to)."
+            )
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return data
+
+    def get_queryset(self):
+        """Reimburses selected by the id list and/or the filters (tanggal berdasarkan reimbursed_at)"""
+        data = self.validated_data
+        reimburses = Reimburse.objects.all()
+        if data.get('reimburse_ids'):
+            reimburses = reimburses.filter(pk__in=data['reimburse_ids'])
+        if data.get('project_id'):
+            reimburses = reimburses.filter(voucher__project_id=data['project_id'])
+        if data.get('wholesaler_id'):
+            reimburses = reimburses.filter(wholesaler_id=data['wholesaler_id'])
+        if data.get('date_from'):
+            reimburses = reimburses.filter(reimbursed_at__date__gte=data['date_from'])
+        if data.get('date_to'):
+            reimburses = reimburses.filter(reimbursed_at__date__lte=data['date_to'])
+        return reimburses
+
 # Retailer Report Serializer
 class RetailerReportSerializer(serializers.ModelSerializer):
     agen_name = serializers.CharField(source='wholesale.name', read_only=True)
@@ -552,50 +593,25 @@ class RetailerReportSerializer(serializers.ModelSerializer):
     voucher_status = serializers.SerializerMethodField()
     voucher_status_at = serializers.SerializerMethodField()
 
+    # Status voucher dibaca dari voucher pertama yang di-prefetch oleh `with_voucher_status`
     def get_voucher_code(self, obj):
-        voucher = Voucher.objects.filter(retailer=obj).first()
+        voucher, _, _ = voucher_status(obj)
         if voucher and voucher.is_approved:
             return voucher.code
         return None
 
     def get_retailer_photos(self, obj):
-        photos = RetailerPhoto.objects.filter(retailer=obj)
-        return [{'image': photo.image.url if photo.image else None, 'remarks': photo.remarks} for photo in photos]
+        photos = obj.retailerphoto_set.all()
+        return [
+            {'image': photo.image_url, 'thumbnail_url': photo.thumbnail_url, 'medium_url': photo.medium_url, 'remarks': photo.remarks}
+            for photo in photos
+        ]
 
     def get_voucher_status(self, obj):
-        voucher = Voucher.objects.filter(retailer=obj).first()
-        if not voucher:
-            return "No Voucher"
-        if voucher.is_rejected:
-            return "REJECTED"
-        if voucher.redeemed:
-            reimburse = Reimburse.objects.filter(voucher=voucher).first()
-            if reimburse and reimburse.status:
-                if reimburse.status.status == 'waiting':
-                    return "WAITING REIMBURSE"
-                elif reimburse.status.status == 'completed':
-                    return "REIMBURSE COMPLETED"
-                elif reimburse.status.status == 'paid':
-                    return "REIMBURSE PAID"
-            return "REDEEMED"
-        return "RECEIVED" if voucher.is_approved else "PENDING"
+        return voucher_status(obj)[1]
 
     def get_voucher_status_at(self, obj):
-        voucher = Voucher.objects.filter(retailer=obj).first()
-        if not voucher:
-            return None
-        if voucher.is_rejected:
-            return voucher.rejected_at
-        if voucher.redeemed:
-            redeem = VoucherRedeem.objects.filter(voucher=voucher).first()
-            if redeem:
-                reimburse = Reimburse.objects.filter(voucher=voucher).first()
-                if reimburse and reimburse.status:
-                    return reimburse.status.status_at
-                return redeem.redeemed_at
-        if voucher.is_approved:
-            return voucher.approved_at
-        return voucher.created_at
+        return voucher_status(obj)[2]
 
     class Meta:
         model = Retailer
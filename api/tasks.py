@@ -0,0 +1,67 @@
+import logging
+import tempfile
+from django.core.files import File
+from django.db.models import BigIntegerField, Exists, OuterRef
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+from django.utils import timezone
+from jobs.models import Job
+from . import exports
+from .models import ReportExport
+
+logger = logging.getLogger(__name__)
+
+GENERATE_REPORT_TASK = 'api.tasks.generate_report'
+
+
+def generate_report(export_id):
+    """Job task: generate a ReportExport file and upload it to the default storage (S3)"""
+    export = ReportExport.objects.filter(pk=export_id).first()
+    if export is None:
+        logger.warning(f"Report export {export_id} no longer exists, skipping.")
+        return
+
+    def progress(row_count):
+        ReportExport.objects.filter(pk=export.pk).update(progress=row_count)
+
+    try:
+        report = exports.REPORTS[export.view_name]
+        ReportExport.objects.filter(pk=export.pk).update(
+            status=ReportExport.STATUS_RUNNING,
+            total_rows=report.queryset().count(),
+        )
+        with tempfile.TemporaryFile() as tmp:
+            row_count = exports.write_report(report, export.file_type, tmp, progress)
+            tmp.seek(0)
+            export.file.save(exports.export_filename(export.view_name, export.file_type), File(tmp), save=False)
+    except Exception as e:
+        # Tidak di-retry: client bisa request ulang, dan export baru tidak bentrok dengan constraint in-flight
+        logger.exception(f"Report export {export_id} failed")
+        ReportExport.objects.filter(pk=export.pk).update(
+            status=ReportExport.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+        )
+        return
+
+    ReportExport.objects.filter(pk=export.pk).update(
+        status=ReportExport.STATUS_DONE,
+        file=export.file.name,
+        progress=row_count,
+        finished_at=timezone.now(),
+    )
+    logger.info(f"Report export {export_id} finished: {row_count} rows -> {export.file.name}")
+
+
+def fail_orphaned_exports(queryset):
+    """
+    Mark queued/running exports whose generate_report job is gone (dead-lettered
+    or deleted) as failed, so they no longer block new requests through the
+    in-flight unique constraint. Returns the number of exports updated.
+    """
+    job = Job.objects.filter(task=GENERATE_REPORT_TASK).annotate(
+        export_id=Cast(KeyTextTransform('export_id', 'payload'), BigIntegerField())
+    ).filter(export_id=OuterRef('pk'))
+    return queryset.filter(status__in=ReportExport.IN_FLIGHT).exclude(Exists(job)).update(
+        status=ReportExport.STATUS_FAILED,
+        error="Export job is no longer in the queue",
+        finished_at=timezone.now(),
+    )
@@ -1,3 +1,895 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+from office import discounts, regions
+from office.models import User, Item, Kodepos, Reimburse, ReimburseStatus, ReimburseStatusEvent, VoucherLimit, VoucherProject, VoucherRetailerDiscount
+from retailer.models import Retailer, RetailerPhoto, Voucher
+from retailer.tasks import store_retailer_photo
+from wholesales.models import Wholesale, VoucherRedeem, WholesaleTransaction, WholesaleTransactionDetail
+from jobs.models import Job, StagedFile
+from . import exports
+from .models import IdempotencyKey, ReportExport
+from .tasks import generate_report
 
 # Create your tests here.
+
+class ListReimburseQueryCountTest(TestCase):
+    """list_reimburse must load every relation in batches, independent of the number of rows"""
+
+    # reimburse + relasi, transaksi, detail + item (diskon project dari office.discounts cache)
+    EXPECTED_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        cls.project = VoucherProject.objects.create(name='Project')
+        VoucherRetailerDiscount.objects.create(
+            discount_amount=10000, discount_percentage=10, agen_fee=2000, voucher_project=cls.project
+        )
+        cls.items = [Item.objects.create(sku=f'SKU{i}', name=f'Item {i}', price=1000) for i in range(2)]
+
+    def create_reimburses(self, count):
+        for _ in range(count):
+            index = Reimburse.objects.count()
+            retailer = Retailer.objects.create(
+                name=f'Retailer {index}', phone_number=f'6281{index}', address='Jl. Test', wholesale=self.wholesale
+            )
+            voucher = Voucher.objects.create(code=f'CODE{index}', retailer=retailer, project=self.project, redeemed=True)
+            redeem = VoucherRedeem.objects.create(voucher=voucher, wholesaler=self.wholesale)
+            transaction = WholesaleTransaction.objects.create(
+                total_price=2000, total_price_after_discount=1000, voucher_redeem=redeem, image='receipt_photos/test.jpg'
+            )
+            for item in self.items:
+                WholesaleTransactionDetail.objects.create(transaction=transaction, item=item, qty=1, sub_total=1000)
+            status = ReimburseStatus.objects.create(status='waiting', status_at=timezone.now())
+            Reimburse.objects.create(voucher=voucher, retailer=retailer, wholesaler=self.wholesale, status=status)
+
+    def setUp(self):
+        # Isi cache diskon di luar blok assertNumQueries (on_commit tidak jalan di TestCase, jadi invalidate manual)
+        discounts.invalidate()
+        discounts.table()
+
+    def get_list(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.get(reverse('list_reimburse'))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.create_reimburses(3)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.get_list()
+        self.assertEqual(len(response.data), 3)
+
+        self.create_reimburses(7)
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.get_list()
+        self.assertEqual(len(response.data), 10)
+
+    def test_nested_payload(self):
+        self.create_reimburses(1)
+        row = self.get_list().data[0]
+        self.assertEqual(row['discount_amount'], 10000.0)
+        self.assertEqual(row['agen_fee'], 2000.0)
+        self.assertEqual(row['retailer_address'], 'Jl. Test')
+        self.assertEqual(len(row['transactions']), 1)
+        self.assertEqual(
+            [detail['item_name'] for detail in row['transactions'][0]['details']], ['Item 0', 'Item 1']
+        )
+
+
+class ReportExportTest(TestCase):
+    """Background report exports must never stay in flight once their job is gone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_generate_report_marks_export_failed_when_count_fails(self):
+        export = ReportExport.objects.create(view_name='list_vouchers', params_hash='hash')
+        with mock.patch.object(exports.Report, 'queryset', side_effect=RuntimeError('db down')), \
+                self.assertLogs('api.tasks', 'ERROR'):
+            generate_report(export.pk)
+        export.refresh_from_db()
+        self.assertEqual(export.status, ReportExport.STATUS_FAILED)
+        self.assertEqual(export.error, 'db down')
+
+    def test_orphaned_export_does_not_block_new_request(self):
+        url = reverse('report-view', kwargs={'view_name': 'list_vouchers'})
+        first = self.client.post(url, {'file_type': 'csv'}, format='json')
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(self.client.post(url, {'file_type': 'csv'}, format='json').data['id'], first.data['id'])
+
+        # Job hilang (dead-letter) sebelum export selesai
+        Job.objects.all().delete()
+        second = self.client.post(url, {'file_type': 'csv'}, format='json')
+        self.assertEqual(second.status_code, 202)
+        self.assertNotEqual(second.data['id'], first.data['id'])
+        self.assertEqual(ReportExport.objects.get(pk=first.data['id']).status, ReportExport.STATUS_FAILED)
+
+    def test_get_without_stream_queues_export(self):
+        response = self.client.get(reverse('report-view', kwargs={'view_name': 'list_vouchers'}), {'file_type': 'csv'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Deprecation'], 'true')
+        self.assertNotIn('file_path', response.data)
+        self.assertTrue(Job.objects.filter(task='api.tasks.generate_report', payload__export_id=response.data['id']).exists())
+
+
+class ReimburseTransitionTest(TestCase):
+    """Single and bulk status updates follow the same TRANSITIONS state machine"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        cls.retailer = Retailer.objects.create(name='Retailer', phone_number='62812', address='-', wholesale=cls.wholesale)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_reimburse(self, current_status):
+        index = Reimburse.objects.count()
+        voucher = Voucher.objects.create(code=f'TRX{index}', retailer=self.retailer, redeemed=True)
+        status = ReimburseStatus.objects.create(status=current_status, status_at=timezone.now())
+        return Reimburse.objects.create(
+            voucher=voucher, retailer=self.retailer, wholesaler=self.wholesale, status=status,
+            current_status=current_status, current_status_at=status.status_at
+        )
+
+    def update(self, reimburse_id, new_status):
+        return self.client.patch(
+            reverse('update_reimburse_status', kwargs={'pk': reimburse_id, 'new_status': new_status})
+        )
+
+    def test_single_transition(self):
+        reimburse = self.create_reimburse('waiting')
+        response = self.update(reimburse.pk, 'completed')
+        self.assertEqual(response.status_code, 200)
+        reimburse.refresh_from_db()
+        self.assertEqual(reimburse.current_status, 'completed')
+        self.assertEqual(reimburse.status.status, 'completed')
+        self.assertEqual(reimburse.status.status_by, 'office')
+        self.assertEqual(
+            list(ReimburseStatusEvent.objects.filter(reimburse=reimburse).values_list('status', flat=True)), ['completed']
+        )
+        self.assertEqual(Voucher.objects.get(pk=reimburse.voucher_id).lifecycle_state, 'completed')
+
+    def test_single_rejects_invalid_transition(self):
+        reimburse = self.create_reimburse('paid')
+        response = self.update(reimburse.pk, 'completed')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "Cannot change reimburse status from paid to completed")
+        self.assertEqual(Reimburse.objects.get(pk=reimburse.pk).current_status, 'paid')
+        self.assertFalse(ReimburseStatusEvent.objects.filter(reimburse=reimburse).exists())
+
+    def test_single_repeated_transition_is_a_no_op(self):
+        reimburse = self.create_reimburse('completed')
+        statuses = ReimburseStatus.objects.count()
+        response = self.update(reimburse.pk, 'completed')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], "Reimburse status is already completed")
+        self.assertEqual(ReimburseStatus.objects.count(), statuses)
+        self.assertFalse(ReimburseStatusEvent.objects.filter(reimburse=reimburse).exists())
+
+    def test_single_unknown_status_and_reimburse(self):
+        self.assertEqual(self.update(self.create_reimburse('waiting').pk, 'waiting').status_code, 400)
+        self.assertEqual(self.update(999999, 'paid').status_code, 404)
+
+    def test_bulk_counts_per_outcome(self):
+        reimburses = [self.create_reimburse(status) for status in ('waiting', 'completed', 'paid', 'waiting')]
+        response = self.client.post(
+            reverse('bulk_update_reimburse_status'),
+            {'status': 'completed', 'reimburse_ids': [reimburse.pk for reimburse in reimburses] + [999999]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['counts'], {'updated': 2, 'unchanged': 1, 'invalid_transition': 1, 'not_found': 1}
+        )
+        self.assertEqual(
+            list(Reimburse.objects.filter(pk__in=[r.pk for r in reimburses]).order_by('pk').values_list('current_status', flat=True)),
+            ['completed', 'completed', 'paid', 'completed']
+        )
+        self.assertEqual(ReimburseStatusEvent.objects.filter(status='completed').count(), 2)
+
+
+class SubmitReimburseTest(TestCase):
+    """Bulk submission answers every code, in request order, with the per-code messages"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        cls.retailer = Retailer.objects.create(name='Retailer', phone_number='62812', address='-', wholesale=cls.wholesale)
+        cls.orphan = Retailer.objects.create(name='Tanpa agen', phone_number='62813', address='-')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, voucher_codes):
+        return self.client.post(reverse('submit_reimburse'), {'voucher_codes': voucher_codes}, format='json')
+
+    def test_results_in_request_order(self):
+        Voucher.objects.create(code='OK1', retailer=self.retailer, redeemed=True)
+        Voucher.objects.create(code='OK2', retailer=self.retailer, redeemed=True)
+        Voucher.objects.create(code='NEW', retailer=self.retailer, redeemed=False)
+        Voucher.objects.create(code='ORPHAN', retailer=self.orphan, redeemed=True)
+        done = Voucher.objects.create(code='DONE', retailer=self.retailer, redeemed=True)
+        Reimburse.objects.create(voucher=done, retailer=self.retailer, wholesaler=self.wholesale)
+
+        response = self.submit(['OK2', 'MISSING', 'NEW', 'DONE', 'ORPHAN', 'OK1', 'OK2'])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, [
+            {'voucher_code': 'OK2', 'status': 'submitted'},
+            {'voucher_code': 'MISSING', 'error': 'Voucher not found'},
+            {'voucher_code': 'NEW', 'error': 'This voucher has not been redeemed'},
+            {'voucher_code': 'DONE', 'error': 'This voucher has already been submitted'},
+            {'voucher_code': 'ORPHAN', 'error': 'Retailer of this voucher has no wholesaler'},
+            {'voucher_code': 'OK1', 'status': 'submitted'},
+            {'voucher_code': 'OK2', 'error': 'This voucher has already been submitted'},
+        ])
+        reimburses = Reimburse.objects.filter(voucher__code__in=['OK1', 'OK2'])
+        self.assertEqual(reimburses.count(), 2)
+        for reimburse in reimburses:
+            self.assertEqual(reimburse.current_status, 'waiting')
+            self.assertEqual(reimburse.status.status, 'waiting')
+            self.assertEqual(reimburse.wholesaler, self.wholesale)
+            self.assertEqual(reimburse.voucher.lifecycle_state, Voucher.STATE_WAITING)
+        self.assertEqual(ReimburseStatusEvent.objects.filter(status='waiting').count(), 2)
+
+    def test_requires_list(self):
+        self.assertEqual(self.submit('OK1').status_code, 400)
+        self.assertEqual(self.submit([]).status_code, 400)
+
+
+class ReimburseAgingTest(TestCase):
+    """Aging groups waiting / completed reimburses into day buckets of current_status_at"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        cls.retailer = Retailer.objects.create(name='Retailer', phone_number='62812', address='-', wholesale=cls.wholesale)
+        now = timezone.now()
+        for index, (current_status, days) in enumerate([
+            ('waiting', 1), ('waiting', 10), ('waiting', 10), ('waiting', 90),
+            ('completed', 20), ('paid', 100),
+        ]):
+            voucher = Voucher.objects.create(code=f'AGE{index}', retailer=cls.retailer, redeemed=True)
+            Reimburse.objects.create(
+                voucher=voucher, retailer=cls.retailer, wholesaler=cls.wholesale,
+                current_status=current_status, current_status_at=now - timedelta(days=days)
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_default_buckets(self):
+        response = self.client.get(reverse('reimburse_aging'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['buckets'], ['0-7d', '7-14d', '14-30d', '30-60d', '60d+'])
+        waiting = response.data['statuses']['waiting']
+        self.assertEqual(waiting['total'], 4)
+        self.assertEqual(waiting['buckets'], {'0-7d': 1, '7-14d': 2, '14-30d': 0, '30-60d': 0, '60d+': 1})
+        self.assertEqual(waiting['oldest_at'], Reimburse.objects.get(voucher__code='AGE3').current_status_at)
+        completed = response.data['statuses']['completed']
+        self.assertEqual(completed['total'], 1)
+        self.assertEqual(completed['buckets']['14-30d'], 1)
+        # paid tidak ikut aging
+        self.assertNotIn('paid', response.data['statuses'])
+
+    def test_custom_buckets(self):
+        response = self.client.get(reverse('reimburse_aging'), {'buckets': '30,5'})
+        self.assertEqual(response.data['buckets'], ['0-5d', '5-30d', '30d+'])
+        self.assertEqual(response.data['statuses']['waiting']['buckets'], {'0-5d': 1, '5-30d': 2, '30d+': 1})
+
+    def test_invalid_buckets(self):
+        self.assertEqual(self.client.get(reverse('reimburse_aging'), {'buckets': 'a,b'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('reimburse_aging'), {'buckets': '0,7'}).status_code, 400)
+
+
+class ReceiptTestCase(TestCase):
+    """Redeemed voucher plus priced items; receipt photos go to a temporary directory instead of S3"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        cls.retailer = Retailer.objects.create(name='Retailer', phone_number='62812', address='-', wholesale=cls.wholesale)
+        cls.voucher = Voucher.objects.create(code='RCPT', retailer=cls.retailer, redeemed=True)
+        VoucherRedeem.objects.create(voucher=cls.voucher, wholesaler=cls.wholesale)
+        cls.items = [Item.objects.create(sku=f'SKU{i}', name=f'Item {i}', price=1500) for i in range(2)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = FileSystemStorage(location=media.name)
+        field = WholesaleTransaction._meta.get_field('image')
+        self.addCleanup(setattr, field, 'storage', field.storage)
+        field.storage = self.storage
+
+    def lines(self, qty=2):
+        return [{'item_id': item.pk, 'qty': qty, 'sub_total': str(item.price * qty)} for item in self.items]
+
+    def post(self, lines=None, total_price=6000, total_price_after_discount=5000, voucher_code='RCPT', **headers):
+        return self.client.post(reverse('submit_trx_voucher'), {
+            'voucher_code': voucher_code,
+            'ws_id': self.wholesale.pk,
+            'total_price': str(total_price),
+            'total_price_after_discount': str(total_price_after_discount),
+            'image': SimpleUploadedFile('struk.jpg', b'\xff\xd8receipt', content_type='image/jpeg'),
+            'items': json.dumps(self.lines() if lines is None else lines),
+        }, format='multipart', **headers)
+
+    def stored_photos(self):
+        return self.storage.listdir('receipt_photos')[1] if self.storage.exists('receipt_photos') else []
+
+
+class SubmitReceiptTest(ReceiptTestCase):
+    def test_saves_transaction_details_and_photo(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        transaction = WholesaleTransaction.objects.get(voucher_redeem__voucher=self.voucher)
+        self.assertEqual(transaction.total_price, 6000)
+        self.assertEqual(transaction.created_by, 'office')
+        self.assertEqual(transaction.image.name, 'receipt_photos/struk.jpg')
+        self.assertEqual(self.stored_photos(), ['struk.jpg'])
+        self.assertEqual(
+            sorted(WholesaleTransactionDetail.objects.filter(transaction=transaction).values_list('item_id', 'qty', 'sub_total')),
+            [(item.pk, 2, 3000) for item in self.items]
+        )
+
+    def test_validation_errors(self):
+        mismatch = self.lines()
+        mismatch[1]['sub_total'] = '1'
+        cases = [
+            (self.lines()[:1] + [{'item_id': 999999, 'qty': 1, 'sub_total': '1'}], 6000, 404, {'item_ids': [999999]}),
+            (mismatch, 6000, 400, {'items': [{'item_id': self.items[1].pk, 'sub_total': '1.00', 'expected': '3000.00'}]}),
+            (self.lines(), 7000, 400, {'expected': '6000.00'}),
+            ([{'item_id': self.items[0].pk, 'qty': 'NaN', 'sub_total': '1'}], 6000, 400, {'error': 'qty must be a number'}),
+            ([{'item_id': self.items[0].pk, 'qty': 0, 'sub_total': '0'}], 6000, 400, {'error': 'qty must be greater than 0'}),
+            ([{'item_id': 'x', 'qty': 1, 'sub_total': '1'}], 6000, 400, {'error': 'item_id must be an integer'}),
+            ({'item_id': self.items[0].pk}, 6000, 400, {'error': 'items must be a list of {item_id, qty, sub_total}'}),
+        ]
+        for lines, total_price, status_code, expected in cases:
+            with self.subTest(lines=lines):
+                response = self.post(lines, total_price)
+                self.assertEqual(response.status_code, status_code)
+                for key, value in expected.items():
+                    self.assertEqual(response.data[key], value)
+        self.assertFalse(WholesaleTransaction.objects.exists())
+        self.assertEqual(self.stored_photos(), [])
+
+    def test_second_submission_is_rejected_without_upload(self):
+        self.assertEqual(self.post().status_code, 201)
+        with mock.patch.object(self.storage, 'save') as save:
+            response = self.post()
+        save.assert_not_called()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "This voucher has already been submitted")
+        self.assertEqual(WholesaleTransaction.objects.count(), 1)
+        self.assertEqual(self.stored_photos(), ['struk.jpg'])
+
+    def test_voucher_not_redeemed_by_wholesaler_is_rejected_without_upload(self):
+        Voucher.objects.create(code='NOREDEEM', retailer=self.retailer, redeemed=True)
+        with mock.patch.object(self.storage, 'save') as save:
+            response = self.post(voucher_code='NOREDEEM')
+        save.assert_not_called()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "This voucher has not been redeemed by this wholesaler")
+
+    def test_submission_racing_the_upload_is_rejected_under_lock(self):
+        save = self.storage.save
+
+        def save_after_other_request(name, content, **kwargs):
+            # Request lain menyimpan struk untuk voucher yang sama selama upload berjalan
+            WholesaleTransaction.objects.create(
+                total_price=6000, total_price_after_discount=5000, image='receipt_photos/other.jpg',
+                voucher_redeem=VoucherRedeem.objects.get(voucher=self.voucher), created_by='other'
+            )
+            return save(name, content, **kwargs)
+
+        with mock.patch.object(self.storage, 'save', side_effect=save_after_other_request):
+            response = self.post()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "This voucher has already been submitted")
+        self.assertEqual(WholesaleTransaction.objects.get().created_by, 'other')
+        self.assertEqual(self.stored_photos(), [])
+
+    def test_failed_detail_insert_rolls_back_everything(self):
+        with mock.patch.object(WholesaleTransactionDetail.objects, 'bulk_create', side_effect=RuntimeError('db error')):
+            with self.assertRaises(RuntimeError):
+                self.post()
+        self.assertFalse(WholesaleTransaction.objects.exists())
+        self.assertEqual(self.stored_photos(), [])
+
+    def test_failed_upload_saves_nothing(self):
+        with mock.patch.object(self.storage, 'save', side_effect=OSError('S3 unavailable')), \
+                self.assertLogs('wholesales.receipts', 'ERROR'):
+            response = self.post()
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(WholesaleTransaction.objects.exists())
+        # Retry setelah storage pulih berhasil
+        self.assertEqual(self.post().status_code, 201)
+
+
+class IdempotencyTest(ReceiptTestCase):
+    """Retries with the same Idempotency-Key get the stored response instead of running the view again"""
+
+    def test_replays_stored_response(self):
+        first = self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        with self.assertNumQueries(1):
+            retry = self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(retry.data, json.loads(json.dumps(first.data, cls=JSONEncoder)))
+        self.assertEqual(WholesaleTransaction.objects.count(), 1)
+        self.assertEqual(self.stored_photos(), ['struk.jpg'])
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        response = self.post(total_price_after_discount=4000, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.data['error'], "Idempotency-Key was already used with a different request")
+        self.assertEqual(WholesaleTransaction.objects.get().total_price_after_discount, 5000)
+
+    def in_progress(self, started_at):
+        # Baris key seperti saat request pertama (body yang sama) masih berjalan
+        self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        WholesaleTransaction.objects.all().delete()
+        IdempotencyKey.objects.update(status_code=None, response_body=None, created_at=started_at)
+
+    def test_request_in_progress_gets_conflict(self):
+        self.in_progress(timezone.now())
+        response = self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['error'], "A request with this Idempotency-Key is still being processed")
+        self.assertFalse(WholesaleTransaction.objects.exists())
+
+    @override_settings(IDEMPOTENCY_KEY_LEASE=60)
+    def test_abandoned_request_is_taken_over_after_lease(self):
+        self.in_progress(timezone.now() - timedelta(seconds=61))
+
+        response = self.post(HTTP_IDEMPOTENCY_KEY='k1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 201)
+        self.assertEqual(self.post(HTTP_IDEMPOTENCY_KEY='k1')['Idempotent-Replayed'], 'true')
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch.object(self.storage, 'save', side_effect=OSError('S3 unavailable')), \
+                self.assertLogs('wholesales.receipts', 'ERROR'):
+            self.assertEqual(self.post(HTTP_IDEMPOTENCY_KEY='k1').status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_keys_are_scoped_per_user(self):
+        self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.client.force_authenticate(other)
+        response = self.post(HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], "This voucher has already been submitted")
+
+
+class RetailerRegistrationTest(TestCase):
+    """Registration only writes to the database; the photo reaches storage in the store_retailer_photo job"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+
+    def setUp(self):
+        self.client = APIClient()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = FileSystemStorage(location=media.name)
+        for name in ('image', 'thumbnail', 'medium'):
+            field = RetailerPhoto._meta.get_field(name)
+            self.addCleanup(setattr, field, 'storage', field.storage)
+            field.storage = self.storage
+
+    def photo(self):
+        data = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(data, 'JPEG')
+        return SimpleUploadedFile('toko.jpg', data.getvalue(), content_type='image/jpeg')
+
+    def test_photo_is_staged_and_stored_by_the_job(self):
+        with mock.patch.object(self.storage, 'save') as save:
+            response = self.client.post(reverse('retailer_register_upload'), {
+                'ws_name': 'Agen', 'name': 'Toko', 'phone_number': '0812', 'address': 'Jl. Mawar', 'kecamatan': 'Kec',
+                'photos': [self.photo()], 'photo_remarks': ['depan'],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        save.assert_not_called()
+
+        photo = RetailerPhoto.objects.get(retailer_id=response.data['retailer_id'])
+        self.assertFalse(photo.image)
+        self.assertEqual(photo.remarks, 'depan')
+        job = Job.objects.get(task='retailer.tasks.store_retailer_photo')
+        self.assertEqual(job.payload['photo_id'], photo.pk)
+        self.assertEqual(StagedFile.objects.get(pk=job.payload['staged_file_id']).name, 'toko.jpg')
+
+        store_retailer_photo(**job.payload)
+
+        photo.refresh_from_db()
+        self.assertTrue(self.storage.exists(photo.image.name))
+        self.assertTrue(self.storage.exists(photo.thumbnail.name))
+        self.assertFalse(StagedFile.objects.exists())
+
+    def test_deleted_photo_drops_staged_file(self):
+        staged_file = StagedFile.objects.create(name='toko.jpg', data=b'raw')
+        with self.assertLogs('retailer.tasks', 'WARNING'):
+            store_retailer_photo(photo_id=0, name='toko.jpg', staged_file_id=staged_file.pk)
+        self.assertFalse(StagedFile.objects.exists())
+
+
+class VoucherLimitIncrementTest(TestCase):
+    """The increment action reserves through office.quota and answers 400 at the limit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.voucher_limit = VoucherLimit.objects.create(limit=5, current_count=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def increment(self, amount):
+        return self.client.post(reverse('voucherlimit-increment', args=[self.voucher_limit.pk]), {'increment': amount}, format='json')
+
+    def test_increment(self):
+        response = self.increment(2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'message': 'Voucher count incremented by 2', 'current_count': 5, 'limit': 5, 'remaining': 0,
+        })
+
+    def test_increment_past_limit(self):
+        response = self.increment(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {
+            'error': 'Cannot increment by 3. Would exceed limit of 5', 'current_count': 3, 'limit': 5, 'remaining': 2,
+        })
+        self.voucher_limit.refresh_from_db()
+        self.assertEqual(self.voucher_limit.current_count, 3)
+
+    def test_invalid_increment(self):
+        self.assertEqual(self.increment(0).status_code, 400)
+        self.assertEqual(self.client.post(reverse('voucherlimit-increment', args=[0]), {'increment': 1}).status_code, 404)
+
+
+class BulkReviewPhotosTest(TestCase):
+    """Bulk verify/reject answers per retailer and reserves quota once per project, all or nothing"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        cls.roomy = VoucherProject.objects.create(name='Roomy')
+        cls.full = VoucherProject.objects.create(name='Full')
+        cls.unlimited = VoucherProject.objects.create(name='Tanpa limit')
+        cls.roomy_limit = VoucherLimit.objects.create(limit=2, voucher_project=cls.roomy)
+        cls.full_limit = VoucherLimit.objects.create(limit=1, voucher_project=cls.full)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def retailer(self, code, project, photos=True, **voucher):
+        retailer = Retailer.objects.create(name=code, phone_number=f'628{code}', address='-', wholesale=self.wholesale)
+        if photos:
+            RetailerPhoto.objects.create(retailer=retailer, image=f'retailer_photos/{code}.jpg')
+        Voucher.objects.create(code=code, retailer=retailer, project=project, **voucher)
+        return retailer.pk
+
+    def review(self, action, retailer_ids):
+        return self.client.post(reverse(f'retailer-bulk-{action}-photos'), {'retailer_ids': retailer_ids}, format='json')
+
+    def test_bulk_verify(self):
+        roomy = [self.retailer('R1', self.roomy), self.retailer('R2', self.roomy)]
+        full = [self.retailer('F1', self.full), self.retailer('F2', self.full)]
+        unlimited = self.retailer('U1', self.unlimited)
+        no_photos = self.retailer('NP', self.roomy, photos=False)
+        rejected = self.retailer('RJ', self.roomy, is_rejected=True)
+        verified = self.retailer('VF', self.roomy, is_approved=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.review('verify', [0, *roomy, *full, unlimited, no_photos, rejected, verified])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], "2 of 9 retailers verified.")
+        self.assertEqual(response.data['results'], [
+            {'retailer_id': 0, 'error': "Retailer not found."},
+            {'retailer_id': roomy[0], 'status': 'verified'},
+            {'retailer_id': roomy[1], 'status': 'verified'},
+            {'retailer_id': full[0], 'error': "Voucher limit reached"},
+            {'retailer_id': full[1], 'error': "Voucher limit reached"},
+            {'retailer_id': unlimited, 'error': "Voucher limit not found for this project."},
+            {'retailer_id': no_photos, 'error': "No photos found for this retailer."},
+            {'retailer_id': rejected, 'error': "Voucher already rejected."},
+            {'retailer_id': verified, 'error': "Voucher already verified."},
+        ])
+        # Satu reservasi (UPDATE) per project; project Full tidak terpakai sama sekali
+        reservations = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "office_voucherlimit"')]
+        self.assertEqual(len(reservations), 3)
+        self.roomy_limit.refresh_from_db()
+        self.full_limit.refresh_from_db()
+        self.assertEqual(self.roomy_limit.current_count, 2)
+        self.assertEqual(self.full_limit.current_count, 0)
+
+        self.assertEqual(
+            set(Voucher.objects.filter(is_approved=True).values_list('code', flat=True)), {'R1', 'R2', 'VF'}
+        )
+        self.assertEqual(Voucher.objects.get(code='R1').lifecycle_state, Voucher.STATE_RECEIVED)
+        self.assertEqual(
+            set(RetailerPhoto.objects.filter(is_approved=True).values_list('retailer_id', flat=True)), set(roomy)
+        )
+
+    def test_bulk_reject(self):
+        pending = self.retailer('P1', self.roomy)
+        verified = self.retailer('VF', self.roomy, is_approved=True)
+        rejected = self.retailer('RJ', self.roomy, is_rejected=True)
+        no_photos = self.retailer('NP', self.roomy, photos=False)
+
+        response = self.review('reject', [pending, verified, rejected, no_photos])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message'], "2 of 4 retailers rejected.")
+        self.assertEqual(response.data['results'], [
+            {'retailer_id': pending, 'status': 'rejected'},
+            {'retailer_id': verified, 'status': 'rejected'},
+            {'retailer_id': rejected, 'error': "Voucher already rejected."},
+            {'retailer_id': no_photos, 'error': "No photos found for this retailer."},
+        ])
+        self.assertEqual(Voucher.objects.get(code='P1').lifecycle_state, Voucher.STATE_REJECTED)
+        self.assertTrue(RetailerPhoto.objects.get(retailer_id=verified).is_rejected)
+        self.roomy_limit.refresh_from_db()
+        self.assertEqual(self.roomy_limit.current_count, 0)
+
+    def test_requires_retailer_ids_or_filter(self):
+        response = self.client.post(reverse('retailer-bulk-verify-photos'), {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTest(TestCase):
+    """Pagination is opt-in (cursor / page_size) and walks every row exactly once, in a stable order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        cls.items = [Item.objects.create(sku=f'SKU{i}', name=f'Item {i}', price=1000) for i in range(5)]
+        # created_at kembar: urutan ditentukan oleh id
+        Item.objects.filter(pk__in=[item.pk for item in cls.items[1:4]]).update(created_at=cls.items[0].created_at)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_order(self):
+        return list(Item.objects.order_by('-created_at', '-id').values_list('sku', flat=True))
+
+    def walk(self, url, params):
+        skus, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            pages += 1
+            skus.extend(row['sku'] for row in response.data['results'])
+            if not response.data['next']:
+                return skus, pages
+            response = self.client.get(response.data['next'])
+
+    def test_full_list_without_parameters(self):
+        response = self.client.get(reverse('list-items'))
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 5)
+
+    def test_pages_cover_every_row_once(self):
+        skus, pages = self.walk(reverse('list-items'), {'page_size': 2})
+        self.assertEqual(pages, 3)
+        self.assertEqual(skus, self.expected_order())
+
+    def test_rows_added_while_paging_do_not_shift_pages(self):
+        first = self.client.get(reverse('list-items'), {'page_size': 2})
+        Item.objects.create(sku='NEW', name='Baru', price=1000)
+        skus = [row['sku'] for row in first.data['results']]
+        response = self.client.get(first.data['next'])
+        while True:
+            skus.extend(row['sku'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        # Baris baru ada di depan urutan (created_at terbaru), jadi tidak muncul dan tidak menggeser halaman berikutnya
+        self.assertEqual(skus, [sku for sku in self.expected_order() if sku != 'NEW'])
+
+    def test_count_and_page_size_cap(self):
+        response = self.client.get(reverse('list-items'), {'page_size': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 5)
+        self.assertNotIn('count', self.client.get(reverse('list-items'), {'page_size': 2}).data)
+        with mock.patch('api.pagination.KeysetPagination.max_page_size', 3):
+            response = self.client.get(reverse('list-items'), {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_viewset_list_is_opt_in(self):
+        for index in range(3):
+            VoucherProject.objects.create(name=f'Project {index}')
+        url = reverse('voucher-project-list')
+        self.assertEqual(len(self.client.get(url).data), 3)
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_photos_of_a_retailer_stay_on_one_page(self):
+        wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        for index in range(3):
+            retailer = Retailer.objects.create(name=f'Retailer {index}', phone_number=f'6281{index}', address='-', wholesale=wholesale)
+            for photo in range(index + 1):
+                RetailerPhoto.objects.create(retailer=retailer, image=f'retailer_photos/{index}-{photo}.jpg')
+
+        pages = []
+        response = self.client.get(reverse('list_photos'), {'page_size': 2})
+        while True:
+            pages.append({row['retailer_name']: len(row['photos']) for row in response.data['results']})
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(pages, [{'Retailer 2': 3, 'Retailer 1': 2}, {'Retailer 0': 1}])
+
+
+class DiscountsByVoucherTest(TestCase):
+    """by_voucher answers from the discount cache, but applies the queryset filters when they are given"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('office', 'office@example.com', 'password')
+        wholesale = Wholesale.objects.create(name='Agen', phone_number='62811')
+        retailer = Retailer.objects.create(name='Retailer', phone_number='62812', address='-', wholesale=wholesale)
+        cls.project = VoucherProject.objects.create(name='Project')
+        Voucher.objects.create(code='DISC', retailer=retailer, project=cls.project)
+        for amount in (10000, 20000, 30000):
+            VoucherRetailerDiscount.objects.create(discount_amount=amount, discount_percentage=10, voucher_project=cls.project)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        discounts.invalidate()
+        discounts.table()
+
+    def by_voucher(self, **params):
+        response = self.client.get(reverse('voucher-discount-by-voucher'), {'voucher_code': 'DISC', **params})
+        return [row['discount_amount'] for row in response.data['discounts']]
+
+    def test_cached_discounts_newest_first(self):
+        with self.assertNumQueries(1):
+            amounts = self.by_voucher()
+        self.assertEqual(amounts, ['30000.00', '20000.00', '10000.00'])
+
+    def test_filters_are_applied(self):
+        self.assertEqual(self.by_voucher(min_amount=15000), ['30000.00', '20000.00'])
+        self.assertEqual(self.by_voucher(max_amount=15000), ['10000.00'])
+
+
+class RegionTestCase(TestCase):
+    """Kodepos rows for two provinces, with a fresh region index per test"""
+
+    ROWS = [
+        ('40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'),
+        ('40132', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'),
+        ('40134', 'Lebak Siliwangi', 'Coblong', 'Bandung', 'Jawa Barat'),
+        ('40115', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat'),
+        ('16125', 'Babakan', 'Bogor Tengah', 'Bogor', 'Jawa Barat'),
+        ('50241', 'Candisari', 'Candisari', 'Semarang', 'Jawa Tengah'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        for kodepos, kelurahan, kecamatan, kota, provinsi in cls.ROWS:
+            Kodepos.objects.create(kodepos=kodepos, kelurahan=kelurahan, kecamatan=kecamatan, kota=kota, provinsi=provinsi)
+
+    def setUp(self):
+        # Index wilayah disimpan per proses; on_commit tidak jalan di TestCase, jadi invalidate manual
+        regions.invalidate()
+        self.addCleanup(regions.invalidate)
+        self.client = APIClient()
+
+
+class RegionLookupTest(RegionTestCase):
+    """Region lookups carry a version ETag; a matching If-None-Match is answered with 304 and no queries"""
+
+    def test_lookups(self):
+        self.assertEqual(self.client.get(reverse('provinsi-list')).data, ['Jawa Barat', 'Jawa Tengah'])
+        self.assertEqual(self.client.get(reverse('kota-list'), {'provinsi': 'Jawa Barat'}).data, ['Bandung', 'Bogor'])
+        self.assertEqual(self.client.get(reverse('kelurahan-list'), {'kecamatan': 'Coblong'}).data, ['Dago', 'Lebak Siliwangi'])
+        self.assertEqual(self.client.get(reverse('kodepos-detail'), {'kelurahan': 'Dago'}).data, {
+            'kodepos': '40132', 'kelurahan': 'Dago', 'kecamatan': 'Coblong', 'kota': 'Bandung', 'provinsi': 'Jawa Barat',
+        })
+        self.assertEqual(self.client.get(reverse('kodepos-detail'), {'kelurahan': 'Tidak Ada'}).status_code, 404)
+        tree = self.client.get(reverse('kodepos-tree')).data
+        self.assertEqual(tree['Jawa Barat']['Bandung']['Coblong'], {'Dago': ['40132', '40135'], 'Lebak Siliwangi': ['40134']})
+
+    def test_not_modified(self):
+        response = self.client.get(reverse('kota-list'), {'provinsi': 'Jawa Barat'})
+        etag = response['ETag']
+        self.assertIn('max-age=', response['Cache-Control'])
+        for if_none_match in (etag, f'W/{etag}', f'"other", {etag}'):
+            with self.subTest(if_none_match=if_none_match), self.assertNumQueries(0):
+                response = self.client.get(reverse('kota-list'), {'provinsi': 'Jawa Barat'}, HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+        # ETag berbeda per lookup
+        other = self.client.get(reverse('kota-list'), {'provinsi': 'Jawa Tengah'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], etag)
+
+    def test_kodepos_change_changes_etag(self):
+        etag = self.client.get(reverse('kota-list'), {'provinsi': 'Jawa Barat'})['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Kodepos.objects.create(kodepos='16111', kelurahan='Sempur', kecamatan='Bogor Tengah', kota='Depok', provinsi='Jawa Barat')
+
+        response = self.client.get(reverse('kota-list'), {'provinsi': 'Jawa Barat'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data, ['Bandung', 'Bogor', 'Depok'])
+
+
+class RegionSearchTest(RegionTestCase):
+    """Typeahead prefix search over kelurahan/kecamatan, served from the in-memory index"""
+
+    def search(self, **params):
+        return self.client.get(reverse('kodepos-search'), params)
+
+    def test_kelurahan_prefix_is_case_insensitive(self):
+        response = self.search(q='da')
+        self.assertEqual(response.data, [{
+            'provinsi': 'Jawa Barat', 'kota': 'Bandung', 'kecamatan': 'Coblong', 'kelurahan': 'Dago',
+            'kodepos': ['40132', '40135'],
+        }])
+        self.assertEqual([hit['kelurahan'] for hit in self.search(q='C').data], ['Candisari', 'Cihapit'])
+
+    def test_kecamatan_level_and_limit(self):
+        response = self.search(q='b', level='kecamatan')
+        self.assertEqual(
+            [(hit['kecamatan'], hit['kota']) for hit in response.data], [('Bandung Wetan', 'Bandung'), ('Bogor Tengah', 'Bogor')]
+        )
+        self.assertNotIn('kodepos', response.data[0])
+        self.assertEqual(len(self.search(q='b', level='kecamatan', limit=1).data), 1)
+
+    def test_index_is_reused_between_requests(self):
+        self.search(q='da')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.search(q='le').data), 1)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.search(q='').data, [])
+        self.assertEqual(self.search(q='zz').data, [])
+        self.assertEqual(self.search(q='da', level='kota').status_code, 400)
+        self.assertEqual(self.search(q='da', limit='x').status_code, 400)
@@ -24,14 +24,19 @@ from .views import (
     kota_list,
     provinsi_list,
     KodeposDetailView,
+    region_tree,
+    region_search,
     ReportView,
+    report_export_status,
     admin_update_user,
     admin_delete_user,
     list_items,
     submit_trx_voucher,
     submit_reimburse,
     update_reimburse_status,
+    bulk_update_reimburse_status,
     list_reimburse,
+    reimburse_aging,
     list_retailers,
     get_current_count, 
     VoucherLimitViewSet,
@@ -131,6 +136,7 @@ urlpatterns = [
     path('redeem_report/', redeem_report, name='redeem_report'),
     path('office_verification_report/', office_verification_report, name='office_verification_report'),
     path('report/list_retailers/', list_retailers, name='list_retailers'),
+    path('report/exports/<int:pk>/', report_export_status, name='report-export-status'),
     path('report/<str:view_name>/', ReportView.as_view(), name='report-view'),
    
     # Location and kodepos management
@@ -140,12 +146,16 @@ urlpatterns = [
     path('kota/', kota_list, name='kota-list'),
     path('provinsi/', provinsi_list, name='provinsi-list'),
     path('kodepos/detail/', KodeposDetailView.as_view(), name='kodepos-detail'),
+    path('kodepos/tree/', region_tree, name='kodepos-tree'),
+    path('kodepos/search/', region_search, name='kodepos-search'),
 
     # Item and Reimburse management
     path('items/', list_items, name='list-items'),
     path('submit_reimburse/', submit_reimburse, name='submit_reimburse'),
     path('list_reimburse/', list_reimburse, name='list_reimburse'),
+    path('reimburse_aging/', reimburse_aging, name='reimburse_aging'),
     path('update_reimburse_status/<int:pk>/<str:new_status>/', update_reimburse_status, name='update_reimburse_status'),
+    path('bulk_update_reimburse_status/', bulk_update_reimburse_status, name='bulk_update_reimburse_status'),
     path('current-count/', get_current_count, name='get_current_count'),
 
     # Include ViewSet routes
@@ -1,36 +1,53 @@
 # Revised views.py
-import os
 from rest_framework import viewsets, generics
 from rest_framework import status as http_status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
-from office.models import User, Kodepos, Item, Reimburse, ReimburseStatus, VoucherLimit, VoucherProject, VoucherRetailerDiscount
+from office.models import User, Item, Reimburse, VoucherLimit, VoucherProject, VoucherRetailerDiscount
+from office import quota
+from office import discounts as discount_cache
+from office import regions
+from office import reimburse as reimbursements
 from retailer.models import Retailer, RetailerPhoto, Voucher
-from wholesales.models import Wholesale, VoucherRedeem, WholesaleTransaction, WholesaleTransactionDetail
+from retailer.voucher_status import with_voucher_status, filter_by_voucher_status, VOUCHER_STATUSES
+from wholesales.models import Wholesale, VoucherRedeem
+from wholesales import receipts
 from django.shortcuts import get_object_or_404
 from .serializers import (
     UserSerializer, CustomTokenObtainPairSerializer, ChangePasswordSerializer, WholesaleSerializer, 
     VoucherRedeemSerializer, RetailerRegistrationSerializer, RetailerPhotoSerializer, 
     RetailerSerializer, RetailerPhotoVerificationSerializer, RetailerPhotoRejectionSerializer,
-    VoucherSerializer, KodeposSerializer, ItemSerializer, WholesaleTransactionSerializer,
-    ReimburseSerializer, RetailerReportSerializer, WholesaleTransactionDetailSerializer,
+    RetailerBulkVerificationSerializer,
+    VoucherSerializer, ItemSerializer, WholesaleTransactionSerializer,
+    ReimburseBulkStatusSerializer, RetailerReportSerializer,
     VoucherLimitSerializer, VoucherProjectSerializer, VoucherRetailerDiscountSerializer,
-    VoucherProjectSummarySerializer, VoucherLimitUpdateSerializer
+    VoucherProjectSummarySerializer, VoucherLimitUpdateSerializer, ReportExportSerializer
 )
+from . import exports
+from .pagination import KeysetPagination
+from .idempotency import idempotent
+from .loaders import reimburse_queryset, reimburse_list
+from .models import ReportExport
+from .tasks import GENERATE_REPORT_TASK, fail_orphaned_exports
+from jobs.queue import enqueue
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.db.models import Count, Avg, Sum
+from django.db.models import Count, Avg, Sum, Prefetch
 from datetime import datetime
-import pandas as pd
+import tempfile
 from django.conf import settings
 from django.core.mail import send_mail
 import json
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
-from django.db import models
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse
+from django.db import models, transaction, IntegrityError
+from django.urls import reverse
+import hashlib
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.gzip import gzip_page
 
 # Import untuk Swagger
 try:
@@ -148,6 +165,10 @@ class UserViewSet(viewsets.ViewSet):
     
     def list_users(self, request):
         users = User.objects.all()
+        paginator = KeysetPagination(ordering=('-created_on', '-id'))
+        page = paginator.paginate_queryset(users, request)
+        if page is not None:
+            return paginator.get_paginated_response(UserSerializer(page, many=True).data)
         serializer = UserSerializer(users, many=True)
         return Response(serializer.data, status=http_status.HTTP_200_OK)
 
@@ -159,7 +180,7 @@ class WholesaleViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Optimize queryset with select_related for parent"""
-        return Wholesale.objects.select_related('parent').prefetch_related('children').order_by('-created_at')
+        return Wholesale.objects.with_hierarchy().order_by('-created_at')
 
 # Register View
 @api_view(['POST'])
@@ -289,29 +310,30 @@ class RetailerViewSet(viewsets.ModelViewSet):
         retailer = self.get_object()
         photos = RetailerPhoto.objects.filter(retailer=retailer)
         voucher = Voucher.objects.filter(retailer=retailer).first()
-        project_id = voucher.project.id if voucher.project else None
+        project_id = voucher.project_id if voucher else None
         if not photos.exists():
             return Response({"message": "No photos found for this retailer."}, status=http_status.HTTP_404_NOT_FOUND)
 
-        # Update current_count in VoucherLimit with project_id
-        voucher_limit = VoucherLimit.objects.filter(voucher_project=project_id).first()
-        if not voucher_limit:
+        try:
+            with transaction.atomic():
+                # Lock voucher supaya tidak balapan dengan bulk_verify_photos/bulk_reject_photos
+                if voucher:
+                    voucher = Voucher.objects.select_for_update().get(pk=voucher.pk)
+                # Mark all photos as verified
+                now = timezone.now()
+                photos.update(is_verified=True, is_approved=True, verified_at=now, approved_at=now)
+                if voucher:
+                    voucher.is_approved = True
+                    voucher.approved_at = now
+                    voucher.set_lifecycle_state(Voucher.STATE_RECEIVED, now)
+                    voucher.save()
+
+                # Reserve kuota VoucherLimit project di akhir transaksi agar lock row singkat
+                quota.reserve(1, project_id=project_id)
+        except VoucherLimit.DoesNotExist:
             return Response({"message": "Voucher limit not found for this project."}, status=http_status.HTTP_404_NOT_FOUND)
-
-        if voucher_limit.current_count >= voucher_limit.limit:
+        except quota.QuotaExceeded:
             return Response({"message": "Voucher limit reached"}, status=http_status.HTTP_200_OK)
-        
-        if voucher_limit:
-            voucher_limit.current_count += 1
-            voucher_limit.save()
-
-        # Mark all photos as verified
-        photos.update(is_verified=True, is_approved=True, verified_at=timezone.now(), approved_at=timezone.now())
-        if voucher:
-            voucher.is_approved = True
-            voucher.approved_at = timezone.now()
-            voucher.save()
-
 
         return Response({"message": "All photos for retailer verified successfully."}, status=http_status.HTTP_200_OK)
 
@@ -324,12 +346,106 @@ class RetailerViewSet(viewsets.ModelViewSet):
             return Response({"message": "No photos found for this retailer."}, status=http_status.HTTP_404_NOT_FOUND)
 
         # Mark all photos as rejected
-        photos.update(is_verified=True, is_approved=False, is_rejected=True, verified_at=timezone.now(), rejected_at=timezone.now())
-        voucher.is_rejected = True
-        voucher.rejected_at = timezone.now()
-        voucher.save()
+        now = timezone.now()
+        with transaction.atomic():
+            voucher = Voucher.objects.select_for_update().get(pk=voucher.pk)
+            photos.update(is_verified=True, is_approved=False, is_rejected=True, verified_at=now, rejected_at=now)
+            voucher.is_rejected = True
+            voucher.rejected_at = now
+            voucher.set_lifecycle_state(Voucher.STATE_REJECTED, now)
+            voucher.save()
         return Response({"message": "All photos for retailer rejected successfully."}, status=http_status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'])
+    def bulk_verify_photos(self, request):
+        """Verify photos of many retailers in one transaction"""
+        return self.bulk_review_photos(request, approve=True)
+
+    @action(detail=False, methods=['post'])
+    def bulk_reject_photos(self, request):
+        """Reject photos of many retailers in one transaction"""
+        return self.bulk_review_photos(request, approve=False)
+
+    def bulk_review_photos(self, request, approve):
+        serializer = RetailerBulkVerificationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=http_status.HTTP_400_BAD_REQUEST)
+        retailer_ids = serializer.get_retailer_ids()
+
+        existing_ids = set(Retailer.objects.filter(pk__in=retailer_ids).values_list('pk', flat=True))
+        with_photos = set(
+            RetailerPhoto.objects.filter(retailer_id__in=retailer_ids).values_list('retailer_id', flat=True).distinct()
+        )
+        now = timezone.now()
+        results = {}
+        with transaction.atomic():
+            # Voucher pertama per retailer, sama seperti Voucher.objects.filter(retailer=...).first().
+            # Di-lock di dalam transaksi agar verify/reject lain tidak bisa mengubah status
+            # (atau memakai kuota) di antara pengecekan dan update di bawah.
+            vouchers = {}
+            for voucher in Voucher.objects.select_for_update().filter(retailer_id__in=retailer_ids).order_by(
+                    'retailer_id', 'pk').only('id', 'retailer_id', 'project_id', 'is_approved', 'is_rejected'):
+                vouchers.setdefault(voucher.retailer_id, voucher)
+
+            candidates = []
+            for retailer_id in retailer_ids:
+                voucher = vouchers.get(retailer_id)
+                if retailer_id not in existing_ids:
+                    results[retailer_id] = "Retailer not found."
+                elif retailer_id not in with_photos:
+                    results[retailer_id] = "No photos found for this retailer."
+                elif voucher and voucher.is_rejected:
+                    results[retailer_id] = "Voucher already rejected."
+                elif approve and voucher and voucher.is_approved:
+                    results[retailer_id] = "Voucher already verified."
+                else:
+                    candidates.append(retailer_id)
+
+            if approve:
+                # Satu reservasi kuota per project untuk seluruh batch
+                by_project = {}
+                for retailer_id in candidates:
+                    voucher = vouchers.get(retailer_id)
+                    by_project.setdefault(voucher.project_id if voucher else None, []).append(retailer_id)
+
+                candidates = []
+                for project_id, project_retailers in by_project.items():
+                    try:
+                        quota.reserve(len(project_retailers), project_id=project_id)
+                        candidates.extend(project_retailers)
+                    except VoucherLimit.DoesNotExist:
+                        results.update(dict.fromkeys(project_retailers, "Voucher limit not found for this project."))
+                    except quota.QuotaExceeded:
+                        results.update(dict.fromkeys(project_retailers, "Voucher limit reached"))
+
+            voucher_ids = [vouchers[r].id for r in candidates if r in vouchers]
+            photos = RetailerPhoto.objects.filter(retailer_id__in=candidates)
+            if approve:
+                photos.update(is_verified=True, is_approved=True, verified_at=now, approved_at=now)
+                Voucher.objects.filter(pk__in=voucher_ids, is_approved=False, is_rejected=False).update(
+                    is_approved=True, approved_at=now
+                )
+                Voucher.objects.filter(pk__in=voucher_ids, is_rejected=False, redeemed=False).update(
+                    lifecycle_state=Voucher.STATE_RECEIVED, lifecycle_state_at=now
+                )
+            else:
+                photos.update(is_verified=True, is_approved=False, is_rejected=True, verified_at=now, rejected_at=now)
+                Voucher.objects.filter(pk__in=voucher_ids, is_rejected=False).update(
+                    is_rejected=True, rejected_at=now,
+                    lifecycle_state=Voucher.STATE_REJECTED, lifecycle_state_at=now
+                )
+
+        done_status = "verified" if approve else "rejected"
+        results.update(dict.fromkeys(candidates, None))
+        return Response({
+            "message": f"{len(candidates)} of {len(retailer_ids)} retailers {done_status}.",
+            "results": [
+                {"retailer_id": retailer_id, "status": done_status} if results[retailer_id] is None
+                else {"retailer_id": retailer_id, "error": results[retailer_id]}
+                for retailer_id in retailer_ids
+            ]
+        }, status=http_status.HTTP_200_OK)
+
 # Retailer Registration API
 @api_view(['POST'])
 def retailer_register_upload(request):
@@ -348,6 +464,7 @@ def retailer_register_upload(request):
 # Redeem Voucher API
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('redeem_voucher')
 def redeem_voucher(request):
     serializer = VoucherRedeemSerializer(data=request.data)
     if serializer.is_valid():
@@ -358,6 +475,7 @@ def redeem_voucher(request):
 # Submit Transaction Voucher API
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('submit_trx_voucher')
 def submit_trx_voucher(request):
     required_fields = ['voucher_code', 'ws_id', 'total_price', 'total_price_after_discount', 'image', 'items']
     for field in required_fields:
@@ -366,36 +484,31 @@ def submit_trx_voucher(request):
 
     voucher = get_object_or_404(Voucher, code=request.data['voucher_code'])
     wholesaler = get_object_or_404(Wholesale, id=request.data['ws_id'])
+    if 'image' not in request.FILES:
+        return Response({"error": "image must be an uploaded file"}, status=http_status.HTTP_400_BAD_REQUEST)
 
-    # Check if the voucher has already been submitted
-    if WholesaleTransaction.objects.filter(voucher_redeem__voucher=voucher, voucher_redeem__wholesaler=wholesaler).exists():
-        return Response({"error": "This voucher has already been submitted"}, status=http_status.HTTP_400_BAD_REQUEST)
-
-    voucher_redeem = VoucherRedeem.objects.get(voucher=voucher, wholesaler=wholesaler)
-    
-    transaction = WholesaleTransaction.objects.create(
-        total_price=request.data['total_price'],
-        total_price_after_discount=request.data['total_price_after_discount'], 
-        image=request.FILES['image'],
-        voucher_redeem=voucher_redeem,
-        created_by=request.user.username
-    )
-    items = request.data.get('items', [])
-    if isinstance(items, str):
-        items = json.loads(items)
-    for item_data in items:
-        item = get_object_or_404(Item, id=item_data['item_id'])
-        WholesaleTransactionDetail.objects.create(
-            transaction=transaction,
-            item=item,
-            qty=item_data['qty'],
-            sub_total=item_data['sub_total']
+    # Semua item divalidasi dengan satu query, lalu transaksi + detail disimpan atomik (lihat wholesales/receipts.py)
+    try:
+        details = receipts.validate(
+            request.data.get('items'), request.data['total_price'], request.data['total_price_after_discount']
+        )
+        voucher_redeem, wholesale_transaction = receipts.save(
+            voucher, wholesaler, details,
+            request.data['total_price'], request.data['total_price_after_discount'],
+            request.FILES['image'], request.user.username
         )
+    except receipts.UnknownItems as e:
+        return Response({"error": e.message, **e.details}, status=http_status.HTTP_404_NOT_FOUND)
+    except receipts.UploadFailed as e:
+        # 5xx: Idempotency-Key dilepas, jadi retry dengan key yang sama menjalankan ulang request
+        return Response({"error": e.message}, status=http_status.HTTP_503_SERVICE_UNAVAILABLE)
+    except receipts.ReceiptError as e:
+        return Response({"error": e.message, **e.details}, status=http_status.HTTP_400_BAD_REQUEST)
 
     return Response({
         "message": "Voucher redeemed and transaction saved successfully",
         "voucher_redeem": VoucherRedeemSerializer(voucher_redeem).data,
-        "transaction": WholesaleTransactionSerializer(transaction).data
+        "transaction": WholesaleTransactionSerializer(wholesale_transaction).data
     }, status=http_status.HTTP_201_CREATED)
 
 # Redeem Report API
@@ -404,14 +517,20 @@ def submit_trx_voucher(request):
 def redeem_report(request):
     ws_id = request.query_params.get('ws_id')
     redeemed_vouchers = VoucherRedeem.objects.filter(wholesaler_id=ws_id) if ws_id else VoucherRedeem.objects.all()
+    redeemed_vouchers = redeemed_vouchers.select_related('voucher', 'wholesaler')
+
+    paginator = KeysetPagination(ordering=('-redeemed_at', '-id'))
+    page = paginator.paginate_queryset(redeemed_vouchers, request)
 
     data = [
         {
             "voucher_code": voucher.voucher.code,
             "redeemed_at": voucher.redeemed_at,
             "wholesaler": voucher.wholesaler.name
-        } for voucher in redeemed_vouchers
+        } for voucher in (page if page is not None else redeemed_vouchers)
     ]
+    if page is not None:
+        return paginator.get_paginated_response(data)
     return Response({"redeemed_vouchers": data}, status=http_status.HTTP_200_OK)
 
 # List Retailer
@@ -425,21 +544,22 @@ def list_retailers(request):
     }
     filters = {k: v for k, v in filters.items() if v}
 
-    retailers = Retailer.objects.filter(**filters)
+    # Voucher (status dari lifecycle_state) dan foto diambil dengan satu prefetch masing-masing
+    retailers = with_voucher_status(
+        Retailer.objects.filter(**filters)
+    ).select_related('wholesale').prefetch_related(
+        Prefetch('retailerphoto_set', queryset=RetailerPhoto.objects.order_by('pk'))
+    )
 
     voucher_status = request.query_params.get('voucher_status')
-    if voucher_status:
-        status_filters = {
-            'PENDING': {'voucher__is_approved': False, 'voucher__redeemed': False},
-            'REJECTED': {'voucher__is_rejected': True, 'voucher__redeemed': False},
-            'RECEIVED': {'voucher__is_approved': True, 'voucher__redeemed': False},
-            'REDEEMED': {'voucher__is_approved': True, 'voucher__redeemed': True},
-            'WAITING REIMBURSE': {'voucher__in': Reimburse.objects.filter(status__status='waiting').values_list('voucher', flat=True)},
-            'REIMBURSE COMPLETED': {'voucher__in': Reimburse.objects.filter(status__status='completed').values_list('voucher', flat=True)},
-            'REIMBURSE PAID': {'voucher__in': Reimburse.objects.filter(status__status='paid').values_list('voucher', flat=True)}
-        }
-        retailers = retailers.filter(**status_filters.get(voucher_status.upper(), {}))
-        
+    if voucher_status and voucher_status.upper() in VOUCHER_STATUSES:
+        retailers = filter_by_voucher_status(retailers, voucher_status.upper())
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(retailers, request)
+    if page is not None:
+        return paginator.get_paginated_response(RetailerReportSerializer(page, many=True).data)
+
     serializer = RetailerReportSerializer(retailers, many=True)
     return Response(serializer.data, status=http_status.HTTP_200_OK)
 
@@ -455,8 +575,14 @@ def list_photos(request):
     }
     filters = {k: v for k, v in filters.items() if v is not None}
 
-    photos = RetailerPhoto.objects.filter(**filters)
-    if not photos.exists():
+    photos = RetailerPhoto.objects.filter(**filters).select_related('retailer__wholesale')
+
+    # Halaman dihitung per retailer supaya foto satu retailer tidak terpecah ke dua halaman
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(Retailer.objects.filter(pk__in=photos.values('retailer_id')), request)
+    if page is not None:
+        photos = photos.filter(retailer__in=page).order_by('-retailer__created_at', '-retailer_id', 'pk')
+    elif not photos.exists():
         return Response([], status=http_status.HTTP_200_OK)
 
     response_data = {}
@@ -487,13 +613,17 @@ def list_photos(request):
                 "photos": []
             }
         response_data[retailer_id]["photos"].append({
-            "image": photo.image.url if photo.image else None,
+            "image": photo.image_url,
+            "thumbnail_url": photo.thumbnail_url,
+            "medium_url": photo.medium_url,
             "is_verified": photo.is_verified,
             "is_approved": photo.is_approved,
             "is_rejected": photo.is_rejected,
             "remarks": photo.remarks,
         })
 
+    if page is not None:
+        return paginator.get_paginated_response(list(response_data.values()))
     return Response(list(response_data.values()), status=http_status.HTTP_200_OK)
 
 # Office Verification Report View
@@ -511,214 +641,276 @@ def list_vouchers(request):
         'retailer_id': request.query_params.get('retailer_id'),
         'retailer__wholesale_id': request.query_params.get('ws_id'),
         'code': request.query_params.get('voucher_code'),
-        'redeemed': request.query_params.get('redeemed')
+        'redeemed': request.query_params.get('redeemed'),
+        'lifecycle_state': request.query_params.get('lifecycle_state')
     }
     filters = {k: v for k, v in filters.items() if v is not None}
 
     vouchers = Voucher.objects.filter(**filters)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(vouchers, request)
+    if page is not None:
+        return paginator.get_paginated_response(VoucherSerializer(page, many=True).data)
     serializer = VoucherSerializer(vouchers, many=True)
     return Response(serializer.data, status=http_status.HTTP_200_OK) 
 
+def region_response(request, name, **params):
+    """
+    Kodepos lookup from the in-memory region index (office/regions.py) with ETag and
+    Cache-Control headers. Returns 304 when If-None-Match matches the current version.
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    version = regions.version()
+    etag = quote_etag(regions.etag(name, params, version))
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f"public, max-age={getattr(settings, 'REGION_CACHE_MAX_AGE', 3600)}",
+    }
+    # ETag bisa dijadikan weak (W/) oleh gzip, jadi dibandingkan tanpa prefix tersebut
+    if_none_match = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(status=http_status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    data = regions.get(name, params)
+    if data is None:
+        return Response({"error": "Kodepos not found"}, status=http_status.HTTP_404_NOT_FOUND, headers=headers)
+    return Response(data, headers=headers)
+
 @api_view(['GET'])
 def kodepos_list(request):
-    kodepos_list = Kodepos.objects.values_list('kodepos', flat=True).distinct()
-    return Response(kodepos_list)
+    return region_response(request, 'kodepos')
 
 @api_view(['GET'])
 def kelurahan_list(request):
-    kecamatan = request.query_params.get('kecamatan')
-    kelurahan_list = Kodepos.objects.filter(kecamatan=kecamatan).values_list('kelurahan', flat=True).distinct() if kecamatan else Kodepos.objects.values_list('kelurahan', flat=True).distinct()
-    return Response(kelurahan_list)
+    return region_response(request, 'kelurahan', kecamatan=request.query_params.get('kecamatan'))
 
 @api_view(['GET'])
 def kecamatan_list(request):
-    kota = request.query_params.get('kota')
-    kecamatan_list = Kodepos.objects.filter(kota=kota).values_list('kecamatan', flat=True).distinct() if kota else Kodepos.objects.values_list('kecamatan', flat=True).distinct()
-    return Response(kecamatan_list)
+    return region_response(request, 'kecamatan', kota=request.query_params.get('kota'))
 
 @api_view(['GET'])
 def kota_list(request):
-    provinsi = request.query_params.get('provinsi')
-    kota_list = Kodepos.objects.filter(provinsi=provinsi).values_list('kota', flat=True).distinct() if provinsi else Kodepos.objects.values_list('kota', flat=True).distinct()
-    return Response(kota_list)
+    return region_response(request, 'kota', provinsi=request.query_params.get('provinsi'))
 
 @api_view(['GET'])
 def provinsi_list(request):
-    provinsi_list = Kodepos.objects.values_list('provinsi', flat=True).distinct()
-    return Response(provinsi_list)
+    return region_response(request, 'provinsi')
 
 class KodeposDetailView(APIView):
     def get(self, request):
-        filters = {
-            'kelurahan': request.query_params.get('kelurahan'),
-            'kecamatan': request.query_params.get('kecamatan'),
-            'kota': request.query_params.get('kota'),
-            'provinsi': request.query_params.get('provinsi')
-        }
-        filters = {k: v for k, v in filters.items() if v is not None}
+        return region_response(
+            request, 'detail',
+            kelurahan=request.query_params.get('kelurahan'),
+            kecamatan=request.query_params.get('kecamatan'),
+            kota=request.query_params.get('kota'),
+            provinsi=request.query_params.get('provinsi'),
+        )
 
-        try:
-            kodepos = Kodepos.objects.get(**filters)
-            serializer = KodeposSerializer(kodepos)
-            return Response(serializer.data)
-        except Kodepos.DoesNotExist:
-            return Response({"error": "Kodepos not found"}, status=http_status.HTTP_404_NOT_FOUND)
+@gzip_page
+@api_view(['GET'])
+def region_tree(request):
+    """Full region tree {provinsi: {kota: {kecamatan: {kelurahan: [kodepos]}}}} in one response"""
+    return region_response(request, 'tree')
+
+@api_view(['GET'])
+def region_search(request):
+    """Prefix search over kelurahan (default) or kecamatan names: ?q=&level=&limit="""
+    query = request.query_params.get('q', '').strip()
+    level = request.query_params.get('level', 'kelurahan')
+    if level not in regions.SEARCH_LEVELS:
+        return Response({"error": f"level must be one of {', '.join(regions.SEARCH_LEVELS)}"}, status=http_status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=http_status.HTTP_400_BAD_REQUEST)
+    if not query:
+        return Response([])
+    return region_response(request, 'search', query=query, level=level, limit=limit)
 
 class ReportView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get_queryset(self, view_name):
-        view_map = {
-            'redeem_report': VoucherRedeem.objects.select_related('voucher', 'wholesaler').all(),
-            'list_photos': RetailerPhoto.objects.all(),
-            'list_vouchers': Voucher.objects.all(),
-            'list_reimburse': Reimburse.objects.all()
-        }
-        return view_map.get(view_name)
-
-    def get_serializer_class(self, view_name):
-        serializer_map = {
-            'redeem_report': VoucherRedeemSerializer,
-            'list_photos': RetailerPhotoSerializer,
-            'list_vouchers': VoucherSerializer,
-            'list_reimburse': ReimburseSerializer
-        }
-        return serializer_map.get(view_name)
-
-    def export_to_excel(self, queryset, serializer_class, file_path):
-        serializer = serializer_class(queryset, many=True)
-        data = serializer.data
+    def get(self, request, view_name):
+        report = exports.REPORTS.get(view_name)
+        if not report:
+            return Response({"error": "Invalid view name"}, status=http_status.HTTP_400_BAD_REQUEST)
 
-        if serializer_class == VoucherRedeemSerializer:
-            for item in data:
-                voucher = Voucher.objects.get(pk=item['voucher'])
-                wholesaler = Wholesale.objects.get(pk=item['wholesaler'])
-                item.update({
-                    'voucher': voucher.code,
-                    'wholesaler': wholesaler.name,
-                    'redeemed_at': item['redeemed_at'].split('T')[0],
-                    'retailer': voucher.retailer.name
-                })
-
-        df = pd.DataFrame(data)
-        writer = pd.ExcelWriter(file_path, engine='xlsxwriter')
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
-        writer._save()
+        file_type = request.query_params.get('file_type', 'xlsx')
+        if file_type not in exports.FILE_TYPES:
+            return Response({"error": "Invalid file type"}, status=http_status.HTTP_400_BAD_REQUEST)
+        filename = exports.export_filename(view_name, file_type)
+        content_type = exports.FILE_TYPES[file_type][1]
 
-    def get(self, request, view_name):
-        queryset = self.get_queryset(view_name)
-        serializer_class = self.get_serializer_class(view_name)
-        if not queryset or not serializer_class:
+        if request.query_params.get('stream') in ('1', 'true'):
+            if file_type == 'csv':
+                response = StreamingHttpResponse(exports.iter_csv(report), content_type=content_type)
+            else:
+                # xlsx baru valid setelah workbook ditutup, jadi ditulis ke file sementara lalu di-stream
+                tmp = tempfile.TemporaryFile()
+                exports.write_xlsx(report, tmp)
+                tmp.seek(0)
+                response = FileResponse(tmp, content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+        # Tanpa stream: deprecated, file tidak lagi ditulis ke MEDIA_ROOT melainkan dibuat di background
+        response = self.queue_export(request, view_name, file_type)
+        response['Deprecation'] = 'true'
+        response['Link'] = f'<{request.path}>; rel="alternate"; method="POST"'
+        return response
+
+    def post(self, request, view_name):
+        """Queue the report for background generation; identical in-flight requests share one export"""
+        if view_name not in exports.REPORTS:
             return Response({"error": "Invalid view name"}, status=http_status.HTTP_400_BAD_REQUEST)
+        file_type = request.data.get('file_type') or request.query_params.get('file_type', 'xlsx')
+        if file_type not in exports.FILE_TYPES:
+            return Response({"error": "Invalid file type"}, status=http_status.HTTP_400_BAD_REQUEST)
+        return self.queue_export(request, view_name, file_type)
+
+    def queue_export(self, request, view_name, file_type):
+        params_hash = hashlib.sha256(
+            json.dumps({'view_name': view_name, 'file_type': file_type}, sort_keys=True).encode()
+        ).hexdigest()
+
+        # Export yang job-nya sudah hilang (mis. dead-letter) tidak boleh menahan request baru
+        fail_orphaned_exports(ReportExport.objects.filter(params_hash=params_hash))
+        export = ReportExport.objects.filter(params_hash=params_hash, status__in=ReportExport.IN_FLIGHT).first()
+        created = export is None
+        if created:
+            try:
+                with transaction.atomic():
+                    export = ReportExport.objects.create(
+                        view_name=view_name,
+                        file_type=file_type,
+                        params_hash=params_hash,
+                        requested_by=request.user.username,
+                    )
+                    enqueue(GENERATE_REPORT_TASK, {'export_id': export.id}, max_attempts=1)
+            except IntegrityError:
+                # Request paralel dengan parameter yang sama sudah membuat export
+                export = ReportExport.objects.get(params_hash=params_hash, status__in=ReportExport.IN_FLIGHT)
+                created = False
+
+        data = ReportExportSerializer(export).data
+        data['status_url'] = reverse('report-export-status', kwargs={'pk': export.pk})
+        return Response(data, status=http_status.HTTP_202_ACCEPTED if created else http_status.HTTP_200_OK)
 
-        timestamp = timezone.now().strftime('%Y%m%d%H%M%S')
-        file_path = os.path.join(settings.MEDIA_ROOT, f'{view_name}-{timestamp}.xlsx')
-        self.export_to_excel(queryset, serializer_class, file_path)
-        
-        return Response({"message": "Report generated successfully", "file_path": file_path}, status=http_status.HTTP_200_OK)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def report_export_status(request, pk):
+    fail_orphaned_exports(ReportExport.objects.filter(pk=pk))
+    export = get_object_or_404(ReportExport, pk=pk)
+    return Response(ReportExportSerializer(export).data, status=http_status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_items(request):
     items = Item.objects.all()
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(items, request)
+    if page is not None:
+        return paginator.get_paginated_response(ItemSerializer(page, many=True).data)
     serializer = ItemSerializer(items, many=True)
     return Response(serializer.data, status=http_status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('submit_reimburse')
 def submit_reimburse(request):
     voucher_codes = request.data.get('voucher_codes')
     if not voucher_codes or not isinstance(voucher_codes, list):
         return Response({"error": "Voucher codes must be provided as a list"}, status=http_status.HTTP_400_BAD_REQUEST)
 
-    responses = []
-    for voucher_code in voucher_codes:
-        try:
-            voucher = Voucher.objects.get(code=voucher_code)
-        except Voucher.DoesNotExist:
-            responses.append({"voucher_code": voucher_code, "error": "Voucher not found"})
-            continue
-
-        if Reimburse.objects.filter(voucher=voucher).exists():
-            responses.append({"voucher_code": voucher_code, "error": "This voucher has already been submitted"})
-            continue
-
-        if not voucher.redeemed:
-            responses.append({"voucher_code": voucher_code, "error": "This voucher has not been redeemed"})
-            continue
-
-        serializer = ReimburseSerializer(data={"voucher_code": voucher_code}, context={'request': request})
-        if serializer.is_valid():
-            serializer.save(reimbursed_by=request.user.username)
-            responses.append({"voucher_code": voucher_code, "status": "submitted"})
-        else:
-            responses.append({"voucher_code": voucher_code, "error": serializer.errors})
-
+    # Semua kode divalidasi dan disimpan sekaligus (lihat office/reimburse.py)
+    responses = reimbursements.submit(voucher_codes, request.user.username)
     return Response(responses, status=http_status.HTTP_201_CREATED)
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def update_reimburse_status(request, pk, new_status):
-    if new_status not in ['completed', 'paid']:
+    if new_status not in reimbursements.TRANSITIONS:
         return Response({"error": "Invalid status"}, status=http_status.HTTP_400_BAD_REQUEST)
-    
-    reimburse = get_object_or_404(Reimburse, pk=pk)
 
-    # Create new status in ReimburseStatus
-    status = ReimburseStatus.objects.create(
-        status=new_status,
-        status_at=timezone.now(),
-        status_by=request.user.username
-    )
+    reimburse = get_object_or_404(Reimburse, pk=pk)
+    # State machine yang sama dengan bulk_update_reimburse_status (office/reimburse.py TRANSITIONS)
+    counts = reimbursements.transition(Reimburse.objects.filter(pk=pk), new_status, request.user.username)
+    if counts['invalid_transition']:
+        return Response(
+            {"error": f"Cannot change reimburse status from {reimburse.current_status} to {new_status}"},
+            status=http_status.HTTP_400_BAD_REQUEST
+        )
+    if counts['unchanged']:
+        return Response({"message": f"Reimburse status is already {new_status}"}, status=http_status.HTTP_200_OK)
+    if not counts['updated']:
+        return Response({"error": "Reimburse not found"}, status=http_status.HTTP_404_NOT_FOUND)
 
-    # Update status in Reimburse
-    reimburse.status = status
-    # if new_status == 'completed':
-    #     reimburse.completed_at = datetime.now()
-    # elif new_status == 'paid':
-    #     reimburse.paid_at = datetime.now()
-    reimburse.save()
-    
     return Response({"message": f"Reimburse status updated to {new_status}"}, status=http_status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_update_reimburse_status(request):
+    """Move many reimburses to completed/paid in one batch (payment run)"""
+    serializer = ReimburseBulkStatusSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=http_status.HTTP_400_BAD_REQUEST)
+
+    new_status = serializer.validated_data['status']
+    requested_ids = serializer.validated_data.get('reimburse_ids')
+    counts = reimbursements.transition(
+        serializer.get_queryset(), new_status, request.user.username,
+        requested_ids=requested_ids,
+    )
+    return Response({
+        "message": f"{counts['updated']} reimburses updated to {new_status}",
+        "counts": counts,
+    }, status=http_status.HTTP_200_OK)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_reimburse(request):
     filters = {
         'status': request.query_params.get('status'),
+        'current_status': request.query_params.get('current_status'),
         'id': request.query_params.get('id'),
         'voucher__code': request.query_params.get('voucher_code')
     }
     filters = {k: v for k, v in filters.items() if v is not None}
 
-    reimburses = Reimburse.objects.filter(**filters)
-    reimburse_serializer = ReimburseSerializer(reimburses, many=True)
-    reimburse_data = reimburse_serializer.data
-    
-    for reimburse in reimburse_data:
-        if 'voucher_code' in reimburse:
-            transactions = WholesaleTransaction.objects.filter(voucher_redeem__voucher__code=reimburse.get('voucher_code'))
-            transaction_serializer = WholesaleTransactionSerializer(transactions, many=True)
-            
-            # Add retailer address details
-            voucher = Voucher.objects.filter(code=reimburse.get('voucher_code')).first()
-            if voucher and voucher.retailer:
-                retailer = voucher.retailer
-                reimburse['retailer_address'] = retailer.address
-                reimburse['retailer_kelurahan'] = retailer.kelurahan
-                reimburse['retailer_kecamatan'] = retailer.kecamatan
-                reimburse['retailer_kota'] = retailer.kota
-                reimburse['retailer_provinsi'] = retailer.provinsi
-                
-            reimburse['transactions'] = transaction_serializer.data
-            for transaction in reimburse['transactions']:
-                transaction_id = transaction['id']
-                transaction_details = WholesaleTransactionDetail.objects.filter(transaction_id=transaction_id)
-                transaction_detail_serializer = WholesaleTransactionDetailSerializer(transaction_details, many=True)
-                transaction['details'] = transaction_detail_serializer.data
+    reimburses = reimburse_queryset(Reimburse.objects.filter(**filters))
+    paginator = KeysetPagination(ordering=('-reimbursed_at', '-id'))
+    page = paginator.paginate_queryset(reimburses, request)
+    # Semua relasi dimuat secara batch, jumlah query tidak tergantung jumlah baris
+    reimburse_data = reimburse_list(page if page is not None else reimburses.order_by('pk'))
 
+    if page is not None:
+        return paginator.get_paginated_response(reimburse_data)
     return Response(reimburse_data, status=http_status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reimburse_aging(request):
+    """Aging buckets of reimburses still waiting / completed (belum paid)"""
+    try:
+        buckets = [int(day) for day in request.query_params['buckets'].split(',')] if request.query_params.get('buckets') else reimbursements.AGING_BUCKETS
+    except ValueError:
+        return Response({"error": "buckets must be a comma separated list of days"}, status=http_status.HTTP_400_BAD_REQUEST)
+    if not buckets or min(buckets) <= 0:
+        return Response({"error": "buckets must be positive numbers of days"}, status=http_status.HTTP_400_BAD_REQUEST)
+
+    filters = {
+        'voucher__project_id': request.query_params.get('project_id'),
+        'wholesaler_id': request.query_params.get('wholesaler_id'),
+    }
+    filters = {k: v for k, v in filters.items() if v is not None}
+
+    now = timezone.now()
+    return Response({
+        "as_of": now,
+        "buckets": reimbursements.aging_labels(buckets),
+        "statuses": reimbursements.aging(Reimburse.objects.filter(**filters), buckets, now),
+    }, status=http_status.HTTP_200_OK)
+
 @api_view(['GET'])
 # @permission_classes([IsAuthenticated])
 def get_current_count(request):
@@ -758,25 +950,22 @@ class VoucherLimitViewSet(viewsets.ModelViewSet):
         
         if serializer.is_valid():
             increment = serializer.validated_data['increment']
-            new_count = voucher_limit.current_count + increment
-            
-            # Check if increment would exceed limit
-            if new_count > voucher_limit.limit:
+            try:
+                reservation = quota.reserve(increment, limit_id=voucher_limit.pk)
+            except quota.QuotaExceeded as e:
+                current = e.voucher_limit
                 return Response({
-                    'error': f'Cannot increment by {increment}. Would exceed limit of {voucher_limit.limit}',
-                    'current_count': voucher_limit.current_count,
-                    'limit': voucher_limit.limit,
-                    'remaining': voucher_limit.limit - voucher_limit.current_count
+                    'error': f'Cannot increment by {increment}. Would exceed limit of {current.limit}',
+                    'current_count': current.current_count,
+                    'limit': current.limit,
+                    'remaining': current.limit - current.current_count
                 }, status=http_status.HTTP_400_BAD_REQUEST)
             
-            voucher_limit.current_count = new_count
-            voucher_limit.save()
-            
             return Response({
                 'message': f'Voucher count incremented by {increment}',
-                'current_count': voucher_limit.current_count,
-                'limit': voucher_limit.limit,
-                'remaining': voucher_limit.limit - voucher_limit.current_count
+                'current_count': reservation.current_count,
+                'limit': reservation.limit,
+                'remaining': reservation.remaining
             }, status=http_status.HTTP_200_OK)
         
         return Response(serializer.errors, status=http_status.HTTP_400_BAD_REQUEST)
@@ -947,9 +1136,15 @@ class VoucherRetailerDiscountViewSet(viewsets.ModelViewSet):
             return Response({'error': 'voucher_code parameter required'}, status=http_status.HTTP_400_BAD_REQUEST)
 
         try:
-            voucher = Voucher.objects.get(code=voucher_code)
-            project = VoucherProject.objects.get(id=voucher.project_id)
-            discounts = self.get_queryset().filter(voucher_project=project)
+            voucher = Voucher.objects.select_related('project').get(code=voucher_code)
+            project = voucher.project
+            if project is None:
+                raise VoucherProject.DoesNotExist
+            if any(request.query_params.get(param) for param in ('project_id', 'min_amount', 'max_amount')):
+                discounts = self.get_queryset().filter(voucher_project=project)
+            else:
+                # Tanpa filter: diskon dari cache per project (office/discounts.py), urutan sama dengan get_queryset()
+                discounts = sorted(discount_cache.for_project(project.id), key=lambda discount: discount.created_at, reverse=True)
             serializer = self.get_serializer(discounts, many=True)
             # Tambahkan periode_start dan periode_end ke setiap item di serializer.data
             for item in serializer.data:
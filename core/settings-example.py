@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'office',
     'retailer',
     'wholesales',
+    'jobs',
     'rest_framework',
     'dj_rest_auth',
     'rest_framework.authtoken',
@@ -99,6 +100,30 @@ DATABASES = {
 }
 
 
+# Cache: CACHE_BACKEND = db (default), file atau redis; semuanya shared antar proses.
+# locmem (per proses) ditolak oleh `manage.py check` (office.E001, hanya warning jika DEBUG).
+# db membutuhkan `manage.py createcachetable`; redis membutuhkan package `redis`, CACHE_LOCATION mis. redis://host:6379/1
+CACHE_BACKENDS = {
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_DEFAULT_LOCATIONS = {
+    'db': 'django_cache',
+    'file': '/var/tmp/django_cache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'db').lower()
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    CACHE_BACKEND = 'db'
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS.get(CACHE_BACKEND, '')),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -152,6 +177,9 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.IsAuthenticatedOrReadOnly',
         'rest_framework.permissions.AllowAny',
     ),
+
+    # Opt-in: hanya aktif jika request mengirim ?cursor= atau ?page_size= (lihat api/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
 }
 
 # Configure JWT settings
@@ -89,6 +89,7 @@ INSTALLED_APPS = [
     'office',
     'retailer',
     'wholesales',
+    'jobs',
     'rest_framework',
     'dj_rest_auth',
     'rest_framework.authtoken',
@@ -295,8 +296,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+
+    # Opt-in: hanya aktif jika request mengirim ?cursor= atau ?page_size= (lihat api/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
 }
 
+# Ukuran halaman default / maksimum untuk KeysetPagination
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+
 # Configure JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),  # Duration for access tokens
@@ -347,3 +355,57 @@ EMAIL_USE_SSL = False
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Background job queue (jobs app, worker: python manage.py run_jobs)
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 30))  # detik, dikali 2 setiap retry
+JOBS_RETRY_MAX_DELAY = int(os.getenv('JOBS_RETRY_MAX_DELAY', 3600))
+JOBS_LOCK_TIMEOUT = int(os.getenv('JOBS_LOCK_TIMEOUT', 600))  # job running lebih lama dari ini dianggap worker mati
+
+# Pipeline foto retailer (retailer/images.py)
+RETAILER_PHOTO_FORMAT = os.getenv('RETAILER_PHOTO_FORMAT', 'JPEG')  # JPEG atau WEBP
+RETAILER_PHOTO_MAX_BYTES = int(os.getenv('RETAILER_PHOTO_MAX_BYTES', 500 * 1024))
+RETAILER_PHOTO_MAX_DIMENSION = int(os.getenv('RETAILER_PHOTO_MAX_DIMENSION', 2048))
+RETAILER_PHOTO_THUMBNAIL_SIZE = int(os.getenv('RETAILER_PHOTO_THUMBNAIL_SIZE', 320))
+RETAILER_PHOTO_MEDIUM_SIZE = int(os.getenv('RETAILER_PHOTO_MEDIUM_SIZE', 1024))
+
+# Export laporan (api/exports.py): jumlah baris yang diambil per fetch dari database
+REPORT_EXPORT_CHUNK_SIZE = int(os.getenv('REPORT_EXPORT_CHUNK_SIZE', 2000))
+
+# Cache: CACHE_BACKEND = db (default), file atau redis; semuanya shared antar proses/worker gunicorn.
+# Versi cache diskon dan data wilayah (office/discounts.py, office/regions.py) harus terlihat oleh semua
+# worker, jadi locmem (per proses) ditolak oleh `manage.py check` (office.E001; warning office.W001 jika DEBUG).
+# db membutuhkan `manage.py createcachetable`; redis membutuhkan package `redis`, CACHE_LOCATION mis. redis://host:6379/1
+CACHE_BACKENDS = {
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_DEFAULT_LOCATIONS = {
+    'db': 'django_cache',
+    'file': '/var/tmp/django_cache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'db').lower()
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    CACHE_BACKEND = 'db'
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS.get(CACHE_BACKEND, '')),
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', ''),
+    }
+}
+
+# Data wilayah / Kodepos (office/regions.py): interval cek versi data di shared cache dan max-age header Cache-Control (detik)
+REGION_INDEX_CHECK_INTERVAL = int(os.getenv('REGION_INDEX_CHECK_INTERVAL', 5))
+REGION_CACHE_MAX_AGE = int(os.getenv('REGION_CACHE_MAX_AGE', 60 * 60))
+
+# Cache diskon per project (office/discounts.py): interval cek versi di shared cache dan umur maksimum salinan lokal (detik)
+DISCOUNT_CACHE_CHECK_INTERVAL = int(os.getenv('DISCOUNT_CACHE_CHECK_INTERVAL', 5))
+DISCOUNT_CACHE_TTL = int(os.getenv('DISCOUNT_CACHE_TTL', 60))
+
+# Idempotency-Key (api/idempotency.py): berapa lama response disimpan untuk retry (detik)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+# Request yang masih diproses lebih lama dari ini (worker timeout/mati) boleh diambil alih oleh retry; > GUNICORN_TIMEOUT
+IDEMPOTENCY_KEY_LEASE = int(os.getenv('IDEMPOTENCY_KEY_LEASE', 60))
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from .models import Job, DeadJob
+from .queue import requeue
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'task')
+
+
+@admin.register(DeadJob)
+class DeadJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'attempts', 'failed_at')
+    list_filter = ('task',)
+    actions = ['requeue_jobs']
+
+    @admin.action(description="Requeue selected jobs")
+    def requeue_jobs(self, request, queryset):
+        for dead_job in queryset:
+            requeue(dead_job)
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from jobs.queue import run_pending
+
+
+class Command(BaseCommand):
+    help = "Worker antrian job: memproses job yang sudah jatuh tempo dari tabel jobs_job"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help="Jumlah job yang di-claim per polling")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Jeda (detik) saat antrian kosong")
+        parser.add_argument('--once', action='store_true', help="Proses job yang jatuh tempo lalu berhenti")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        self.stdout.write("Job worker started.")
+        try:
+            while True:
+                processed = run_pending(batch_size)
+                total += processed
+                if processed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Job worker stopped after {total} jobs."))
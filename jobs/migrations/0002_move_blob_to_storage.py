@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 01:07
+
+from django.db import migrations
+
+# Direktori foto mentah saat migrasi ini dibuat (sekarang diganti StagedFile, lihat 0003)
+PHOTO_UPLOAD_DIR = 'retailer_photos/incoming/'
+
+
+def move_blobs_to_storage(apps, schema_editor):
+    # Foto yang masih antri disimpan ke storage; payload membawa upload_key seperti job baru
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    for model_name in ('Job', 'DeadJob'):
+        model = apps.get_model('jobs', model_name)
+        for job in model.objects.filter(blob__isnull=False).iterator():
+            name = job.payload.get('name') or f'job-{job.pk}'
+            job.payload['upload_key'] = default_storage.save(f'{PHOTO_UPLOAD_DIR}{name}', ContentFile(bytes(job.blob)))
+            model.objects.filter(pk=job.pk).update(payload=job.payload)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_blobs_to_storage, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='deadjob',
+            name='blob',
+        ),
+        migrations.RemoveField(
+            model_name='job',
+            name='blob',
+        ),
+    ]
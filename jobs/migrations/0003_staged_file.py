@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def move_uploads_to_staged_files(apps, schema_editor):
+    # Foto antri yang sempat disimpan mentah di storage (0002) dipindah ke StagedFile
+    from django.core.files.storage import default_storage
+    StagedFile = apps.get_model('jobs', 'StagedFile')
+    for model_name in ('Job', 'DeadJob'):
+        model = apps.get_model('jobs', model_name)
+        for job in model.objects.filter(payload__has_key='upload_key').iterator():
+            payload = dict(job.payload)
+            upload_key = payload.pop('upload_key')
+            with default_storage.open(upload_key, 'rb') as f:
+                payload['staged_file_id'] = StagedFile.objects.create(name=payload.get('name') or upload_key, data=f.read()).pk
+            model.objects.filter(pk=job.pk).update(payload=payload)
+            default_storage.delete(upload_key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0002_move_blob_to_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(move_uploads_to_staged_files, migrations.RunPython.noop),
+    ]
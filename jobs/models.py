@@ -0,0 +1,52 @@
+from django.db import models
+from django.utils import timezone
+
+# Antrian job berbasis database, diproses oleh `manage.py run_jobs`
+class Job(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+    ]
+
+    task = models.CharField(max_length=255, help_text="Dotted path fungsi task, mis. retailer.tasks.send_registration_email")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='jobs_job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+# Job yang gagal setelah max_attempts dipindahkan ke sini untuk ditinjau / dijalankan ulang
+class DeadJob(models.Model):
+    task = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    failed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} (dead)"
+
+# Data biner (mis. foto registrasi) yang menunggu diproses job; disimpan terpisah dari Job
+# supaya claim() tidak ikut membaca byte-nya. Dihapus oleh task setelah selesai.
+class StagedFile(models.Model):
+    name = models.CharField(max_length=255)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
@@ -0,0 +1,117 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job, DeadJob, StagedFile
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(task, payload=None, run_at=None, max_attempts=None):
+    """
+    Add a job to the queue. `task` is the dotted path of a function called as
+    `task(**payload)`. Large data (photos) is put in a StagedFile with
+    stage_file() and only its id goes into the payload.
+
+    The row is inserted in the caller's transaction, so a job is only visible
+    to workers once the data it refers to has been committed.
+    """
+    return Job.objects.create(
+        task=task,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or _setting('JOBS_MAX_ATTEMPTS', 5),
+    )
+
+
+def stage_file(name, data):
+    """Keep binary data for a job in the database (not S3); returns the StagedFile id. The task deletes it when done."""
+    return StagedFile.objects.create(name=name, data=data).pk
+
+
+def backoff(attempts):
+    """Delay before the next attempt: JOBS_RETRY_DELAY * 2^(attempts-1), capped at JOBS_RETRY_MAX_DELAY"""
+    base = _setting('JOBS_RETRY_DELAY', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), _setting('JOBS_RETRY_MAX_DELAY', 3600)))
+
+
+def claim(batch_size=10):
+    """
+    Lock and mark up to `batch_size` due jobs as running.
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED so several workers can poll the
+    same table without handing out a job twice. Jobs left running longer than
+    JOBS_LOCK_TIMEOUT (worker died) are picked up again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=_setting('JOBS_LOCK_TIMEOUT', 600))
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=Job.STATUS_QUEUED, run_at__lte=now)
+                | Q(status=Job.STATUS_RUNNING, locked_at__lt=stale)
+            )
+            .order_by('run_at', 'id')[:batch_size]
+        )
+        for job in jobs:
+            job.status = Job.STATUS_RUNNING
+            job.locked_at = now
+            job.attempts += 1
+        Job.objects.bulk_update(jobs, ['status', 'locked_at', 'attempts'])
+    return jobs
+
+
+def run_job(job):
+    """Execute a claimed job; on failure reschedule it with backoff or move it to DeadJob"""
+    try:
+        func = import_string(job.task)
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception(f"Job {job} failed (attempt {job.attempts}/{job.max_attempts})")
+        with transaction.atomic():
+            if job.attempts >= job.max_attempts:
+                DeadJob.objects.create(
+                    task=job.task,
+                    payload=job.payload,
+                    attempts=job.attempts,
+                    last_error=error,
+                    created_at=job.created_at,
+                )
+                job.delete()
+            else:
+                Job.objects.filter(pk=job.pk).update(
+                    status=Job.STATUS_QUEUED,
+                    run_at=timezone.now() + backoff(job.attempts),
+                    locked_at=None,
+                    last_error=error,
+                )
+        return False
+
+    job.delete()
+    return True
+
+
+def run_pending(batch_size=10):
+    """Claim and run one batch of due jobs. Returns the number of jobs processed"""
+    jobs = claim(batch_size)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+def requeue(dead_job):
+    """Move a DeadJob back into the queue with a fresh attempt counter"""
+    with transaction.atomic():
+        job = enqueue(dead_job.task, dead_job.payload)
+        dead_job.delete()
+    return job
@@ -0,0 +1,139 @@
+import threading
+from datetime import timedelta
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from .models import Job, DeadJob
+from . import queue
+
+# Task dummy yang dipanggil lewat dotted path oleh run_job
+CALLS = []
+
+
+def record(**kwargs):
+    CALLS.append(kwargs)
+
+
+def fail(**kwargs):
+    raise RuntimeError("boom")
+
+
+class ClaimTest(TestCase):
+    def test_claims_due_jobs_in_order(self):
+        later = queue.enqueue('jobs.tests.record', run_at=timezone.now() + timedelta(hours=1))
+        second = queue.enqueue('jobs.tests.record', run_at=timezone.now() - timedelta(minutes=1))
+        first = queue.enqueue('jobs.tests.record', run_at=timezone.now() - timedelta(minutes=2))
+
+        jobs = queue.claim()
+
+        self.assertEqual([job.pk for job in jobs], [first.pk, second.pk])
+        for job in Job.objects.filter(pk__in=[first.pk, second.pk]):
+            self.assertEqual(job.status, Job.STATUS_RUNNING)
+            self.assertEqual(job.attempts, 1)
+            self.assertIsNotNone(job.locked_at)
+        self.assertEqual(Job.objects.get(pk=later.pk).status, Job.STATUS_QUEUED)
+        # Job yang sudah running tidak di-claim lagi
+        self.assertEqual(queue.claim(), [])
+
+    def test_respects_batch_size(self):
+        for _ in range(3):
+            queue.enqueue('jobs.tests.record')
+        self.assertEqual(len(queue.claim(batch_size=2)), 2)
+        self.assertEqual(len(queue.claim(batch_size=2)), 1)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=600)
+    def test_reclaims_stale_running_job(self):
+        stale = queue.enqueue('jobs.tests.record')
+        fresh = queue.enqueue('jobs.tests.record')
+        Job.objects.filter(pk=stale.pk).update(
+            status=Job.STATUS_RUNNING, attempts=1, locked_at=timezone.now() - timedelta(seconds=601)
+        )
+        Job.objects.filter(pk=fresh.pk).update(status=Job.STATUS_RUNNING, attempts=1, locked_at=timezone.now())
+
+        jobs = queue.claim()
+
+        self.assertEqual([job.pk for job in jobs], [stale.pk])
+        self.assertEqual(Job.objects.get(pk=stale.pk).attempts, 2)
+
+
+class SkipLockedTest(TransactionTestCase):
+    """A job locked by one worker is skipped, not waited for, by another"""
+
+    def test_locked_job_is_skipped(self):
+        locked = queue.enqueue('jobs.tests.record')
+        free = queue.enqueue('jobs.tests.record')
+        claimed = []
+
+        def other_worker():
+            try:
+                claimed.extend(job.pk for job in queue.claim())
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            Job.objects.select_for_update().get(pk=locked.pk)
+            worker = threading.Thread(target=other_worker)
+            worker.start()
+            worker.join(timeout=10)
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(claimed, [free.pk])
+
+
+@override_settings(JOBS_RETRY_DELAY=30, JOBS_RETRY_MAX_DELAY=3600)
+class RunJobTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_backoff_doubles_up_to_max(self):
+        self.assertEqual(queue.backoff(1), timedelta(seconds=30))
+        self.assertEqual(queue.backoff(2), timedelta(seconds=60))
+        self.assertEqual(queue.backoff(4), timedelta(seconds=240))
+        self.assertEqual(queue.backoff(20), timedelta(seconds=3600))
+
+    def test_success_deletes_job(self):
+        queue.enqueue('jobs.tests.record', {'photo_id': 7})
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(CALLS, [{'photo_id': 7}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_is_rescheduled_with_backoff(self):
+        job = queue.enqueue('jobs.tests.fail', max_attempts=3)
+        before = timezone.now()
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.locked_at)
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=30))
+        # Belum jatuh tempo, jadi tidak di-claim lagi
+        self.assertEqual(queue.run_pending(), 0)
+
+    def test_last_attempt_moves_job_to_dead_letter(self):
+        job = queue.enqueue('jobs.tests.fail', {'retailer_id': 3}, max_attempts=2)
+        Job.objects.filter(pk=job.pk).update(attempts=1)
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            queue.run_pending()
+
+        self.assertFalse(Job.objects.exists())
+        dead_job = DeadJob.objects.get()
+        self.assertEqual(dead_job.task, 'jobs.tests.fail')
+        self.assertEqual(dead_job.payload, {'retailer_id': 3})
+        self.assertEqual(dead_job.attempts, 2)
+        self.assertIn('RuntimeError: boom', dead_job.last_error)
+        self.assertEqual(dead_job.created_at, job.created_at)
+
+    def test_requeue_dead_job(self):
+        dead_job = DeadJob.objects.create(
+            task='jobs.tests.record', payload={'retailer_id': 3}, attempts=5, created_at=timezone.now()
+        )
+        job = queue.requeue(dead_job)
+
+        self.assertFalse(DeadJob.objects.exists())
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 0)
+        queue.run_pending()
+        self.assertEqual(CALLS, [{'retailer_id': 3}])
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.utils.module_loading import import_string
+
+# Backend yang isinya hanya ada di satu proses; invalidasi versi tidak sampai ke worker lain
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_process_local(alias='default'):
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    try:
+        backend_class = import_string(backend)
+    except ImportError:
+        return False
+    return any(issubclass(backend_class, import_string(path)) for path in PROCESS_LOCAL_CACHES)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    office.discounts and office.regions invalidate through a version key that
+    every process must see. Only a warning with DEBUG on, where runserver is a
+    single process.
+    """
+    if not cache_is_process_local():
+        return []
+    message = ("The default cache is local to one process, so discount and region cache invalidations "
+               "do not reach the other workers.")
+    hint = ("Set CACHE_BACKEND to db, file or redis (see CACHES in core/settings.py). "
+            "A single-process server may add '%s' to SILENCED_SYSTEM_CHECKS instead.")
+    if settings.DEBUG:
+        return [Warning(message, hint=hint % 'office.W001', id='office.W001')]
+    return [Error(message, hint=hint % 'office.E001', id='office.E001')]
@@ -0,0 +1,92 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import VoucherRetailerDiscount
+
+# Cache diskon per project: versi di shared cache, tabel lengkap di shared cache + memori proses.
+# Salinan lokal hanya dipakai selama DISCOUNT_CACHE_TTL detik, jadi kalau invalidasi terlewat
+# (cache eviction, backend bukan shared) data tetap di-reload dari database.
+VERSION_KEY = 'office:discounts:version'
+TABLE_KEY = 'office:discounts:{version}'
+
+_local = {'version': None, 'table': None, 'checked_at': 0.0, 'loaded_at': 0.0}
+_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _load_table():
+    """Every VoucherRetailerDiscount grouped by project (ordered by id), in one query"""
+    table = {}
+    for discount in VoucherRetailerDiscount.objects.select_related('voucher_project').order_by('pk'):
+        table.setdefault(discount.voucher_project_id, []).append(discount)
+    return table
+
+
+def _initial_version():
+    # Berbasis waktu, supaya key versi yang hilang (eviction) tidak kembali ke nomor lama
+    return time.time_ns()
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def table():
+    """
+    Return {project_id: [discounts]} for all projects.
+
+    The shared-cache version is read at most once per
+    DISCOUNT_CACHE_CHECK_INTERVAL seconds per process; the table itself is
+    reloaded after an invalidation or once the copy is DISCOUNT_CACHE_TTL
+    seconds old.
+    """
+    ttl = _setting('DISCOUNT_CACHE_TTL', 60)
+    with _lock:
+        now = time.monotonic()
+        fresh = _local['table'] is not None and now - _local['loaded_at'] < ttl
+        if fresh and now - _local['checked_at'] < _setting('DISCOUNT_CACHE_CHECK_INTERVAL', 5):
+            return _local['table']
+
+        version = _version()
+        if fresh and _local['version'] == version:
+            _local['checked_at'] = now
+            return _local['table']
+
+        key = TABLE_KEY.format(version=version)
+        # Versi sama tapi salinan sudah kedaluwarsa: ambil langsung dari database, bukan dari shared cache
+        discounts = cache.get(key) if _local['version'] != version else None
+        if discounts is None:
+            discounts = _load_table()
+            cache.set(key, discounts, ttl)
+        _local.update(version=version, table=discounts, checked_at=now, loaded_at=now)
+        return discounts
+
+
+def for_project(project_id, discounts=None):
+    """All discounts of a project, same order as VoucherRetailerDiscount.objects.filter(voucher_project_id=...)"""
+    discounts = table() if discounts is None else discounts
+    return discounts.get(project_id, [])
+
+
+def get(project_id, discounts=None):
+    """Discount terms used for pricing: the first discount of the project, or None"""
+    project_discounts = for_project(project_id, discounts)
+    return project_discounts[0] if project_discounts else None
+
+
+def invalidate():
+    """Bump the version so every process reloads the table on its next version check"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _initial_version(), None)
+    with _lock:
+        _local.update(version=None, table=None)
@@ -0,0 +1,254 @@
+import csv
+import io
+import os
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+from django.db import connection, transaction
+from django.utils import timezone
+from . import regions
+from .models import Kodepos
+
+COLUMNS = ('kodepos', 'kelurahan', 'kecamatan', 'kota', 'provinsi')
+# Lokasi yang mengidentifikasi satu baris; kodepos adalah nilai yang bisa di-update
+LOCATION = ('provinsi', 'kota', 'kecamatan', 'kelurahan')
+MAX_LENGTHS = {column: Kodepos._meta.get_field(column).max_length for column in COLUMNS}
+
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+
+class KodeposImportError(Exception):
+    pass
+
+
+def _clean(row):
+    values = [(value or '').strip() for value in row]
+    kodepos = values[0]
+    if kodepos.endswith('.0') and kodepos[:-2].isdigit():
+        # Sel angka dari Excel
+        kodepos = kodepos[:-2]
+    if kodepos.isdigit():
+        kodepos = kodepos.zfill(5)
+    values[0] = kodepos
+    return tuple(values)
+
+
+def _column_positions(header):
+    header = [(name or '').strip().lower() for name in header]
+    missing = [column for column in COLUMNS if column not in header]
+    if missing:
+        raise KodeposImportError(f"Missing column(s): {', '.join(missing)}")
+    return [header.index(column) for column in COLUMNS]
+
+
+def _rows(table):
+    """Rows (iterable of lists) with a header row -> cleaned tuples in COLUMNS order"""
+    table = iter(table)
+    positions = _column_positions(next(table, []))
+    for number, row in enumerate(table, start=2):
+        if not any((value or '').strip() for value in row):
+            continue
+        row = list(row) + [''] * (max(positions) + 1 - len(row))
+        values = _clean([row[position] for position in positions])
+        if not all(values):
+            raise KodeposImportError(f"Row {number}: every column ({', '.join(COLUMNS)}) is required")
+        # Dicek di sini supaya COPY ke staging tidak gagal dengan error truncation dari PostgreSQL
+        for column, value in zip(COLUMNS, values):
+            if len(value) > MAX_LENGTHS[column]:
+                raise KodeposImportError(
+                    f"Row {number}: {column} {value!r} is longer than {MAX_LENGTHS[column]} characters"
+                )
+        yield values
+
+
+def _csv_table(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from csv.reader(f)
+
+
+def _column_index(ref):
+    letters = re.match(r'[A-Z]+', ref).group()
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _xlsx_table(path):
+    """
+    Stream the first worksheet of an .xlsx file with the standard library
+    (the file is a zip of XML parts), without loading the sheet in memory.
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as f:
+                for _, element in iterparse(f):
+                    if element.tag == f'{XLSX_NS}si':
+                        shared.append(''.join(text.text or '' for text in element.iter(f'{XLSX_NS}t')))
+                        element.clear()
+
+        # Sheet pertama di workbook.xml -> path file XML-nya lewat workbook.xml.rels
+        sheet, first = 'xl/worksheets/sheet1.xml', None
+        with archive.open('xl/workbook.xml') as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{XLSX_NS}sheet':
+                    first = element.get(f'{REL_NS}id')
+                    break
+        if first and 'xl/_rels/workbook.xml.rels' in archive.namelist():
+            with archive.open('xl/_rels/workbook.xml.rels') as f:
+                for _, element in iterparse(f):
+                    if element.get('Id') == first:
+                        target = element.get('Target').lstrip('/')
+                        sheet = target if target.startswith('xl/') else f'xl/{target}'
+                        break
+
+        with archive.open(sheet) as f:
+            for _, element in iterparse(f):
+                if element.tag != f'{XLSX_NS}row':
+                    continue
+                row = []
+                for cell in element.iter(f'{XLSX_NS}c'):
+                    position = _column_index(cell.get('r')) if cell.get('r') else len(row)
+                    row.extend([''] * (position - len(row)))
+                    if cell.get('t') == 'inlineStr':
+                        value = ''.join(text.text or '' for text in cell.iter(f'{XLSX_NS}t'))
+                    else:
+                        value = cell.findtext(f'{XLSX_NS}v') or ''
+                        if cell.get('t') == 's' and value:
+                            value = shared[int(value)]
+                    row.append(value)
+                element.clear()
+                yield row
+
+
+def read_rows(path):
+    """Yield (kodepos, kelurahan, kecamatan, kota, provinsi) from a CSV or XLSX file with a header row"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return _rows(_csv_table(path))
+    if extension == '.xlsx':
+        return _rows(_xlsx_table(path))
+    raise KodeposImportError(f"Unsupported file type {extension!r}, expected .csv or .xlsx")
+
+
+class _CsvStream(io.RawIOBase):
+    """Readable file object producing CSV from a row iterator, for COPY ... FROM STDIN"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = b''
+        self.count = 0
+        self.error = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self._buffer) < len(target):
+            line = io.StringIO()
+            writer = csv.writer(line)
+            try:
+                for row in self._rows:
+                    writer.writerow(row)
+                    self.count += 1
+                    if line.tell() >= 64 * 1024:
+                        break
+            except (KodeposImportError, OSError) as e:
+                # psycopg2 membungkus error dari read() menjadi QueryCanceled; disimpan untuk di-raise ulang.
+                # File baru dibuka saat baris pertama dibaca, jadi OSError (file tidak ada) juga lewat sini
+                self.error = e
+                raise
+            chunk = line.getvalue().encode('utf-8')
+            if not chunk:
+                break
+            self._buffer += chunk
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _sql(template):
+    quote = connection.ops.quote_name
+    table = Kodepos._meta.db_table
+    return template.format(
+        table=quote(table),
+        columns=', '.join(COLUMNS),
+        location_match=' AND '.join(f's.{column} = c.{column}' for column in LOCATION),
+        partition=', '.join(LOCATION),
+    )
+
+
+def import_rows(rows, user, delete_missing=True, dry_run=False):
+    """
+    Replace the Kodepos table contents with `rows` in one transaction.
+
+    Rows are COPY'd into a temporary staging table and matched with the
+    current rows on (provinsi, kota, kecamatan, kelurahan) plus occurrence
+    number, so duplicated locations pair up deterministically. Unmatched
+    staged rows are inserted, matched rows with another kodepos updated and
+    (with delete_missing) current rows absent from the file deleted.
+    Returns a dict of counts.
+    """
+    if connection.vendor != 'postgresql':
+        raise KodeposImportError("import_kodepos needs PostgreSQL (COPY)")
+
+    now = timezone.now()
+    stream = _CsvStream(rows)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE kodepos_staging ("
+            + ', '.join(f'{column} varchar({MAX_LENGTHS[column]})' for column in COLUMNS)
+            + ") ON COMMIT DROP"
+        )
+        try:
+            cursor.copy_expert(_sql("COPY kodepos_staging ({columns}) FROM STDIN WITH (FORMAT csv)"), stream)
+        except Exception:
+            # copy_expert tidak dibungkus Django, error-nya langsung dari psycopg2
+            if stream.error:
+                raise stream.error from None
+            raise
+        if not stream.count:
+            raise KodeposImportError("The file has no rows; refusing to replace Kodepos with nothing")
+
+        cursor.execute(_sql(
+            "CREATE TEMPORARY TABLE kodepos_diff ON COMMIT DROP AS "
+            "SELECT c.id AS current_id, c.kodepos AS current_kodepos, s.staged, "
+            "s.kodepos, s.kelurahan, s.kecamatan, s.kota, s.provinsi "
+            "FROM (SELECT {columns}, true AS staged, "
+            "      row_number() OVER (PARTITION BY {partition} ORDER BY kodepos) AS n FROM kodepos_staging) s "
+            "FULL OUTER JOIN (SELECT id, {columns}, "
+            "      row_number() OVER (PARTITION BY {partition} ORDER BY kodepos, id) AS n FROM {table}) c "
+            "ON {location_match} AND s.n = c.n"
+        ))
+        # Temporary table tidak punya statistik; tanpa ANALYZE planner bisa memilih nested loop untuk UPDATE/DELETE
+        cursor.execute("ANALYZE kodepos_diff")
+
+        cursor.execute(_sql(
+            "INSERT INTO {table} ({columns}, created_at, created_by) "
+            "SELECT {columns}, %s, %s FROM kodepos_diff WHERE current_id IS NULL"
+        ), [now, user])
+        inserted = cursor.rowcount
+
+        cursor.execute(_sql(
+            "UPDATE {table} k SET kodepos = d.kodepos, updated_at = %s, updated_by = %s "
+            "FROM kodepos_diff d WHERE k.id = d.current_id AND d.staged AND d.kodepos <> d.current_kodepos"
+        ), [now, user])
+        updated = cursor.rowcount
+
+        deleted = 0
+        if delete_missing:
+            cursor.execute(_sql(
+                "DELETE FROM {table} k USING kodepos_diff d WHERE k.id = d.current_id AND d.staged IS NULL"
+            ))
+            deleted = cursor.rowcount
+
+        if dry_run:
+            transaction.set_rollback(True)
+        elif inserted or updated or deleted:
+            # Raw SQL tidak memicu signal Kodepos, jadi cache wilayah di-invalidate manual
+            transaction.on_commit(regions.invalidate)
+
+    return {'rows': stream.count, 'inserted': inserted, 'updated': updated, 'deleted': deleted}
@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from office.checks import cache_is_process_local
+from office.kodepos_import import KodeposImportError, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import data Kodepos dari file CSV/XLSX (kolom: kodepos, kelurahan, kecamatan, kota, provinsi) lewat COPY + diff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File .csv atau .xlsx dengan baris header")
+        parser.add_argument('--user', default='import_kodepos', help="Nilai created_by / updated_by")
+        parser.add_argument('--keep-missing', action='store_true', help="Jangan hapus Kodepos yang tidak ada di file")
+        parser.add_argument('--dry-run', action='store_true', help="Hitung perubahan lalu rollback")
+
+    def handle(self, *args, **options):
+        if cache_is_process_local() and not options['dry_run']:
+            # Versi cache wilayah hanya akan naik di proses command ini, web worker tidak melihatnya
+            raise CommandError(
+                "The default cache is local to this process, so the web workers would keep serving the old "
+                "region data. Configure a shared CACHE_BACKEND (db, file or redis) or use --dry-run."
+            )
+        started = time.monotonic()
+        try:
+            result = import_rows(
+                read_rows(options['path']),
+                user=options['user'][:50],
+                delete_missing=not options['keep_missing'],
+                dry_run=options['dry_run'],
+            )
+        except (KodeposImportError, OSError) as e:
+            raise CommandError(str(e))
+
+        summary = (
+            f"{result['rows']} rows read: {result['inserted']} inserted, {result['updated']} updated, "
+            f"{result['deleted']} deleted in {time.monotonic() - started:.1f}s"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run, nothing saved. {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
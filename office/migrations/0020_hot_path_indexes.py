@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('office', '0019_voucherproject_voucherretailerdiscount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kodepos',
+            index=models.Index(fields=['provinsi', 'kota', 'kecamatan', 'kelurahan', 'kodepos'], name='kodepos_region_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-18 00:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_status_events(apps, schema_editor):
+    # Riwayat lama tidak bisa direkonstruksi (ReimburseStatus lama tidak punya referensi balik).
+    # Per reimburse dibuat event 'waiting' saat submit, ditambah event status saat ini jika sudah lanjut.
+    Reimburse = apps.get_model('office', 'Reimburse')
+    ReimburseStatusEvent = apps.get_model('office', 'ReimburseStatusEvent')
+    rows = Reimburse.objects.order_by('pk').values_list(
+        'pk', 'reimbursed_at', 'reimbursed_by', 'status__status', 'status__status_at', 'status__status_by'
+    )
+    events, current = [], []
+    for pk, reimbursed_at, reimbursed_by, status, status_at, status_by in rows.iterator(chunk_size=2000):
+        status = status or 'waiting'
+        status_at = status_at or reimbursed_at
+        if status == 'waiting':
+            events.append(ReimburseStatusEvent(reimburse_id=pk, status='waiting', at=status_at, by=status_by or reimbursed_by))
+        else:
+            events.append(ReimburseStatusEvent(reimburse_id=pk, status='waiting', at=reimbursed_at, by=reimbursed_by))
+            events.append(ReimburseStatusEvent(reimburse_id=pk, status=status, at=status_at, by=status_by))
+        current.append(Reimburse(pk=pk, current_status=status, current_status_at=status_at))
+        if len(current) >= 2000:
+            ReimburseStatusEvent.objects.bulk_create(events)
+            Reimburse.objects.bulk_update(current, ['current_status', 'current_status_at'])
+            events, current = [], []
+    ReimburseStatusEvent.objects.bulk_create(events)
+    Reimburse.objects.bulk_update(current, ['current_status', 'current_status_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('office', '0020_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReimburseStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting for Reimburse'), ('completed', 'Reimburse Completed'), ('paid', 'Reimburse Paid')], max_length=20)),
+                ('at', models.DateTimeField()),
+                ('by', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='reimburse',
+            name='current_status',
+            field=models.CharField(choices=[('waiting', 'Waiting for Reimburse'), ('completed', 'Reimburse Completed'), ('paid', 'Reimburse Paid')], default='waiting', help_text='Status pembayaran terakhir', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='reimburse',
+            name='current_status_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reimburse',
+            index=models.Index(fields=['current_status', 'current_status_at'], name='reimburse_current_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='reimbursestatusevent',
+            name='reimburse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='office.reimburse'),
+        ),
+        migrations.AddIndex(
+            model_name='reimbursestatusevent',
+            index=models.Index(fields=['reimburse', 'at'], name='reimburse_event_at_idx'),
+        ),
+        migrations.RunPython(backfill_status_events, migrations.RunPython.noop),
+    ]
@@ -50,6 +50,12 @@ class Kodepos(models.Model):
 
     def __str__(self):
         return f"{self.kodepos} - {self.kelurahan}, {self.kecamatan}, {self.kota}"
+
+    class Meta:
+        indexes = [
+            # Urutan hierarki wilayah: load index wilayah (office/regions.py), diff import_kodepos dan filter provinsi/kota
+            models.Index(fields=['provinsi', 'kota', 'kecamatan', 'kelurahan', 'kodepos'], name='kodepos_region_idx'),
+        ]
     
 
 class Item(models.Model):
@@ -66,6 +72,12 @@ class Item(models.Model):
         return self.name
     
 # Model untuk Reimburse Voucher
+REIMBURSE_STATUS_CHOICES = [
+    ('waiting', 'Waiting for Reimburse'),
+    ('completed', 'Reimburse Completed'),
+    ('paid', 'Reimburse Paid'),
+]
+
 class Reimburse(models.Model):
     voucher = models.ForeignKey('retailer.Voucher', on_delete=models.CASCADE)
     retailer = models.ForeignKey('retailer.Retailer', on_delete=models.CASCADE, null=True, blank=True)
@@ -73,6 +85,14 @@ class Reimburse(models.Model):
     reimbursed_at = models.DateTimeField(auto_now_add=True)
     reimbursed_by = models.CharField(max_length=50, null=True, blank=True)
     status = models.ForeignKey('ReimburseStatus', on_delete=models.CASCADE, null=True, blank=True, related_name='reimburses')
+    # Denormalisasi dari event terakhir di ReimburseStatusEvent, untuk filter dan aging tanpa join
+    current_status = models.CharField(
+        max_length=20,
+        choices=REIMBURSE_STATUS_CHOICES,
+        default='waiting',
+        help_text="Status pembayaran terakhir"
+    )
+    current_status_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Reimburse {self.voucher.code} by {self.wholesaler.name}"
@@ -80,13 +100,15 @@ class Reimburse(models.Model):
     def get_latest_status(self):
         return self.status.status, self.status.status_at
 
+    class Meta:
+        indexes = [
+            # Filter per status dan aging (umur status saat ini)
+            models.Index(fields=['current_status', 'current_status_at'], name='reimburse_current_status_idx'),
+        ]
+
 # Model untuk status pembayaran Reimburse
 class ReimburseStatus(models.Model):
-    STATUS_CHOICES = [
-        ('waiting', 'Waiting for Reimburse'),
-        ('completed', 'Reimburse Completed'),
-        ('paid', 'Reimburse Paid'),
-    ]
+    STATUS_CHOICES = REIMBURSE_STATUS_CHOICES
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -102,6 +124,27 @@ class ReimburseStatus(models.Model):
     def get_reimburses(self):
         return self.reimburses.all()
 
+# Riwayat status Reimburse (append-only): satu baris per perubahan status
+class ReimburseStatusEvent(models.Model):
+    reimburse = models.ForeignKey(Reimburse, on_delete=models.CASCADE, related_name='status_events')
+    status = models.CharField(max_length=20, choices=REIMBURSE_STATUS_CHOICES)
+    at = models.DateTimeField()
+    by = models.CharField(max_length=50, null=True, blank=True)
+
+    def __str__(self):
+        return f"Reimburse {self.reimburse_id} {self.status} at {self.at}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("ReimburseStatusEvent is append-only")
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Riwayat per reimburse berurutan waktu, dan "status per tanggal X"
+            models.Index(fields=['reimburse', 'at'], name='reimburse_event_at_idx'),
+        ]
+
 class VoucherLimit(models.Model):
     description = models.CharField(max_length=100, null=True, blank=True)
     limit = models.IntegerField(default=0)
@@ -0,0 +1,59 @@
+from collections import namedtuple
+from django.db import connection
+from .models import VoucherLimit
+
+
+class Reservation(namedtuple('Reservation', ['limit_id', 'current_count', 'limit'])):
+    """Result of a successful quota reservation (values after the UPDATE)"""
+
+    @property
+    def remaining(self):
+        return self.limit - self.current_count
+
+
+class QuotaExceeded(Exception):
+    """Raised when a reservation would push current_count above limit"""
+
+    def __init__(self, voucher_limit, amount):
+        self.voucher_limit = voucher_limit
+        self.amount = amount
+        super().__init__(f'Cannot increment by {amount}. Would exceed limit of {voucher_limit.limit}')
+
+
+def _target_limits(limit_id=None, project_id=None):
+    if limit_id is not None:
+        return VoucherLimit.objects.filter(pk=limit_id)
+    # Sama seperti VoucherLimit.objects.filter(voucher_project=project_id).first()
+    return VoucherLimit.objects.filter(voucher_project_id=project_id).order_by('pk')[:1]
+
+
+def reserve(amount=1, limit_id=None, project_id=None):
+    """
+    Reserve `amount` vouchers on a VoucherLimit, selected by id or by project.
+
+    Runs a single conditional `UPDATE ... WHERE current_count + n <= limit
+    RETURNING ...`, so concurrent workers never lose increments and the row is
+    only locked for the duration of the statement (or the caller's transaction).
+    Raises VoucherLimit.DoesNotExist if no limit matches and QuotaExceeded when
+    the remaining capacity is smaller than `amount`.
+    """
+    qn = connection.ops.quote_name
+    target_sql, target_params = _target_limits(limit_id, project_id).values('pk').query.sql_with_params()
+    sql = (
+        f"UPDATE {qn(VoucherLimit._meta.db_table)} "
+        f"SET {qn('current_count')} = {qn('current_count')} + %s "
+        f"WHERE {qn('id')} IN ({target_sql}) AND {qn('current_count')} + %s <= {qn('limit')} "
+        f"RETURNING {qn('id')}, {qn('current_count')}, {qn('limit')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [amount, *target_params, amount])
+        row = cursor.fetchone()
+
+    if row:
+        return Reservation(*row)
+
+    # Jalur gagal: cari tahu apakah limit tidak ada atau sudah penuh
+    voucher_limit = _target_limits(limit_id, project_id).first()
+    if voucher_limit is None:
+        raise VoucherLimit.DoesNotExist("Voucher limit not found.")
+    raise QuotaExceeded(voucher_limit, amount)
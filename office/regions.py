@@ -0,0 +1,245 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from django.conf import settings
+from django.core.cache import cache
+from .models import Kodepos
+
+# Data wilayah (provinsi -> kota -> kecamatan -> kelurahan -> kodepos) dilayani dari index di memori proses.
+# Versi disimpan di shared cache dan dinaikkan setiap ada perubahan Kodepos; index dibangun ulang jika versinya berubah.
+VERSION_KEY = 'office:regions:version'
+
+LEVELS = ('provinsi', 'kota', 'kecamatan', 'kelurahan', 'kodepos')
+PROVINSI, KOTA, KECAMATAN, KELURAHAN, KODEPOS = range(len(LEVELS))
+SEARCH_LEVELS = ('kelurahan', 'kecamatan')
+DETAIL_FIELDS = ['kodepos', 'kelurahan', 'kecamatan', 'kota', 'provinsi']
+
+
+class RegionIndex:
+    """
+    Read-only region hierarchy built from one Kodepos query.
+
+    Nodes of each level live in flat lists sorted by their path, so the
+    children of a node are a contiguous range of the next level: `first[level][i]`
+    is the index of node i's first child and `parent[level][i]` its parent.
+    Names are interned so repeated names share one string object.
+    """
+
+    def __init__(self, rows):
+        self.names = [[] for _ in LEVELS]
+        self.parent = [array('i') for _ in LEVELS]
+        self.first = [array('i') for _ in LEVELS]
+        # rows: (provinsi, kota, kecamatan, kelurahan, kodepos) urut berdasarkan path
+        previous = (None,) * len(LEVELS)
+        for row in rows:
+            row = tuple(sys.intern(value or '') for value in row)
+            # Level pertama yang berbeda dari baris sebelumnya: node baru mulai dari level itu
+            changed = next((level for level in range(len(LEVELS)) if row[level] != previous[level]), None)
+            if changed is None:
+                continue
+            for level in range(changed, len(LEVELS)):
+                self.names[level].append(row[level])
+                self.parent[level].append(len(self.names[level - 1]) - 1 if level else -1)
+                self.first[level].append(len(self.names[level + 1]) if level + 1 < len(LEVELS) else -1)
+            previous = row
+
+        self.by_name = []
+        for names in self.names:
+            nodes = {}
+            for i, name in enumerate(names):
+                nodes.setdefault(name, array('i')).append(i)
+            self.by_name.append(nodes)
+
+        # Index prefix search: nama lowercase terurut, untuk bisect
+        self.search_keys = {}
+        for level_name in SEARCH_LEVELS:
+            level = LEVELS.index(level_name)
+            self.search_keys[level] = sorted((name.lower(), name) for name in self.by_name[level])
+        self._tree = None
+
+    @classmethod
+    def load(cls):
+        rows = Kodepos.objects.order_by('provinsi', 'kota', 'kecamatan', 'kelurahan', 'kodepos').values_list(
+            'provinsi', 'kota', 'kecamatan', 'kelurahan', 'kodepos'
+        )
+        return cls(rows.iterator(chunk_size=5000))
+
+    def children(self, level, i):
+        end = self.first[level][i + 1] if i + 1 < len(self.first[level]) else len(self.names[level + 1])
+        return range(self.first[level][i], end)
+
+    def path(self, level, i):
+        """Names from provinsi down to node i of `level`"""
+        names = []
+        while level >= 0:
+            names.append(self.names[level][i])
+            i, level = self.parent[level][i], level - 1
+        return names[::-1]
+
+    def distinct(self, level, parent_name=None):
+        """Distinct names of `level`, optionally only under parents (level - 1) named `parent_name`"""
+        if parent_name is None:
+            return sorted(self.by_name[level])
+        names = set()
+        for i in self.by_name[level - 1].get(parent_name, ()):
+            names.update(self.names[level][child] for child in self.children(level - 1, i))
+        return sorted(names)
+
+    def detail(self, **filters):
+        """
+        First kodepos row (by kodepos) matching the given names, or None.
+        Starts from the nodes of the most specific filtered level, not every row.
+        """
+        level = max((LEVELS.index(field) for field in filters), default=PROVINSI)
+        nodes = self.by_name[level].get(filters[LEVELS[level]], ()) if filters else range(len(self.names[level]))
+        matches = []
+        for i in nodes:
+            path = self.path(level, i)
+            if all(path[LEVELS.index(field)] == value for field, value in filters.items()):
+                matches.extend(self._rows_under(level, i, path))
+        if not matches:
+            return None
+        match = min(matches, key=lambda row: row['kodepos'])
+        return {field: match[field] for field in DETAIL_FIELDS}
+
+    def _rows_under(self, level, i, path):
+        if level == KODEPOS:
+            return [dict(zip(LEVELS, path))]
+        rows = []
+        for child in self.children(level, i):
+            rows.extend(self._rows_under(level + 1, child, path + [self.names[level + 1][child]]))
+        return rows
+
+    def tree(self):
+        """{provinsi: {kota: {kecamatan: {kelurahan: [kodepos, ...]}}}}"""
+        def build(level, nodes):
+            if level == KODEPOS:
+                return [self.names[level][i] for i in nodes]
+            return {self.names[level][i]: build(level + 1, self.children(level, i)) for i in nodes}
+        return build(PROVINSI, range(len(self.names[PROVINSI])))
+
+    def search(self, query, level='kelurahan', limit=20):
+        """
+        Prefix (typeahead) search over kelurahan or kecamatan names, case-insensitive.
+        Each hit carries its full path and kodepos list.
+        """
+        level = LEVELS.index(level)
+        keys = self.search_keys[level]
+        query = query.lower()
+        results = []
+        position = bisect_left(keys, (query,))
+        while position < len(keys) and keys[position][0].startswith(query) and len(results) < limit:
+            for i in self.by_name[level][keys[position][1]]:
+                hit = dict(zip(LEVELS, self.path(level, i)))
+                if level == KELURAHAN:
+                    hit['kodepos'] = [self.names[KODEPOS][child] for child in self.children(level, i)]
+                results.append(hit)
+                if len(results) >= limit:
+                    break
+            position += 1
+        return results
+
+    def lookup(self, name, **params):
+        if name == 'kodepos':
+            return sorted(self.by_name[KODEPOS])
+        if name in ('provinsi', 'kota', 'kecamatan', 'kelurahan'):
+            level = LEVELS.index(name)
+            parent_name = params.get(LEVELS[level - 1]) if level else None
+            return self.distinct(level, parent_name or None)
+        if name == 'detail':
+            return self.detail(**params)
+        if name == 'tree':
+            # Index read-only, jadi tree cukup dibangun sekali per versi
+            if self._tree is None:
+                self._tree = self.tree()
+            return self._tree
+        if name == 'search':
+            return self.search(**params)
+        raise KeyError(name)
+
+
+_local = {'version': None, 'index': None, 'index_version': None, 'checked_at': 0.0}
+# Semua perubahan _local lewat lock ini; lock hanya dipegang sebentar (tanpa I/O), supaya
+# request ETag/304 tidak menunggu index yang sedang dibangun
+_lock = threading.Lock()
+# Hanya satu thread yang membangun index; thread lain menunggu hasilnya, bukan ikut membangun
+_build_lock = threading.Lock()
+
+
+def _initial_version():
+    # Berbasis waktu, supaya key versi yang hilang (eviction) tidak kembali ke nomor lama
+    return time.time_ns()
+
+
+def version():
+    """
+    Current data version. The shared cache is read at most once per
+    REGION_INDEX_CHECK_INTERVAL seconds per process.
+    """
+    now = time.monotonic()
+    with _lock:
+        if _local['version'] is not None and now - _local['checked_at'] < getattr(settings, 'REGION_INDEX_CHECK_INTERVAL', 5):
+            return _local['version']
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        cache.add(VERSION_KEY, _initial_version(), None)
+        current = cache.get(VERSION_KEY)
+    with _lock:
+        _local.update(version=current, checked_at=now)
+    return current
+
+
+def invalidate():
+    """Bump the version so every process rebuilds its index (and every ETag changes)"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _initial_version(), None)
+    with _lock:
+        _local.update(version=None, index=None, index_version=None)
+
+
+def _current_index(current_version):
+    with _lock:
+        if _local['index'] is not None and _local['index_version'] == current_version:
+            return _local['index']
+    return None
+
+
+def index():
+    """The RegionIndex for the current version, built lazily on first use"""
+    current = _current_index(version())
+    if current is not None:
+        return current
+    with _build_lock:
+        # Versi dibaca ulang: thread lain mungkin sudah membangun index untuk versi ini
+        current_version = version()
+        current = _current_index(current_version)
+        if current is not None:
+            return current
+        # Dibangun di luar _lock. Ditandai dengan versi sebelum load, jadi invalidate()
+        # selama load membuat index ini dibangun ulang pada request berikutnya
+        built = RegionIndex.load()
+        with _lock:
+            _local.update(index=built, index_version=current_version)
+        return built
+
+
+def _digest(name, params):
+    raw = json.dumps([name, sorted(params.items())], ensure_ascii=False)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def etag(name, params, current_version):
+    """ETag of a lookup: changes only when the Kodepos data version changes"""
+    return f'{current_version}-{_digest(name, params)[:16]}'
+
+
+def get(name, params):
+    """Result of lookup `name` with `params` (None values are ignored), served from the index"""
+    params = {key: value for key, value in params.items() if value is not None}
+    return index().lookup(name, **params)
@@ -0,0 +1,183 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Case, CharField, Count, Min, Value, When
+from django.utils import timezone
+from retailer.models import Voucher
+from .models import Reimburse, ReimburseStatus, ReimburseStatusEvent
+
+
+def record_events(reimburse_ids, status, at, username):
+    """Append one status event per reimburse (riwayat status, lihat ReimburseStatusEvent)"""
+    ReimburseStatusEvent.objects.bulk_create([
+        ReimburseStatusEvent(reimburse_id=reimburse_id, status=status, at=at, by=username) for reimburse_id in reimburse_ids
+    ])
+
+
+def submit(voucher_codes, username):
+    """
+    Submit reimbursements for many voucher codes at once.
+
+    Codes are resolved with one IN query (vouchers locked so parallel
+    submissions of the same code wait for each other), already-submitted
+    vouchers are found with one more query, and the statuses, reimburses and
+    lifecycle states are written with bulk_create / one UPDATE inside a single
+    transaction. Returns one result per code, in request order, with the same
+    messages as the per-code flow.
+    """
+    now = timezone.now()
+    results = []
+    with transaction.atomic():
+        vouchers = {
+            voucher.code: voucher
+            for voucher in Voucher.objects.select_related('retailer').select_for_update(of=('self',)).filter(
+                code__in={str(code) for code in voucher_codes}
+            )
+        }
+        submitted = set(
+            Reimburse.objects.filter(voucher_id__in=[voucher.pk for voucher in vouchers.values()]).values_list('voucher_id', flat=True)
+        )
+
+        accepted = []
+        for voucher_code in voucher_codes:
+            voucher = vouchers.get(str(voucher_code))
+            if voucher is None:
+                results.append({"voucher_code": voucher_code, "error": "Voucher not found"})
+            elif voucher.pk in submitted:
+                results.append({"voucher_code": voucher_code, "error": "This voucher has already been submitted"})
+            elif not voucher.redeemed:
+                results.append({"voucher_code": voucher_code, "error": "This voucher has not been redeemed"})
+            elif voucher.retailer.wholesale_id is None:
+                results.append({"voucher_code": voucher_code, "error": "Retailer of this voucher has no wholesaler"})
+            else:
+                # Kode yang sama dua kali dalam satu request: yang kedua dianggap sudah disubmit
+                submitted.add(voucher.pk)
+                accepted.append(voucher)
+                results.append({"voucher_code": voucher_code, "status": "submitted"})
+
+        if accepted:
+            statuses = ReimburseStatus.objects.bulk_create([
+                ReimburseStatus(status='waiting', status_at=now, status_by=username) for _ in accepted
+            ])
+            reimburses = Reimburse.objects.bulk_create([
+                Reimburse(
+                    voucher=voucher,
+                    retailer_id=voucher.retailer_id,
+                    wholesaler_id=voucher.retailer.wholesale_id,
+                    status=status,
+                    current_status='waiting',
+                    current_status_at=now,
+                    reimbursed_by=username,
+                )
+                for voucher, status in zip(accepted, statuses)
+            ])
+            record_events([reimburse.pk for reimburse in reimburses], 'waiting', now, username)
+            # Sama dengan Voucher.set_lifecycle_state: voucher yang ditolak tetap REJECTED
+            Voucher.objects.filter(pk__in=[voucher.pk for voucher in accepted], is_rejected=False).update(
+                lifecycle_state=Voucher.STATE_WAITING, lifecycle_state_at=now
+            )
+    return results
+
+
+# Status asal (Reimburse.current_status) yang boleh dipindah ke status tujuan
+TRANSITIONS = {
+    'completed': ('waiting',),
+    'paid': ('waiting', 'completed'),
+}
+OUTCOMES = ('updated', 'unchanged', 'invalid_transition', 'not_found')
+
+
+def transition(reimburses, new_status, username, requested_ids=None):
+    """
+    Move every reimburse in the `reimburses` queryset to `new_status`.
+
+    The outcome of each row (updated / unchanged / invalid_transition) is
+    computed in SQL from current_status and TRANSITIONS, with the rows
+    locked. One ReimburseStatus row per updated reimburse is bulk_created,
+    Reimburse.status / current_status are set with a single UPDATE ... FROM
+    and the history events are bulk_created. Ids in
+    `requested_ids` that did not match count as not_found.
+    Returns a dict of counts per outcome.
+    """
+    now = timezone.now()
+    counts = dict.fromkeys(OUTCOMES, 0)
+    with transaction.atomic():
+        # Urut pk supaya dua batch yang beririsan mengunci baris dengan urutan yang sama
+        rows = reimburses.order_by('pk').select_for_update(of=('self',)).annotate(
+            outcome=Case(
+                When(current_status=new_status, then=Value('unchanged')),
+                When(current_status__in=TRANSITIONS[new_status], then=Value('updated')),
+                default=Value('invalid_transition'),
+                output_field=CharField(),
+            ),
+        ).values_list('id', 'voucher_id', 'outcome')
+
+        updated = []
+        matched = set()
+        for reimburse_id, voucher_id, outcome in rows:
+            matched.add(reimburse_id)
+            counts[outcome] += 1
+            if outcome == 'updated':
+                updated.append((reimburse_id, voucher_id))
+        if requested_ids is not None:
+            counts['not_found'] = len(set(requested_ids) - matched)
+
+        if updated:
+            statuses = ReimburseStatus.objects.bulk_create([
+                ReimburseStatus(status=new_status, status_at=now, status_by=username) for _ in updated
+            ])
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {connection.ops.quote_name(Reimburse._meta.db_table)} r "
+                    "SET status_id = v.status_id, current_status = %s, current_status_at = %s "
+                    "FROM unnest(%s::bigint[], %s::bigint[]) AS v(reimburse_id, status_id) "
+                    "WHERE r.id = v.reimburse_id",
+                    [new_status, now, [reimburse_id for reimburse_id, _ in updated], [status.pk for status in statuses]],
+                )
+            record_events([reimburse_id for reimburse_id, _ in updated], new_status, now, username)
+            Voucher.objects.filter(pk__in=[voucher_id for _, voucher_id in updated], is_rejected=False).update(
+                lifecycle_state=new_status, lifecycle_state_at=now
+            )
+    return counts
+
+
+# Status yang masih "menunggu" (belum paid) dan batas bucket aging dalam hari
+AGING_STATUSES = ('waiting', 'completed')
+AGING_BUCKETS = (7, 14, 30, 60)
+
+
+def aging_labels(buckets=AGING_BUCKETS):
+    edges = sorted(set(buckets))
+    return [f"0-{edges[0]}d"] + [f"{low}-{high}d" for low, high in zip(edges, edges[1:])] + [f"{edges[-1]}d+"]
+
+
+def aging(reimburses, buckets=AGING_BUCKETS, now=None):
+    """
+    How long reimburses have been sitting in waiting / completed, grouped
+    into day buckets by current_status_at. Bucketing and counting run in
+    one GROUP BY query on (current_status, current_status_at).
+    Returns {status: {'total', 'oldest_at', 'buckets': {label: count}}}.
+    """
+    now = now or timezone.now()
+    edges = sorted(set(buckets))
+    labels = aging_labels(edges)
+    bucket = Case(
+        *[When(current_status_at__gt=now - timedelta(days=edge), then=Value(label)) for edge, label in zip(edges, labels)],
+        default=Value(labels[-1]),
+        output_field=CharField(),
+    )
+    rows = (
+        reimburses.filter(current_status__in=AGING_STATUSES)
+        .annotate(bucket=bucket)
+        .values('current_status', 'bucket')
+        .annotate(total=Count('id'), oldest_at=Min('current_status_at'))
+        .order_by()
+    )
+
+    result = {status: {'total': 0, 'oldest_at': None, 'buckets': dict.fromkeys(labels, 0)} for status in AGING_STATUSES}
+    for row in rows:
+        status = result[row['current_status']]
+        status['buckets'][row['bucket']] = row['total']
+        status['total'] += row['total']
+        if row['oldest_at'] and (status['oldest_at'] is None or row['oldest_at'] < status['oldest_at']):
+            status['oldest_at'] = row['oldest_at']
+    return result
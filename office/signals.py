@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import discounts, regions
+from .models import Kodepos, VoucherProject, VoucherRetailerDiscount
+
+
+@receiver(post_save, sender=VoucherRetailerDiscount)
+@receiver(post_delete, sender=VoucherRetailerDiscount)
+@receiver(post_save, sender=VoucherProject)
+@receiver(post_delete, sender=VoucherProject)
+def invalidate_discount_cache(sender, **kwargs):
+    # Setelah commit, supaya proses lain tidak me-reload data yang belum ter-commit
+    transaction.on_commit(discounts.invalidate)
+
+
+@receiver(post_save, sender=Kodepos)
+@receiver(post_delete, sender=Kodepos)
+def invalidate_region_cache(sender, **kwargs):
+    transaction.on_commit(regions.invalidate)
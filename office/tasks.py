@@ -0,0 +1,6 @@
+from .twilio import send_whatsapp_voucher as _send_whatsapp_voucher
+
+
+def send_whatsapp_voucher(retailer_id):
+    """Job task: kirim kode voucher ke WhatsApp retailer via Twilio"""
+    return _send_whatsapp_voucher(retailer_id)
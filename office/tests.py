@@ -1,3 +1,384 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from . import discounts, quota, regions
+from .checks import check_shared_cache
+from .kodepos_import import KodeposImportError, import_rows, read_rows
+from .models import Kodepos, VoucherLimit, VoucherProject, VoucherRetailerDiscount
 
 # Create your tests here.
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    """A process-local default cache fails the check, except as a warning while DEBUG is on"""
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'}})
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES=LOCMEM, DEBUG=False)
+    def test_locmem_is_an_error(self):
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['office.E001'])
+
+    @override_settings(CACHES=LOCMEM, DEBUG=True)
+    def test_locmem_is_a_warning_with_debug(self):
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['office.W001'])
+
+
+@override_settings(CACHES=LOCMEM)
+class RegionIndexLockTest(SimpleTestCase):
+    """Building the region index must not block version() (ETag/304 requests)"""
+
+    def setUp(self):
+        cache.clear()
+        regions.invalidate()
+        self.addCleanup(regions.invalidate)
+
+    def test_version_is_served_while_index_builds(self):
+        loading, release = threading.Event(), threading.Event()
+        built = regions.RegionIndex([('Jawa Barat', 'Bandung', 'Coblong', 'Dago', '40135')])
+
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return built
+
+        results = []
+        with mock.patch.object(regions.RegionIndex, 'load', side_effect=slow_load) as load:
+            builders = [threading.Thread(target=lambda: results.append(regions.index())) for _ in range(2)]
+            for builder in builders:
+                builder.start()
+            self.assertTrue(loading.wait(5))
+
+            reader = threading.Thread(target=regions.version)
+            reader.start()
+            reader.join(timeout=2)
+            self.assertFalse(reader.is_alive())
+
+            release.set()
+            for builder in builders:
+                builder.join(timeout=5)
+
+        # Single-flight: thread kedua memakai index yang dibangun thread pertama
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(results, [built, built])
+
+    def test_index_built_before_invalidate_is_rebuilt(self):
+        first = regions.RegionIndex([])
+        second = regions.RegionIndex([])
+        with mock.patch.object(regions.RegionIndex, 'load', side_effect=[first, second]):
+            self.assertIs(regions.index(), first)
+            self.assertIs(regions.index(), first)
+            regions.invalidate()
+            self.assertIs(regions.index(), second)
+
+
+class QuotaReserveTest(TestCase):
+    """quota.reserve() increments current_count with one conditional UPDATE, never past limit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = VoucherProject.objects.create(name='Project')
+        cls.voucher_limit = VoucherLimit.objects.create(limit=5, current_count=3, voucher_project=cls.project)
+
+    def test_reserve_by_id(self):
+        with self.assertNumQueries(1):
+            reservation = quota.reserve(2, limit_id=self.voucher_limit.pk)
+        self.assertEqual(reservation, (self.voucher_limit.pk, 5, 5))
+        self.assertEqual(reservation.remaining, 0)
+        self.voucher_limit.refresh_from_db()
+        self.assertEqual(self.voucher_limit.current_count, 5)
+
+    def test_reserve_by_project_uses_first_limit(self):
+        VoucherLimit.objects.create(limit=100, voucher_project=self.project)
+        reservation = quota.reserve(project_id=self.project.pk)
+        self.assertEqual(reservation.limit_id, self.voucher_limit.pk)
+        self.assertEqual(reservation.current_count, 4)
+
+    def test_exceeding_limit_leaves_count_unchanged(self):
+        with self.assertRaises(quota.QuotaExceeded) as raised:
+            quota.reserve(3, limit_id=self.voucher_limit.pk)
+        self.assertEqual(raised.exception.amount, 3)
+        self.assertEqual(raised.exception.voucher_limit.current_count, 3)
+        self.assertEqual(str(raised.exception), 'Cannot increment by 3. Would exceed limit of 5')
+        self.voucher_limit.refresh_from_db()
+        self.assertEqual(self.voucher_limit.current_count, 3)
+
+    def test_missing_limit(self):
+        with self.assertRaises(VoucherLimit.DoesNotExist):
+            quota.reserve(limit_id=0)
+        with self.assertRaises(VoucherLimit.DoesNotExist):
+            quota.reserve(project_id=VoucherProject.objects.create(name='Tanpa limit').pk)
+
+
+class QuotaConcurrencyTest(TransactionTestCase):
+    """A reservation waiting on another one re-checks the limit against the committed count"""
+
+    def test_last_slot_goes_to_one_reservation(self):
+        voucher_limit = VoucherLimit.objects.create(limit=5, current_count=4)
+        outcome = []
+
+        def other_worker():
+            try:
+                quota.reserve(limit_id=voucher_limit.pk)
+                outcome.append('reserved')
+            except quota.QuotaExceeded:
+                outcome.append('exceeded')
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            quota.reserve(limit_id=voucher_limit.pk)
+            worker = threading.Thread(target=other_worker)
+            worker.start()
+            # Worker menunggu lock baris sampai transaksi ini commit
+            worker.join(timeout=0.5)
+            self.assertTrue(worker.is_alive())
+        worker.join(timeout=10)
+
+        self.assertEqual(outcome, ['exceeded'])
+        voucher_limit.refresh_from_db()
+        self.assertEqual(voucher_limit.current_count, 5)
+
+
+@override_settings(DISCOUNT_CACHE_CHECK_INTERVAL=60, DISCOUNT_CACHE_TTL=600)
+class DiscountCacheTest(TestCase):
+    """office.discounts serves the table from memory and reloads it after writes are committed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = VoucherProject.objects.create(name='Project')
+        cls.discount = VoucherRetailerDiscount.objects.create(discount_amount=10000, discount_percentage=10, voucher_project=cls.project)
+
+    def setUp(self):
+        discounts.invalidate()
+        self.addCleanup(discounts.invalidate)
+
+    def amounts(self):
+        return [int(discount.discount_amount) for discount in discounts.for_project(self.project.pk)]
+
+    def test_table_is_served_from_memory(self):
+        self.assertEqual(discounts.get(self.project.pk), self.discount)
+        self.assertIsNone(discounts.get(0))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.amounts(), [10000])
+
+    def test_discount_writes_invalidate_after_commit(self):
+        self.amounts()
+        with self.captureOnCommitCallbacks(execute=True):
+            VoucherRetailerDiscount.objects.create(discount_amount=5000, discount_percentage=5, voucher_project=self.project)
+        self.assertEqual(self.amounts(), [10000, 5000])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.discount.delete()
+        self.assertEqual(self.amounts(), [5000])
+
+    def test_project_writes_invalidate_after_commit(self):
+        self.assertEqual(discounts.get(self.project.pk).voucher_project.name, 'Project')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.name = 'Renamed'
+            self.project.save()
+        self.assertEqual(discounts.get(self.project.pk).voucher_project.name, 'Renamed')
+
+    def test_no_invalidation_before_commit(self):
+        self.amounts()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            VoucherRetailerDiscount.objects.create(discount_amount=5000, discount_percentage=5, voucher_project=self.project)
+        self.assertEqual(callbacks, [discounts.invalidate])
+        self.assertEqual(self.amounts(), [10000])
+
+    @override_settings(DISCOUNT_CACHE_CHECK_INTERVAL=0)
+    def test_invalidation_from_another_process(self):
+        self.amounts()
+        # Proses lain: data berubah lalu versi di shared cache dinaikkan, salinan lokal di sini tidak disentuh
+        VoucherRetailerDiscount.objects.filter(pk=self.discount.pk).update(discount_amount=7500)
+        self.assertEqual(self.amounts(), [10000])
+        cache.incr(discounts.VERSION_KEY)
+        self.assertEqual(self.amounts(), [7500])
+
+    @override_settings(DISCOUNT_CACHE_CHECK_INTERVAL=0, DISCOUNT_CACHE_TTL=0)
+    def test_expired_copy_is_reloaded_without_invalidation(self):
+        self.amounts()
+        VoucherRetailerDiscount.objects.filter(pk=self.discount.pk).update(discount_amount=7500)
+        self.assertEqual(self.amounts(), [7500])
+
+
+class KodeposImportTest(TestCase):
+    """import_kodepos reads CSV/XLSX, validates every row and applies only the diff against Kodepos"""
+
+    HEADER = ['kodepos', 'kelurahan', 'kecamatan', 'kota', 'provinsi']
+
+    def setUp(self):
+        regions.invalidate()
+        self.addCleanup(regions.invalidate)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.dago = Kodepos.objects.create(kodepos='40135', kelurahan='Dago', kecamatan='Coblong', kota='Bandung', provinsi='Jawa Barat')
+        self.cihapit = Kodepos.objects.create(kodepos='40114', kelurahan='Cihapit', kecamatan='Bandung Wetan', kota='Bandung', provinsi='Jawa Barat')
+        self.babakan = Kodepos.objects.create(kodepos='16125', kelurahan='Babakan', kecamatan='Bogor Tengah', kota='Bogor', provinsi='Jawa Barat')
+
+    def write_csv(self, rows, header=HEADER):
+        path = os.path.join(self.directory, 'kodepos.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows([header, *rows])
+        return path
+
+    def write_xlsx(self, rows, header=HEADER):
+        """Minimal workbook: teks lewat sharedStrings, kodepos sebagai sel angka seperti dari Excel"""
+        shared = []
+
+        def cell(ref, value):
+            if isinstance(value, str):
+                shared.append(value)
+                return f'<c r="{ref}" t="s"><v>{len(shared) - 1}</v></c>'
+            return f'<c r="{ref}"><v>{value}</v></c>'
+
+        xml_rows = []
+        for number, row in enumerate([header, *rows], start=1):
+            cells = ''.join(cell(f'{"ABCDE"[i]}{number}', value) for i, value in enumerate(row))
+            xml_rows.append(f'<row r="{number}">{cells}</row>')
+        ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        rel_ns = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+        path = os.path.join(self.directory, 'kodepos.xlsx')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('xl/workbook.xml', f'<workbook {ns} {rel_ns}><sheets><sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>')
+            archive.writestr(
+                'xl/_rels/workbook.xml.rels',
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Target="worksheets/data.xml"/></Relationships>',
+            )
+            archive.writestr('xl/worksheets/data.xml', f'<worksheet {ns}><sheetData>{"".join(xml_rows)}</sheetData></worksheet>')
+            archive.writestr('xl/sharedStrings.xml', f'<sst {ns}>' + ''.join(f'<si><t>{value}</t></si>' for value in shared) + '</sst>')
+        return path
+
+    def rows(self):
+        return sorted(Kodepos.objects.values_list('kodepos', 'kelurahan', 'kecamatan', 'kota', 'provinsi'))
+
+    def test_read_csv(self):
+        # Urutan kolom mengikuti header (huruf besar/kecil bebas), baris kosong dilewati
+        path = self.write_csv(
+            [['Jawa Barat', 'Bandung', 'Coblong', ' Dago ', '40135'], [], ['Jawa Barat', 'Bandung', 'Bandung Wetan', 'Cihapit', '4011']],
+            header=['Provinsi', 'Kota', 'Kecamatan', 'Kelurahan', 'Kodepos'],
+        )
+        self.assertEqual(list(read_rows(path)), [
+            ('40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'),
+            ('04011', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat'),
+        ])
+
+    def test_read_xlsx(self):
+        path = self.write_xlsx([[40135, 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'], ['4011.0', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat']])
+        self.assertEqual(list(read_rows(path)), [
+            ('40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'),
+            ('04011', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat'),
+        ])
+
+    def test_missing_columns(self):
+        path = self.write_csv([['40135', 'Dago', 'Bandung']], header=['kodepos', 'kelurahan', 'kota'])
+        with self.assertRaisesMessage(KodeposImportError, 'Missing column(s): kecamatan, provinsi'):
+            list(read_rows(path))
+
+    def test_empty_value(self):
+        path = self.write_csv([['40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'], ['40114', '', 'Bandung Wetan', 'Bandung', 'Jawa Barat']])
+        with self.assertRaisesMessage(KodeposImportError, 'Row 3: every column'):
+            list(read_rows(path))
+
+    def test_value_too_long(self):
+        path = self.write_csv([['401350', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat']])
+        with self.assertRaisesMessage(KodeposImportError, "Row 2: kodepos '401350' is longer than 5 characters"):
+            list(read_rows(path))
+
+    def test_unsupported_extension(self):
+        with self.assertRaisesMessage(KodeposImportError, "Unsupported file type '.xls'"):
+            read_rows(os.path.join(self.directory, 'kodepos.xls'))
+
+    def test_import_applies_diff(self):
+        path = self.write_csv([
+            ['40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'],
+            ['40115', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat'],
+            ['50241', 'Candisari', 'Candisari', 'Semarang', 'Jawa Tengah'],
+        ])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            result = import_rows(read_rows(path), user='tester')
+        self.assertEqual(result, {'rows': 3, 'inserted': 1, 'updated': 1, 'deleted': 1})
+        self.assertEqual(callbacks, [regions.invalidate])
+        self.assertEqual(self.rows(), [
+            ('40115', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat'),
+            ('40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'),
+            ('50241', 'Candisari', 'Candisari', 'Semarang', 'Jawa Tengah'),
+        ])
+        # Baris yang sama tidak disentuh, baris yang berubah di-update di tempat (id tetap)
+        self.dago.refresh_from_db()
+        self.assertIsNone(self.dago.updated_at)
+        self.cihapit.refresh_from_db()
+        self.assertEqual((self.cihapit.kodepos, self.cihapit.updated_by), ('40115', 'tester'))
+        self.assertEqual(Kodepos.objects.get(kota='Semarang').created_by, 'tester')
+
+    def test_import_xlsx_keep_missing(self):
+        path = self.write_xlsx([[40135, 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'], [40132, 'Dago', 'Coblong', 'Bandung', 'Jawa Barat']])
+        result = import_rows(read_rows(path), user='tester', delete_missing=False)
+        # Lokasi duplikat dipasangkan per urutan kodepos: baris lama (n=1) menjadi 40132, 40135 di-insert lagi
+        self.assertEqual(result, {'rows': 2, 'inserted': 1, 'updated': 1, 'deleted': 0})
+        self.dago.refresh_from_db()
+        self.assertEqual(self.dago.kodepos, '40132')
+        self.assertEqual(sorted(Kodepos.objects.filter(kelurahan='Dago').values_list('kodepos', flat=True)), ['40132', '40135'])
+        self.assertTrue(Kodepos.objects.filter(pk=self.babakan.pk).exists())
+
+    def test_unchanged_file_does_not_invalidate(self):
+        path = self.write_csv([
+            ['40135', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat'],
+            ['40114', 'Cihapit', 'Bandung Wetan', 'Bandung', 'Jawa Barat'],
+            ['16125', 'Babakan', 'Bogor Tengah', 'Bogor', 'Jawa Barat'],
+        ])
+        with self.captureOnCommitCallbacks() as callbacks:
+            result = import_rows(read_rows(path), user='tester')
+        self.assertEqual(result, {'rows': 3, 'inserted': 0, 'updated': 0, 'deleted': 0})
+        self.assertEqual(callbacks, [])
+
+    def test_invalid_row_rolls_back(self):
+        path = self.write_csv([['50241', 'Candisari', 'Candisari', 'Semarang', 'Jawa Tengah'], ['401350', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat']])
+        before = self.rows()
+        with self.assertRaisesMessage(KodeposImportError, 'Row 3: kodepos'):
+            import_rows(read_rows(path), user='tester')
+        self.assertEqual(self.rows(), before)
+
+    def test_empty_file_is_refused(self):
+        path = self.write_csv([])
+        with self.assertRaisesMessage(KodeposImportError, 'The file has no rows'):
+            import_rows(read_rows(path), user='tester')
+        self.assertEqual(Kodepos.objects.count(), 3)
+
+    def test_command_dry_run(self):
+        path = self.write_csv([['50241', 'Candisari', 'Candisari', 'Semarang', 'Jawa Tengah']])
+        before = self.rows()
+        out = io.StringIO()
+        call_command('import_kodepos', path, '--dry-run', stdout=out)
+        self.assertIn('Dry run, nothing saved. 1 rows read: 1 inserted, 0 updated, 3 deleted', out.getvalue())
+        self.assertEqual(self.rows(), before)
+
+    def test_command_reports_errors(self):
+        path = self.write_csv([['401350', 'Dago', 'Coblong', 'Bandung', 'Jawa Barat']])
+        with self.assertRaisesMessage(CommandError, "Row 2: kodepos '401350'"):
+            call_command('import_kodepos', path, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'No such file or directory'):
+            call_command('import_kodepos', os.path.join(self.directory, 'missing.csv'), stdout=io.StringIO())
+
+    @override_settings(CACHES=LOCMEM)
+    def test_command_refuses_process_local_cache(self):
+        path = self.write_csv([['50241', 'Candisari', 'Candisari', 'Semarang', 'Jawa Tengah']])
+        with self.assertRaisesMessage(CommandError, 'The default cache is local to this process'):
+            call_command('import_kodepos', path, stdout=io.StringIO())
+        self.assertEqual(Kodepos.objects.count(), 3)
+        # --dry-run tidak menyimpan apa pun, jadi tetap boleh
+        call_command('import_kodepos', path, '--dry-run', stdout=io.StringIO())
@@ -10,6 +10,7 @@ import json
 from retailer.models import RetailerPhoto, Retailer, Voucher
 from .models import VoucherLimit, VoucherProject, VoucherRetailerDiscount
 from .twilio import send_whatsapp_voucher  # Impor fungsi kirim WhatsApp
+from . import quota
 
 # Fungsi untuk verifikasi foto oleh kantor dan mengirimkan voucher
 def verify_photo(request, retailer_id):
@@ -35,7 +36,7 @@ def verify_photo(request, retailer_id):
         # Setelah verifikasi, redirect ke laporan verifikasi
         if is_verified:
             # Kirim voucher melalui WhatsApp jika disetujui
-            # send_whatsapp_voucher(photos[0].retailer.id)  # Kirim voucher untuk retailer pertama
+            # enqueue('office.tasks.send_whatsapp_voucher', {'retailer_id': retailer.id})  # Kirim voucher lewat job worker
             return redirect('office:office_verification_report')
 
     context = {
@@ -336,28 +337,25 @@ def voucher_limit_detail(request, limit_id):
 def voucher_limit_increment(request, limit_id):
     """Increment current count for voucher limit"""
     try:
-        limit = get_object_or_404(VoucherLimit, id=limit_id)
         data = json.loads(request.body)
-        increment = data.get('increment', 1)
+        increment = int(data.get('increment', 1))
         
-        # Check if increment would exceed limit
-        new_count = limit.current_count + increment
-        if new_count > limit.limit:
+        # Increment atomik, gagal jika melebihi limit
+        try:
+            reservation = quota.reserve(increment, limit_id=limit_id)
+        except quota.QuotaExceeded as e:
             return JsonResponse({
                 'success': False,
-                'message': f'Cannot increment. Would exceed limit of {limit.limit}'
+                'message': f'Cannot increment. Would exceed limit of {e.voucher_limit.limit}'
             }, status=400)
         
-        limit.current_count = new_count
-        limit.save()
-        
         return JsonResponse({
             'success': True,
             'message': f'Voucher count incremented by {increment}',
             'data': {
-                'id': limit.id,
-                'current_count': limit.current_count,
-                'remaining': limit.limit - limit.current_count,
+                'id': reservation.limit_id,
+                'current_count': reservation.current_count,
+                'remaining': reservation.remaining,
             }
         })
         
@@ -0,0 +1,135 @@
+import os
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.conf import settings
+
+# Ekstensi file per format output
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'WEBP': '.webp',
+}
+
+MIN_QUALITY = 40
+MAX_QUALITY = 90
+# Jumlah langkah binary search skala (presisi ~1/64) jika kualitas minimum masih terlalu besar
+SCALE_SEARCH_STEPS = 6
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def output_format():
+    fmt = _setting('RETAILER_PHOTO_FORMAT', 'JPEG').upper()
+    return fmt if fmt in FORMAT_EXTENSIONS else 'JPEG'
+
+
+def rendition_name(name, fmt, suffix=''):
+    """Original upload name with the extension of the output format, e.g. foto.png -> foto_thumb.webp"""
+    base = os.path.splitext(os.path.basename(name))[0] or 'photo'
+    return f"{base}{suffix}{FORMAT_EXTENSIONS[fmt]}"
+
+
+def load_image(data, max_dimension):
+    """
+    Decode image bytes once, bounded to `max_dimension` on the longest side.
+
+    JPEG uses draft mode so the decoder downsamples by 1/2, 1/4 or 1/8 while
+    decoding instead of materialising the full-resolution bitmap. EXIF
+    orientation is applied so phone photos are stored upright.
+    """
+    img = Image.open(BytesIO(data))
+    if img.format == 'JPEG':
+        img.draft('RGB', (max_dimension, max_dimension))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return img
+
+
+def encode(img, fmt, quality):
+    img_io = BytesIO()
+    img.save(img_io, format=fmt, quality=quality, optimize=fmt == 'JPEG')
+    return img_io.getvalue()
+
+
+def _scaled(img, scale):
+    size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    return img.resize(size, Image.LANCZOS)
+
+
+def fit_to_size(img, max_bytes, fmt):
+    """
+    Encode `img` at the highest quality that fits in `max_bytes`.
+
+    Binary search over quality (MIN_QUALITY..MAX_QUALITY); if even the lowest
+    quality is too big, binary search the largest scale that fits at
+    MIN_QUALITY. Uses at most ~13 encodes regardless of the input size.
+    """
+    data = encode(img, fmt, MAX_QUALITY)
+    if len(data) <= max_bytes:
+        return data
+
+    best = None
+    lo, hi = MIN_QUALITY, MAX_QUALITY - 1
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        data = encode(img, fmt, quality)
+        if len(data) <= max_bytes:
+            best, lo = data, quality + 1
+        else:
+            hi = quality - 1
+    if best is not None:
+        return best
+
+    smallest = data
+    lo, hi = 0.0, 1.0
+    for _ in range(SCALE_SEARCH_STEPS):
+        scale = (lo + hi) / 2
+        data = encode(_scaled(img, scale), fmt, MIN_QUALITY)
+        if len(data) <= max_bytes:
+            best, lo = data, scale
+        else:
+            smallest, hi = data, scale
+    # Jika tidak ada yang muat, pakai hasil terkecil yang pernah dicoba
+    return best if best is not None else smallest
+
+
+def make_thumbnail(img, size, fmt, quality=75):
+    thumb = img.copy()
+    thumb.thumbnail((size, size), Image.LANCZOS)
+    return encode(thumb, fmt, quality)
+
+
+def rendition_sizes():
+    """Longest side (px) per RetailerPhoto rendition field"""
+    return {
+        'thumbnail': _setting('RETAILER_PHOTO_THUMBNAIL_SIZE', 320),
+        'medium': _setting('RETAILER_PHOTO_MEDIUM_SIZE', 1024),
+    }
+
+
+def make_renditions(img, fmt):
+    """Encode every rendition of an already decoded image: {field: bytes}"""
+    return {field: make_thumbnail(img, size, fmt) for field, size in rendition_sizes().items()}
+
+
+def process_photo(data):
+    """
+    Run an uploaded photo through the pipeline.
+
+    Returns (format, image_bytes, renditions): the main image fitted to
+    RETAILER_PHOTO_MAX_BYTES and the thumbnail / medium renditions.
+    """
+    fmt = output_format()
+    img = load_image(data, _setting('RETAILER_PHOTO_MAX_DIMENSION', 2048))
+    image = fit_to_size(img, _setting('RETAILER_PHOTO_MAX_BYTES', 500 * 1024), fmt)
+    return fmt, image, make_renditions(img, fmt)
+
+
+def process_renditions(data):
+    """Renditions only, for photos whose main image is already stored"""
+    fmt = output_format()
+    img = load_image(data, max(rendition_sizes().values()))
+    return fmt, make_renditions(img, fmt)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from retailer.models import Voucher
+from retailer.voucher_status import lifecycle_state_expressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-sync Voucher.lifecycle_state / lifecycle_state_at from approval, redeem and reimburse data. "
+        "Data lama sudah diisi migrasi 0015; command ini untuk memperbaiki state yang tidak sinkron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Jumlah voucher (range id) per UPDATE")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = Voucher.objects.aggregate(min_id=Min('id'), max_id=Max('id'))
+        if bounds['min_id'] is None:
+            self.stdout.write("No vouchers to backfill.")
+            return
+
+        state, state_at = lifecycle_state_expressions()
+        updated = 0
+        # Update per range id supaya lock tabel tidak terlalu lama
+        for start in range(bounds['min_id'], bounds['max_id'] + 1, batch_size):
+            with transaction.atomic():
+                updated += Voucher.objects.filter(id__gte=start, id__lt=start + batch_size).update(
+                    lifecycle_state=state,
+                    lifecycle_state_at=state_at,
+                )
+            self.stdout.write(f"Backfilled vouchers up to id {start + batch_size - 1}")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled lifecycle state for {updated} vouchers."))
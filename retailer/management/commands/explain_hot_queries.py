@@ -0,0 +1,121 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from office.models import Kodepos, VoucherProject
+from retailer.models import Retailer, RetailerPhoto, Voucher
+from wholesales.models import Wholesale
+
+MODELS = (Retailer, RetailerPhoto, Voucher, Kodepos, Wholesale)
+PROJECTS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN ANALYZE query-query utama (filter voucher/retailer/foto/wholesale/kodepos). "
+        "--seed mengisi data sintetis dan --compare mengulang tanpa Meta.indexes; "
+        "semua perubahan di-rollback. Jangan dijalankan di database production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Jumlah voucher sintetis (beserta retailer dan foto) yang dibuat sementara")
+        parser.add_argument('--compare', action='store_true', help="Ulangi EXPLAIN setelah index Meta.indexes di-drop sementara")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("explain_hot_queries needs PostgreSQL")
+
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+            with connection.cursor() as cursor:
+                for model in MODELS:
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+            queries = self.queries()
+            self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+            with_indexes = self.explain_all(queries)
+
+            if options['compare']:
+                sid = transaction.savepoint()
+                with connection.cursor() as cursor:
+                    for model in MODELS:
+                        for index in model._meta.indexes:
+                            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(index.name)}")
+                self.stdout.write(self.style.MIGRATE_HEADING("Without Meta.indexes"))
+                without_indexes = self.explain_all(queries)
+                transaction.savepoint_rollback(sid)
+
+                self.stdout.write(self.style.MIGRATE_HEADING("Summary (ms, without -> with)"))
+                for label in with_indexes:
+                    self.stdout.write(f"  {label}: {without_indexes[label]:.2f} -> {with_indexes[label]:.2f}")
+
+            # Data sintetis dan index yang di-drop tidak pernah disimpan
+            transaction.set_rollback(True)
+
+    def seed(self, vouchers):
+        wholesales = max(vouchers // 1000, 1)
+        self.stdout.write(f"Seeding {wholesales} wholesales, {vouchers} retailers, vouchers and photos...")
+        table = lambda model: connection.ops.quote_name(model._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table(Wholesale)} (name, phone_number, created_at, is_active, path, level) "
+                "SELECT 'Bench WS ' || g, '62' || g, now(), true, '', 0 FROM generate_series(1, %s) g RETURNING id",
+                [wholesales],
+            )
+            first_wholesale = min(row[0] for row in cursor.fetchall())
+            cursor.execute(
+                f"INSERT INTO {table(VoucherProject)} (name, is_active, created_at) "
+                "SELECT 'Bench project ' || g, true, now() FROM generate_series(1, %s) g RETURNING id",
+                [PROJECTS],
+            )
+            first_project = min(row[0] for row in cursor.fetchall())
+            cursor.execute(
+                f"INSERT INTO {table(Retailer)} (name, phone_number, address, created_at, wholesale_id) "
+                "SELECT 'Bench ' || g, '628' || lpad(g::text, 10, '0'), '-', now() - g * interval '1 minute', %s + g %% %s "
+                "FROM generate_series(1, %s) g RETURNING id",
+                [first_wholesale, wholesales, vouchers],
+            )
+            first_retailer = min(row[0] for row in cursor.fetchall())
+            # Distribusi kasar: 75% sudah redeem, 2% ditolak, 5% foto belum diverifikasi
+            cursor.execute(
+                f"INSERT INTO {table(Voucher)} (code, retailer_id, project_id, is_approved, is_rejected, redeemed, created_at, lifecycle_state, lifecycle_state_at) "
+                "SELECT 'BENCH' || g, %s + g - 1, %s + g %% %s, g %% 3 = 0, g %% 50 = 0, g %% 4 <> 0, now() - g * interval '1 minute', 'pending', now() "
+                "FROM generate_series(1, %s) g",
+                [first_retailer, first_project, PROJECTS, vouchers],
+            )
+            cursor.execute(
+                f"INSERT INTO {table(RetailerPhoto)} (retailer_id, image, is_verified, is_approved, is_rejected) "
+                "SELECT %s + g - 1, 'retailer_photos/bench.jpg', g %% 20 <> 0, g %% 20 <> 0, false "
+                "FROM generate_series(1, %s) g",
+                [first_retailer, vouchers],
+            )
+
+    def queries(self):
+        """(label, queryset) per hot filter path, with parameters sampled from the data"""
+        retailer = Retailer.objects.order_by('-id').values('id', 'phone_number', 'wholesale_id').first() or {}
+        project = Voucher.objects.filter(redeemed=False).exclude(project=None).values_list('project_id', flat=True).first()
+        wholesale = Wholesale.objects.order_by('-id').values_list('name', flat=True).first()
+        kota = Kodepos.objects.values_list('provinsi', 'kota').first() or ('', '')
+        return [
+            ("retailer by phone_number", Retailer.objects.filter(phone_number=retailer.get('phone_number'))),
+            ("retailers of wholesale, newest page", Retailer.objects.filter(wholesale_id=retailer.get('wholesale_id')).order_by('-created_at', '-id')[:100]),
+            ("vouchers newest page", Voucher.objects.order_by('-created_at', '-id')[:100]),
+            ("unredeemed vouchers of project", Voucher.objects.filter(project_id=project, redeemed=False)),
+            ("photo verification queue", RetailerPhoto.objects.filter(is_verified=False).values('retailer').annotate(total=Count('id'))),
+            ("wholesale by name", Wholesale.objects.filter(name=wholesale)),
+            ("kodepos of provinsi/kota", Kodepos.objects.filter(provinsi=kota[0], kota=kota[1]).order_by('kecamatan', 'kelurahan')),
+        ]
+
+    def explain_all(self, queries):
+        timings = {}
+        for label, queryset in queries:
+            plan = queryset.explain(analyze=True)
+            lines = plan.splitlines()
+            timings[label] = next(
+                (float(line.split(':')[1].split()[0]) for line in lines if line.startswith('Execution Time')), 0.0
+            )
+            self.stdout.write(f"{label} ({timings[label]:.2f} ms)")
+            for line in lines:
+                if 'Scan' in line:
+                    self.stdout.write(f"    {line.strip()}")
+        return timings
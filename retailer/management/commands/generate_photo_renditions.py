@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from jobs.queue import enqueue
+from retailer.models import RetailerPhoto
+from retailer.tasks import generate_photo_renditions
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail / medium renditions for RetailerPhoto rows that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help="Proses langsung di command ini, bukan lewat job worker")
+
+    def handle(self, *args, **options):
+        photo_ids = (
+            RetailerPhoto.objects.exclude(image='')
+            .filter(Q(thumbnail__isnull=True) | Q(thumbnail='') | Q(medium__isnull=True) | Q(medium=''))
+            .values_list('id', flat=True)
+            .order_by('id')
+        )
+        count = 0
+        for photo_id in photo_ids.iterator():
+            if options['sync']:
+                generate_photo_renditions(photo_id)
+            else:
+                enqueue('retailer.tasks.generate_photo_renditions', {'photo_id': photo_id})
+            count += 1
+
+        action = "Generated" if options['sync'] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{action} renditions for {count} photos."))
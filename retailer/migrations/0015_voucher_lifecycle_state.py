@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 00:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_lifecycle_state(apps, schema_editor):
+    # Isi lifecycle_state dari data approval/redeem/reimburse yang sudah ada, per range id
+    from retailer.voucher_status import lifecycle_state_expressions
+    Voucher = apps.get_model('retailer', 'Voucher')
+    state, state_at = lifecycle_state_expressions(
+        apps.get_model('office', 'Reimburse'), apps.get_model('wholesales', 'VoucherRedeem')
+    )
+    bounds = Voucher.objects.aggregate(min_id=models.Min('id'), max_id=models.Max('id'))
+    if bounds['min_id'] is None:
+        return
+    for start in range(bounds['min_id'], bounds['max_id'] + 1, 10000):
+        Voucher.objects.filter(id__gte=start, id__lt=start + 10000).update(
+            lifecycle_state=state, lifecycle_state_at=state_at
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retailer', '0014_voucher_project'),
+        ('wholesales', '0010_wholesale_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='lifecycle_state',
+            field=models.CharField(choices=[('pending', 'PENDING'), ('rejected', 'REJECTED'), ('received', 'RECEIVED'), ('redeemed', 'REDEEMED'), ('waiting', 'WAITING REIMBURSE'), ('completed', 'REIMBURSE COMPLETED'), ('paid', 'REIMBURSE PAID')], db_index=True, default='pending', help_text='Status siklus voucher (denormalisasi dari approval, redeem dan reimburse)', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='lifecycle_state_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.RunPython(backfill_lifecycle_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('retailer', '0016_retailerphoto_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='retailerphoto',
+            name='medium',
+            field=models.ImageField(blank=True, null=True, upload_to='retailer_photos/medium/'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 00:42
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Index dibuat CONCURRENTLY supaya tabel voucher/retailer tidak terkunci selama build
+    atomic = False
+
+    dependencies = [
+        ('retailer', '0017_retailerphoto_medium'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='retailer',
+            index=models.Index(fields=['phone_number'], name='retailer_phone_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='retailer',
+            index=models.Index(fields=['wholesale', '-created_at', '-id'], name='retailer_ws_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='retailer',
+            index=models.Index(fields=['-created_at', '-id'], name='retailer_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='retailerphoto',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['retailer'], name='photo_unverified_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='voucher',
+            index=models.Index(fields=['-created_at', '-id'], name='voucher_created_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from datetime import datetime
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class Retailer(models.Model):
@@ -16,8 +17,34 @@ class Retailer(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            # Cek duplikat nomor saat registrasi
+            models.Index(fields=['phone_number'], name='retailer_phone_idx'),
+            # list_retailers?ws_id= dengan keyset pagination (-created_at, -id)
+            models.Index(fields=['wholesale', '-created_at', '-id'], name='retailer_ws_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='retailer_created_idx'),
+        ]
+
 # Model untuk Voucher
 class Voucher(models.Model):
+    STATE_PENDING = 'pending'
+    STATE_REJECTED = 'rejected'
+    STATE_RECEIVED = 'received'
+    STATE_REDEEMED = 'redeemed'
+    STATE_WAITING = 'waiting'
+    STATE_COMPLETED = 'completed'
+    STATE_PAID = 'paid'
+    LIFECYCLE_STATE_CHOICES = [
+        (STATE_PENDING, 'PENDING'),
+        (STATE_REJECTED, 'REJECTED'),
+        (STATE_RECEIVED, 'RECEIVED'),
+        (STATE_REDEEMED, 'REDEEMED'),
+        (STATE_WAITING, 'WAITING REIMBURSE'),
+        (STATE_COMPLETED, 'REIMBURSE COMPLETED'),
+        (STATE_PAID, 'REIMBURSE PAID'),
+    ]
+
     code = models.CharField(max_length=20, unique=True)
     retailer = models.ForeignKey(Retailer, on_delete=models.CASCADE)
     is_approved = models.BooleanField(default=False)
@@ -28,14 +55,40 @@ class Voucher(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expired_at = models.DateTimeField(null=True, blank=True)
     project = models.ForeignKey('office.VoucherProject', on_delete=models.CASCADE, null=True, blank=True)
+    lifecycle_state = models.CharField(
+        max_length=20,
+        choices=LIFECYCLE_STATE_CHOICES,
+        default=STATE_PENDING,
+        db_index=True,
+        help_text="Status siklus voucher (denormalisasi dari approval, redeem dan reimburse)"
+    )
+    lifecycle_state_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
     
     def __str__(self):
         return self.code
 
+    def set_lifecycle_state(self, state, at=None):
+        """Set lifecycle state voucher, voucher yang ditolak tetap REJECTED"""
+        if self.is_rejected and state != self.STATE_REJECTED:
+            return False
+        if self.redeemed and state == self.STATE_RECEIVED:
+            return False
+        self.lifecycle_state = state
+        self.lifecycle_state_at = at or timezone.now()
+        return True
+
+    class Meta:
+        indexes = [
+            # list_vouchers dengan keyset pagination (-created_at, -id)
+            models.Index(fields=['-created_at', '-id'], name='voucher_created_idx'),
+        ]
+
 # Model untuk Foto Retailer (Menambahkan relasi banyak foto)
 class RetailerPhoto(models.Model):
     retailer = models.ForeignKey(Retailer, on_delete=models.CASCADE)
     image = models.ImageField(upload_to='retailer_photos/')
+    thumbnail = models.ImageField(upload_to='retailer_photos/thumbnails/', null=True, blank=True)
+    medium = models.ImageField(upload_to='retailer_photos/medium/', null=True, blank=True)
     is_verified = models.BooleanField(default=False)
     is_approved = models.BooleanField(default=False)
     is_rejected = models.BooleanField(default=False)
@@ -47,3 +100,26 @@ class RetailerPhoto(models.Model):
     def __str__(self):
         return f"Photo of {self.retailer.name}"
 
+    @staticmethod
+    def file_url(field_file):
+        return field_file.url if field_file else None
+
+    @property
+    def image_url(self):
+        return self.file_url(self.image)
+
+    @property
+    def thumbnail_url(self):
+        # Fallback ke gambar asli jika rendition belum dibuat oleh worker
+        return self.file_url(self.thumbnail) or self.image_url
+
+    @property
+    def medium_url(self):
+        return self.file_url(self.medium) or self.image_url
+
+    class Meta:
+        indexes = [
+            # Antrian verifikasi: foto yang belum diverifikasi, dikelompokkan per retailer
+            models.Index(fields=['retailer'], condition=models.Q(is_verified=False), name='photo_unverified_idx'),
+        ]
+
@@ -0,0 +1,89 @@
+import logging
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.mail import EmailMessage
+from jobs.models import StagedFile
+from .images import process_photo, process_renditions, rendition_name
+from .models import Retailer, RetailerPhoto
+
+logger = logging.getLogger(__name__)
+
+
+def _save_renditions(photo, name, fmt, renditions):
+    for field, data in renditions.items():
+        getattr(photo, field).save(rendition_name(name, fmt, f'_{field}'), ContentFile(data), save=False)
+
+
+def store_retailer_photo(photo_id, name, staged_file_id):
+    """Compress an uploaded registration photo (kept in StagedFile `staged_file_id`), render its thumbnail/medium versions and write them to storage (S3)"""
+    staged = StagedFile.objects.filter(pk=staged_file_id).first()
+    if staged is None:
+        logger.warning(f"StagedFile {staged_file_id} for RetailerPhoto {photo_id} no longer exists, skipping upload.")
+        return
+    photo = RetailerPhoto.objects.filter(pk=photo_id).first()
+    if photo is None:
+        logger.warning(f"RetailerPhoto {photo_id} no longer exists, skipping upload.")
+        staged.delete()
+        return
+    blob = bytes(staged.data)
+    fmt, image, renditions = process_photo(blob)
+    photo.image.save(rendition_name(name, fmt), ContentFile(image), save=False)
+    _save_renditions(photo, name, fmt, renditions)
+    photo.save(update_fields=['image', *renditions])
+    staged.delete()
+    logger.info(f"Stored photo {photo.image.name} ({len(blob)} -> {len(image)} bytes) for retailer {photo.retailer_id}")
+
+
+def generate_photo_renditions(photo_id):
+    """Create missing renditions for a photo that was uploaded before renditions existed"""
+    photo = RetailerPhoto.objects.filter(pk=photo_id).first()
+    if photo is None or not photo.image:
+        return
+    with photo.image.open('rb') as f:
+        fmt, renditions = process_renditions(f.read())
+    _save_renditions(photo, photo.image.name, fmt, renditions)
+    photo.save(update_fields=list(renditions))
+    logger.info(f"Generated renditions for photo {photo.id}")
+
+
+def send_registration_email(retailer_id):
+    """Notify admins that a retailer registered and is waiting for verification"""
+    retailer = Retailer.objects.select_related('wholesale').get(pk=retailer_id)
+    wholesale = retailer.wholesale
+
+    frontend_url = os.getenv('FRONTEND_URL', '')
+    verification_url = f"{frontend_url}/verification"
+
+    html_content = f"""
+        <html>
+        <body>
+            <p>Dear Admin,</p>
+            <p>Berkaitan dengan program Super Perdana, Retailer telah melakukan pendaftaran dengan detail berikut:</p>
+            <table>
+                <tr><td><strong>Nama Retailer</strong></td><td>: {retailer.name}</td></tr>
+                <tr><td><strong>No WhatsApp</strong></td><td>: {retailer.phone_number}</td></tr>
+                <tr><td><strong>Nama Agen</strong></td><td>: {wholesale.name if wholesale else '-'}</td></tr>
+                <tr><td><strong>Tanggal Pengisian</strong></td><td>: {retailer.created_at.strftime('%Y-%m-%d')}</td></tr>
+                <tr><td><strong>Status</strong></td><td>: Menunggu Verifikasi</td></tr>
+            </table>
+            <p>Mohon segera melakukan verifikasi data mereka dengan klik tombol di bawah ini:</p>
+            <p><a href="{verification_url}">Verifikasi Sekarang</a></p>
+        </body>
+        </html>
+    """
+
+    to_emails = os.getenv('RETAILER_REGISTRATION_TO_EMAILS', 'banyu.senjana@limamail.net').split(',')
+    cc_emails = [email.strip() for email in os.getenv('RETAILER_REGISTRATION_CC_EMAILS', 'dimas.rosadi@limamail.net').split(',') if email.strip()]
+
+    email = EmailMessage(
+        subject='Verifikasi Retailer',
+        body=html_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=to_emails,
+        cc=cc_emails,
+    )
+    email.content_subtype = 'html'  # Agar email dikirim dalam format HTML
+    # Exception dibiarkan naik supaya job di-retry oleh worker
+    email.send(fail_silently=False)
+    logger.info(f"Registration email for retailer {retailer_id} sent to {to_emails} with CC to {cc_emails}")
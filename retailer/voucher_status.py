@@ -0,0 +1,96 @@
+from django.db.models import Case, CharField, DateTimeField, Exists, F, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from office.models import Reimburse
+from wholesales.models import VoucherRedeem
+from .models import Voucher
+
+# Label status voucher seperti yang ditampilkan di laporan retailer
+NO_VOUCHER = 'No Voucher'
+PENDING = 'PENDING'
+REJECTED = 'REJECTED'
+RECEIVED = 'RECEIVED'
+REDEEMED = 'REDEEMED'
+WAITING_REIMBURSE = 'WAITING REIMBURSE'
+REIMBURSE_COMPLETED = 'REIMBURSE COMPLETED'
+REIMBURSE_PAID = 'REIMBURSE PAID'
+
+VOUCHER_STATUSES = [
+    PENDING, REJECTED, RECEIVED, REDEEMED,
+    WAITING_REIMBURSE, REIMBURSE_COMPLETED, REIMBURSE_PAID,
+]
+
+# Mapping Voucher.lifecycle_state <-> label status voucher
+LIFECYCLE_STATE_LABELS = dict(Voucher.LIFECYCLE_STATE_CHOICES)
+LIFECYCLE_STATES_BY_LABEL = {label: state for state, label in Voucher.LIFECYCLE_STATE_CHOICES}
+
+# State reimburse yang diturunkan dari ReimburseStatus.status
+REIMBURSE_STATES = [Voucher.STATE_WAITING, Voucher.STATE_COMPLETED, Voucher.STATE_PAID]
+
+
+def with_voucher_status(retailers):
+    """
+    Prefetch the vouchers of every retailer in one query (no correlated
+    subqueries), so voucher_status() reads the first voucher's denormalized
+    `Voucher.lifecycle_state` from memory.
+    """
+    return retailers.prefetch_related(
+        Prefetch(
+            'voucher_set',
+            queryset=Voucher.objects.order_by('pk').only(
+                'id', 'retailer_id', 'code', 'is_approved', 'lifecycle_state', 'lifecycle_state_at'
+            ),
+            to_attr='status_vouchers',
+        )
+    )
+
+
+def voucher_status(retailer):
+    """(first voucher or None, status label, status at) of a retailer"""
+    if not hasattr(retailer, 'status_vouchers'):
+        # Tanpa with_voucher_status: satu query, hasilnya disimpan di objek
+        retailer.status_vouchers = list(retailer.voucher_set.order_by('pk')[:1])
+    if not retailer.status_vouchers:
+        return None, NO_VOUCHER, None
+    voucher = retailer.status_vouchers[0]
+    return voucher, LIFECYCLE_STATE_LABELS.get(voucher.lifecycle_state, PENDING), voucher.lifecycle_state_at
+
+
+def filter_by_voucher_status(retailers, label):
+    """Filter retailers whose voucher is in the given status label (uses the lifecycle_state index)"""
+    state = LIFECYCLE_STATES_BY_LABEL[label]
+    return retailers.filter(pk__in=Voucher.objects.filter(lifecycle_state=state).values('retailer_id'))
+
+
+def lifecycle_state_expressions(reimburse_model=Reimburse, redeem_model=VoucherRedeem):
+    """
+    Expressions deriving lifecycle_state / lifecycle_state_at of a Voucher row
+    from its approval flags, redeem and reimburse records. Used to backfill the
+    denormalized columns with a set-based UPDATE (migration 0015 passes its
+    historical models).
+    """
+    reimburses = reimburse_model.objects.filter(voucher=OuterRef('pk')).order_by('pk')
+    redeems = redeem_model.objects.filter(voucher=OuterRef('pk')).order_by('pk')
+    reimburse_state = Subquery(
+        reimburses.filter(status__status__in=REIMBURSE_STATES).values('status__status')[:1]
+    )
+    has_redeem = Q(redeemed=True) & Exists(redeems)
+
+    state = Case(
+        When(is_rejected=True, then=Value(Voucher.STATE_REJECTED)),
+        When(redeemed=True, then=Coalesce(reimburse_state, Value(Voucher.STATE_REDEEMED))),
+        When(is_approved=True, then=Value(Voucher.STATE_RECEIVED)),
+        default=Value(Voucher.STATE_PENDING),
+        output_field=CharField(),
+    )
+    state_at = Case(
+        When(is_rejected=True, then=F('rejected_at')),
+        When(
+            has_redeem & Exists(reimburses.filter(status__isnull=False)),
+            then=Subquery(reimburses.filter(status__isnull=False).values('status__status_at')[:1]),
+        ),
+        When(has_redeem, then=Subquery(redeems.values('redeemed_at')[:1])),
+        When(is_approved=True, then=F('approved_at')),
+        default=F('created_at'),
+        output_field=DateTimeField(),
+    )
+    return state, state_at
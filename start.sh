@@ -27,6 +27,14 @@ while ! nc -z ${PSQL_HOST:-localhost} ${PSQL_PORT:-5432}; do
 done
 echo "✅ Database is ready!"
 
+# Job worker (foto, email, WhatsApp) berjalan sebagai container/proses sendiri:
+# APP_ROLE=worker menjadikan run_jobs proses utama, sehingga restart policy
+# container (mis. `restart: unless-stopped`) menjalankannya lagi kalau mati.
+if [ "${APP_ROLE:-web}" = "worker" ]; then
+    echo "🧵 Starting job worker..."
+    exec python3 manage.py run_jobs
+fi
+
 # Test Django settings
 echo "🔧 Testing Django configuration..."
 python3 manage.py check --deploy
@@ -35,6 +43,9 @@ python3 manage.py check --deploy
 echo "📦 Running database migrations..."
 python3 manage.py migrate --noinput
 
+# Tabel untuk CACHE_BACKEND=db (tidak melakukan apa-apa untuk backend lain)
+python3 manage.py createcachetable
+
 # Collect static files
 echo "📁 Collecting static files..."
 python3 manage.py collectstatic --noinput --clear
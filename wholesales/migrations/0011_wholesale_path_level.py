@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    # Isi path/level per tingkat, mulai dari root (breadth-first)
+    Wholesale = apps.get_model('wholesales', 'Wholesale')
+    parents = {None: ('/', -1)}
+    pending = list(Wholesale.objects.values_list('pk', 'parent_id'))
+    while pending:
+        level_rows = [(pk, parent_id) for pk, parent_id in pending if parent_id in parents]
+        if not level_rows:
+            # Sisa baris membentuk siklus; dijadikan root supaya tetap punya path
+            level_rows = [(pk, None) for pk, _ in pending]
+        updated = []
+        for pk, parent_id in level_rows:
+            parent_path, parent_level = parents[parent_id]
+            parents[pk] = (f"{parent_path}{pk}/", parent_level + 1)
+            updated.append(Wholesale(pk=pk, path=parents[pk][0], level=parents[pk][1]))
+        Wholesale.objects.bulk_update(updated, ['path', 'level'], batch_size=1000)
+        done = {pk for pk, _ in level_rows}
+        pending = [row for row in pending if row[0] not in done]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wholesales', '0010_wholesale_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wholesale',
+            name='level',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Kedalaman di hierarki (0 untuk root)'),
+        ),
+        migrations.AddField(
+            model_name='wholesale',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddIndex(
+            model_name='wholesale',
+            index=models.Index(fields=['path'], name='wholesale_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
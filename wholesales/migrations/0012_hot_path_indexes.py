@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wholesales', '0011_wholesale_path_level'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wholesale',
+            index=models.Index(fields=['name'], name='wholesale_name_idx'),
+        ),
+    ]
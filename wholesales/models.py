@@ -1,7 +1,25 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 
 
+class WholesaleQuerySet(models.QuerySet):
+    def with_hierarchy(self):
+        """
+        Annotate active_children_count, hierarchy_is_root and hierarchy_is_leaf
+        (level is already a column) and join parent/project, so
+        WholesaleSerializer renders every row without extra queries.
+        """
+        return self.select_related('parent', 'project').annotate(
+            active_children_count=Count('children', filter=Q(children__is_active=True), distinct=True),
+        ).annotate(
+            hierarchy_is_root=ExpressionWrapper(Q(parent__isnull=True), output_field=BooleanField()),
+            hierarchy_is_leaf=ExpressionWrapper(Q(active_children_count=0), output_field=BooleanField()),
+        )
+
+
 # Create your models here.
 # Model untuk Wholesales (Pengguna yang redeem voucher)
 class Wholesale(models.Model):
@@ -24,9 +42,59 @@ class Wholesale(models.Model):
         related_name='children',
         help_text="Parent wholesale untuk struktur hierarki"
     )
+    # Materialized path hierarki, mis. "/1/5/12/" (id root sampai id sendiri), dijaga oleh save()
+    path = models.CharField(max_length=500, default='', blank=True, editable=False)
+    level = models.PositiveIntegerField(default=0, db_index=True, editable=False, help_text="Kedalaman di hierarki (0 untuk root)")
+
+    objects = WholesaleQuerySet.as_manager()
 
     def __str__(self):
         return self.name
+
+    @staticmethod
+    def build_path(parent_path, pk):
+        return f"{parent_path or '/'}{pk}/"
+
+    def check_parent(self, parent=None):
+        """Raise ValidationError if `parent` is this wholesale or one of its descendants"""
+        parent = parent if parent is not None else self.parent
+        if parent is None or self.pk is None:
+            return
+        if parent.pk == self.pk or f"/{self.pk}/" in (parent.path or ''):
+            raise ValidationError("Parent cannot be the wholesale itself or one of its descendants.")
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            parent_path = ''
+            if self.parent_id:
+                # Path parent dibaca dari DB (bisa berubah sejak instance parent dimuat)
+                parent_path = Wholesale.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+                self.check_parent(Wholesale(pk=self.parent_id, path=parent_path))
+
+            old_path = None
+            if self.pk is not None:
+                old_path = Wholesale.objects.select_for_update().filter(pk=self.pk).values_list('path', flat=True).first()
+
+            if self.pk is not None:
+                self.path = self.build_path(parent_path, self.pk)
+                self.level = self.path.count('/') - 2
+                # save(update_fields=['parent']) harus ikut menyimpan path/level, kalau tidak
+                # subtree dipindah ke path baru sementara baris ini sendiri tetap di path lama
+                if kwargs.get('update_fields') is not None and old_path != self.path:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'path', 'level'}
+            super().save(*args, **kwargs)
+
+            if old_path is None:
+                # Baris baru: id baru diketahui setelah insert
+                self.path = self.build_path(parent_path, self.pk)
+                self.level = self.path.count('/') - 2
+                Wholesale.objects.filter(pk=self.pk).update(path=self.path, level=self.level)
+            elif old_path and old_path != self.path:
+                # Reparent: pindahkan seluruh subtree dengan satu UPDATE
+                Wholesale.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                    level=F('level') + (self.path.count('/') - old_path.count('/')),
+                )
     
     def get_children(self, active_only=False):
         """Get all direct children of this wholesale"""
@@ -36,34 +104,34 @@ class Wholesale(models.Model):
     
     def get_all_descendants(self, active_only=False):
         """Get all descendants (children, grandchildren, etc.) of this wholesale"""
-        descendants = []
-        children = self.get_children(active_only=active_only)
-        for child in children:
-            descendants.append(child)
-            descendants.extend(child.get_all_descendants(active_only=active_only))
-        return descendants
+        descendants = Wholesale.objects.filter(path__startswith=self.path).exclude(pk=self.pk)
+        if active_only:
+            # Subtree di bawah wholesale non-aktif ikut dikeluarkan
+            inactive = descendants.filter(is_active=False).values_list('path', flat=True)
+            excluded = Q()
+            for path in inactive:
+                excluded |= Q(path__startswith=path)
+            if excluded:
+                descendants = descendants.exclude(excluded)
+        return descendants.order_by('path')
     
+    def get_ancestor_ids(self):
+        """Ancestor ids from the materialized path, nearest (parent) first"""
+        return [int(pk) for pk in self.path.strip('/').split('/')[:-1]][::-1]
+
     def get_ancestors(self):
         """Get all ancestors (parent, grandparent, etc.) of this wholesale"""
-        ancestors = []
-        current = self.parent
-        while current:
-            ancestors.append(current)
-            current = current.parent
-        return ancestors
+        ancestor_ids = self.get_ancestor_ids()
+        ancestors = Wholesale.objects.with_hierarchy().in_bulk(ancestor_ids)
+        return [ancestors[pk] for pk in ancestor_ids if pk in ancestors]
     
     def get_level(self):
         """Get the level/depth of this wholesale in the hierarchy (0 for root)"""
-        level = 0
-        current = self.parent
-        while current:
-            level += 1
-            current = current.parent
-        return level
+        return self.level
     
     def is_root(self):
         """Check if this wholesale is a root (has no parent)"""
-        return self.parent is None
+        return self.parent_id is None
     
     def is_leaf(self, active_only=True):
         """Check if this wholesale is a leaf (has no active children by default)"""
@@ -74,6 +142,12 @@ class Wholesale(models.Model):
     class Meta:
         verbose_name = "Wholesale"
         verbose_name_plural = "Wholesales"
+        indexes = [
+            # Lookup wholesale berdasarkan nama (registrasi retailer, redeem voucher)
+            models.Index(fields=['name'], name='wholesale_name_idx'),
+            # varchar_pattern_ops supaya filter path__startswith (LIKE 'x%') memakai index di PostgreSQL
+            models.Index(fields=['path'], name='wholesale_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
 # Model untuk Rekaman Redeem Voucher oleh Wholesales
 class VoucherRedeem(models.Model):
@@ -0,0 +1,144 @@
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from office.models import Item
+from .models import VoucherRedeem, WholesaleTransaction, WholesaleTransactionDetail
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+
+class ReceiptError(Exception):
+    """Invalid receipt (transaction voucher) submission; `details` is added to the API error response"""
+
+    def __init__(self, message, **details):
+        self.message = message
+        self.details = details
+        super().__init__(message)
+
+
+class UnknownItems(ReceiptError):
+    """Some item_id values do not exist"""
+
+
+class UploadFailed(ReceiptError):
+    """The receipt photo could not be written to storage; nothing was saved"""
+
+
+def _decimal(value, field):
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ReceiptError(f"{field} must be a number")
+    # NaN / Infinity lolos Decimal(), tapi gagal saat quantize atau dibandingkan
+    if not number.is_finite():
+        raise ReceiptError(f"{field} must be a number")
+    return number.quantize(CENT)
+
+
+def validate(items, total_price, total_price_after_discount):
+    """
+    Validate the receipt lines against Item.price.
+
+    All items are loaded with one query; every line's sub_total must equal
+    price * qty (rounded to cents) and total_price the sum of the lines.
+    Returns unsaved WholesaleTransactionDetail objects (without transaction).
+    Raises UnknownItems for missing item ids and ReceiptError otherwise.
+    """
+    if isinstance(items, str):
+        try:
+            items = json.loads(items)
+        except ValueError:
+            raise ReceiptError("items must be a JSON list")
+    if not isinstance(items, list) or not all(isinstance(line, dict) for line in items):
+        raise ReceiptError("items must be a list of {item_id, qty, sub_total}")
+
+    lines = []
+    for line in items:
+        missing = [field for field in ('item_id', 'qty', 'sub_total') if line.get(field) in (None, '')]
+        if missing:
+            raise ReceiptError(f"{', '.join(missing)} is required for every item")
+        try:
+            item_id = int(line['item_id'])
+        except (TypeError, ValueError):
+            raise ReceiptError("item_id must be an integer")
+        qty = _decimal(line['qty'], 'qty')
+        if qty <= 0:
+            raise ReceiptError("qty must be greater than 0")
+        lines.append((item_id, qty, _decimal(line['sub_total'], 'sub_total')))
+
+    prices = Item.objects.in_bulk({item_id for item_id, _, _ in lines})
+    unknown = sorted({item_id for item_id, _, _ in lines} - set(prices))
+    if unknown:
+        raise UnknownItems("Item not found", item_ids=unknown)
+
+    details, mismatches = [], []
+    for item_id, qty, sub_total in lines:
+        expected = (prices[item_id].price * qty).quantize(CENT)
+        if sub_total != expected:
+            mismatches.append({"item_id": item_id, "sub_total": str(sub_total), "expected": str(expected)})
+        details.append(WholesaleTransactionDetail(item=prices[item_id], qty=qty, sub_total=expected))
+    if mismatches:
+        raise ReceiptError("sub_total does not match item price * qty", items=mismatches)
+
+    total = sum((detail.sub_total for detail in details), Decimal('0.00'))
+    if _decimal(total_price, 'total_price') != total:
+        raise ReceiptError("total_price does not match the sum of sub_total", expected=str(total))
+    after_discount = _decimal(total_price_after_discount, 'total_price_after_discount')
+    if not Decimal('0.00') <= after_discount <= total:
+        raise ReceiptError("total_price_after_discount must be between 0 and total_price")
+    return details
+
+
+def _check_submittable(voucher_redeem):
+    if voucher_redeem is None:
+        raise ReceiptError("This voucher has not been redeemed by this wholesaler")
+    if WholesaleTransaction.objects.filter(voucher_redeem=voucher_redeem).exists():
+        raise ReceiptError("This voucher has already been submitted")
+
+
+def _upload_image(image):
+    """Write the receipt photo to the image field's storage (S3); returns the stored name"""
+    field = WholesaleTransaction._meta.get_field('image')
+    try:
+        return field.storage.save(field.generate_filename(None, image.name), image)
+    except Exception:
+        logger.exception("Receipt upload failed for %s", image.name)
+        raise UploadFailed("Receipt photo could not be stored, please retry")
+
+
+def save(voucher, wholesaler, details, total_price, total_price_after_discount, image, username):
+    """
+    Upload the receipt photo, then create the WholesaleTransaction and its
+    details (one bulk_create) in one transaction. A voucher that is not
+    redeemed or already submitted is rejected before the upload; the upload
+    happens before the VoucherRedeem row is locked, so no lock is held during
+    it. A failed upload saves nothing (UploadFailed) and a rolled back
+    transaction removes the uploaded photo again. The check is repeated under
+    the VoucherRedeem lock, so a receipt is saved only once per
+    voucher/wholesaler.
+    """
+    # Cek tanpa lock dulu supaya request duplikat / retry tidak meng-upload ke S3 sama sekali
+    _check_submittable(VoucherRedeem.objects.filter(voucher=voucher, wholesaler=wholesaler).first())
+    image_name = _upload_image(image)
+    try:
+        with transaction.atomic():
+            voucher_redeem = VoucherRedeem.objects.select_for_update().filter(voucher=voucher, wholesaler=wholesaler).first()
+            _check_submittable(voucher_redeem)
+
+            wholesale_transaction = WholesaleTransaction.objects.create(
+                total_price=_decimal(total_price, 'total_price'),
+                total_price_after_discount=_decimal(total_price_after_discount, 'total_price_after_discount'),
+                image=image_name,
+                voucher_redeem=voucher_redeem,
+                created_by=username
+            )
+            for detail in details:
+                detail.transaction = wholesale_transaction
+            WholesaleTransactionDetail.objects.bulk_create(details)
+    except Exception:
+        WholesaleTransaction._meta.get_field('image').storage.delete(image_name)
+        raise
+    return voucher_redeem, wholesale_transaction
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
 from .models import Wholesale, VoucherRedeem
 
 class WholesaleSerializer(serializers.ModelSerializer):
@@ -20,7 +21,9 @@ class WholesaleSerializer(serializers.ModelSerializer):
         ref_name = 'WholesaleHierarchy'
         
     def get_children_count(self, obj):
-        """Get count of direct children that are active"""
+        """Get count of direct children that are active (annotation dari Wholesale.objects.with_hierarchy())"""
+        if hasattr(obj, 'active_children_count'):
+            return obj.active_children_count
         return obj.get_children(active_only=True).count()
         
     def get_level(self, obj):
@@ -29,12 +32,28 @@ class WholesaleSerializer(serializers.ModelSerializer):
         
     def get_is_root(self, obj):
         """Check if is root"""
+        if hasattr(obj, 'hierarchy_is_root'):
+            return obj.hierarchy_is_root
         return obj.is_root()
         
     def get_is_leaf(self, obj):
         """Check if is leaf (has no active children)"""
+        if hasattr(obj, 'hierarchy_is_leaf'):
+            return obj.hierarchy_is_leaf
+        if hasattr(obj, 'active_children_count'):
+            return obj.active_children_count == 0
         return obj.is_leaf(active_only=True)
 
+    def validate_parent(self, value):
+        """Parent tidak boleh wholesale itu sendiri atau salah satu turunannya"""
+        if value is not None and self.instance is not None:
+            try:
+                self.instance.check_parent(value)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
+        return value
+
+
 class WholesaleTreeSerializer(serializers.ModelSerializer):
     """Serializer for wholesale with full hierarchy tree"""
     children = serializers.SerializerMethodField()
@@ -52,12 +71,15 @@ class WholesaleTreeSerializer(serializers.ModelSerializer):
         
     def get_children(self, obj):
         """Get all direct active children"""
-        children = obj.get_children(active_only=True)
+        # context['tree'] (WholesaleTree) berisi seluruh subtree yang sudah dimuat
+        tree = self.context.get('tree')
+        children = tree.children_of(obj) if tree else obj.get_children(active_only=True)
         return WholesaleTreeSerializer(children, many=True, context=self.context).data
         
     def get_ancestors(self, obj):
         """Get all ancestors"""
-        ancestors = obj.get_ancestors()
+        tree = self.context.get('tree')
+        ancestors = tree.ancestors_of(obj) if tree else obj.get_ancestors()
         return WholesaleSerializer(ancestors, many=True, context=self.context).data
         
     def get_level(self, obj):
@@ -85,11 +107,11 @@ class WholesaleHierarchySerializer(serializers.ModelSerializer):
         
     def get_children(self, obj):
         """Get direct children"""
-        return WholesaleSerializer(obj.get_children(active_only=True), many=True, context=self.context).data
+        return WholesaleSerializer(obj.get_children(active_only=True).with_hierarchy(), many=True, context=self.context).data
         
     def get_all_descendants(self, obj):
         """Get all descendants"""
-        return WholesaleSerializer(obj.get_all_descendants(active_only=True), many=True, context=self.context).data
+        return WholesaleSerializer(obj.get_all_descendants(active_only=True).with_hierarchy(), many=True, context=self.context).data
         
     def get_ancestors(self, obj):
         """Get all ancestors"""
@@ -101,10 +123,14 @@ class WholesaleHierarchySerializer(serializers.ModelSerializer):
         
     def get_is_root(self, obj):
         """Check if is root"""
+        if hasattr(obj, 'hierarchy_is_root'):
+            return obj.hierarchy_is_root
         return obj.is_root()
         
     def get_is_leaf(self, obj):
         """Check if is leaf (has no active children)"""
+        if hasattr(obj, 'hierarchy_is_leaf'):
+            return obj.hierarchy_is_leaf
         return obj.is_leaf(active_only=True)
 
 class VoucherRedeemSerializer(serializers.ModelSerializer):
@@ -1,3 +1,223 @@
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from .models import Wholesale
+from .serializers import WholesaleSerializer
 
 # Create your tests here.
+
+
+class WholesalePathTest(TestCase):
+    """save() keeps path/level of a wholesale and its whole subtree in sync with parent"""
+
+    def create(self, name, parent=None):
+        return Wholesale.objects.create(name=name, phone_number='62811', parent=parent)
+
+    def assertPath(self, wholesale, *ancestors):
+        wholesale.refresh_from_db()
+        ids = [ancestor.pk for ancestor in ancestors] + [wholesale.pk]
+        self.assertEqual(wholesale.path, '/' + ''.join(f'{pk}/' for pk in ids))
+        self.assertEqual(wholesale.level, len(ancestors))
+
+    def setUp(self):
+        self.root = self.create('Root')
+        self.child = self.create('Child', self.root)
+        self.grandchild = self.create('Grandchild', self.child)
+        self.other = self.create('Other')
+
+    def test_insert_sets_path_and_level(self):
+        self.assertPath(self.root)
+        self.assertPath(self.child, self.root)
+        self.assertPath(self.grandchild, self.root, self.child)
+        self.assertEqual(self.grandchild.get_ancestor_ids(), [self.child.pk, self.root.pk])
+        self.assertEqual(list(self.root.get_all_descendants()), [self.child, self.grandchild])
+
+    def test_reparent_moves_subtree(self):
+        self.child.parent = self.other
+        self.child.save()
+        self.assertPath(self.child, self.other)
+        self.assertPath(self.grandchild, self.other, self.child)
+        self.assertEqual(list(self.root.get_all_descendants()), [])
+
+    def test_reparent_to_root(self):
+        self.child.parent = None
+        self.child.save()
+        self.assertPath(self.child)
+        self.assertPath(self.grandchild, self.child)
+
+    def test_reparent_with_update_fields_saves_own_path(self):
+        self.child.parent = self.other
+        self.child.save(update_fields=['parent'])
+        self.assertPath(self.child, self.other)
+        self.assertPath(self.grandchild, self.other, self.child)
+
+    def test_save_without_reparent_keeps_update_fields(self):
+        self.child.name = 'Renamed'
+        self.child.save(update_fields=['name'])
+        self.child.refresh_from_db()
+        self.assertEqual(self.child.name, 'Renamed')
+        self.assertPath(self.child, self.root)
+
+    def test_parent_cannot_be_self_or_descendant(self):
+        for parent in (self.root, self.child, self.grandchild):
+            with self.subTest(parent=parent.name):
+                self.root.parent = parent
+                with self.assertRaises(ValidationError):
+                    self.root.save()
+        self.assertPath(self.root)
+        self.assertPath(self.grandchild, self.root, self.child)
+
+    def test_check_parent_reads_current_path(self):
+        # Instance parent yang dimuat sebelum reparent tidak boleh meloloskan siklus
+        stale_other = Wholesale.objects.get(pk=self.other.pk)
+        self.other.parent = self.grandchild
+        self.other.save()
+        self.root.parent = stale_other
+        with self.assertRaises(ValidationError):
+            self.root.save()
+
+
+class WholesaleTreeTestCase(TestCase):
+    """Root > Cabang > Toko > Kios, Root > Tutup (inactive), and a second root Lain"""
+
+    @classmethod
+    def create(cls, name, parent=None, is_active=True):
+        return Wholesale.objects.create(name=name, phone_number='62811', parent=parent, is_active=is_active)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.root = cls.create('Root')
+        cls.branch = cls.create('Cabang', cls.root)
+        cls.closed = cls.create('Tutup', cls.root, is_active=False)
+        cls.shop = cls.create('Toko', cls.branch)
+        cls.kiosk = cls.create('Kios', cls.shop)
+        cls.other = cls.create('Lain')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def grow(self, count):
+        """Tambah `count` cabang aktif (masing-masing dengan satu toko) di bawah Root"""
+        for index in range(count):
+            branch = self.create(f'Cabang {index}', self.root)
+            self.create(f'Toko {index}', branch)
+
+
+def names(node):
+    """{name: children} of a WholesaleTreeSerializer node"""
+    return {child['name']: names(child) for child in node['children']}
+
+
+class WholesaleTreeTest(WholesaleTreeTestCase):
+    """roots/tree load each subtree with a fixed number of queries and honour max_depth/active_only"""
+
+    # roots: root, subtree; tree: objek, subtree, ancestors di atas root
+    ROOTS_QUERIES = 2
+    TREE_QUERIES = 3
+
+    def test_roots(self):
+        response = self.client.get(reverse('wholesale-roots'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({node['name']: names(node) for node in response.data}, {
+            'Root': {'Cabang': {'Toko': {'Kios': {}}}},
+            'Lain': {},
+        })
+        kiosk = response.data[0]['children'][0]['children'][0]['children'][0]
+        self.assertEqual(kiosk['level'], 3)
+        self.assertEqual([ancestor['name'] for ancestor in kiosk['ancestors']], ['Toko', 'Cabang', 'Root'])
+
+    def test_max_depth_and_active_only(self):
+        response = self.client.get(reverse('wholesale-roots'), {'max_depth': 1, 'active_only': 'false'})
+        self.assertEqual(names(response.data[0]), {'Cabang': {}, 'Tutup': {}})
+        response = self.client.get(reverse('wholesale-tree', args=[self.branch.pk]), {'max_depth': 0})
+        self.assertEqual(names(response.data), {})
+        response = self.client.get(reverse('wholesale-tree', args=[self.branch.pk]), {'max_depth': 1})
+        self.assertEqual(names(response.data), {'Toko': {}})
+
+    def test_invalid_max_depth(self):
+        for max_depth in ('-1', 'x'):
+            with self.subTest(max_depth=max_depth):
+                response = self.client.get(reverse('wholesale-roots'), {'max_depth': max_depth})
+                self.assertEqual(response.status_code, 400)
+
+    def test_subtree_keeps_outer_ancestors(self):
+        response = self.client.get(reverse('wholesale-tree', args=[self.shop.pk]))
+        self.assertEqual(names(response.data), {'Kios': {}})
+        self.assertEqual([ancestor['name'] for ancestor in response.data['ancestors']], ['Cabang', 'Root'])
+        self.assertEqual(
+            [ancestor['name'] for ancestor in response.data['children'][0]['ancestors']], ['Toko', 'Cabang', 'Root']
+        )
+
+    def test_query_count_does_not_grow_with_nodes(self):
+        for count in (0, 5):
+            self.grow(count)
+            with self.subTest(nodes=Wholesale.objects.count()):
+                with self.assertNumQueries(self.ROOTS_QUERIES):
+                    self.client.get(reverse('wholesale-roots'))
+                with self.assertNumQueries(self.TREE_QUERIES):
+                    self.client.get(reverse('wholesale-tree', args=[self.branch.pk]))
+
+
+class WholesaleLevelTest(WholesaleTreeTestCase):
+    """by_level and leaves filter in SQL: one query regardless of the number of wholesales"""
+
+    def test_by_level(self):
+        response = self.client.get(reverse('wholesale-by-level'), {'level': 1})
+        self.assertEqual([row['name'] for row in response.data], ['Cabang', 'Tutup'])
+        response = self.client.get(reverse('wholesale-by-level'))
+        self.assertEqual(
+            {level: [row['name'] for row in rows] for level, rows in response.data.items()},
+            {'level_0': ['Root', 'Lain'], 'level_1': ['Cabang', 'Tutup'], 'level_2': ['Toko'], 'level_3': ['Kios']},
+        )
+        self.assertEqual(self.client.get(reverse('wholesale-by-level'), {'level': 'x'}).status_code, 400)
+
+    def test_leaves(self):
+        response = self.client.get(reverse('wholesale-leaves'))
+        self.assertEqual([row['name'] for row in response.data], ['Tutup', 'Kios', 'Lain'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for count in (0, 5):
+            self.grow(count)
+            with self.subTest(rows=Wholesale.objects.count()):
+                with self.assertNumQueries(1):
+                    self.client.get(reverse('wholesale-by-level'), {'level': 1})
+                with self.assertNumQueries(1):
+                    self.client.get(reverse('wholesale-by-level'))
+                with self.assertNumQueries(1):
+                    self.client.get(reverse('wholesale-leaves'))
+
+
+class WholesaleSerializerTest(WholesaleTreeTestCase):
+    """with_hierarchy() annotations give the same output as the per-object fallbacks, without extra queries"""
+
+    def test_annotated_output_matches_plain_instances(self):
+        annotated = WholesaleSerializer(Wholesale.objects.with_hierarchy().order_by('pk'), many=True).data
+        plain = WholesaleSerializer(Wholesale.objects.order_by('pk'), many=True).data
+        self.assertEqual(annotated, plain)
+        root = next(row for row in annotated if row['name'] == 'Root')
+        # Tutup tidak aktif, jadi tidak dihitung
+        self.assertEqual((root['children_count'], root['is_root'], root['is_leaf'], root['level']), (1, True, False, 0))
+        kiosk = next(row for row in annotated if row['name'] == 'Kios')
+        self.assertEqual((kiosk['parent_name'], kiosk['is_root'], kiosk['is_leaf'], kiosk['level']), ('Toko', False, True, 3))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for count in (0, 5):
+            self.grow(count)
+            with self.subTest(rows=Wholesale.objects.count()):
+                # Nama route 'wholesale-list' dipakai dua router (api dan wholesales), jadi path ditulis langsung
+                for url in ('/api/wholesales/', '/wholesales/api/wholesales/'):
+                    with self.assertNumQueries(1):
+                        response = self.client.get(url)
+                    self.assertEqual(len(response.data), Wholesale.objects.count())
+                # get_object + children / descendants
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('wholesale-children', args=[self.root.pk]))
+                self.assertEqual(len(response.data), count + 2)
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('wholesale-descendants', args=[self.root.pk]))
+                self.assertEqual(len(response.data), 2 * count + 4)
+                # get_object + ancestors
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse('wholesale-ancestors', args=[self.kiosk.pk]))
+                self.assertEqual([row['name'] for row in response.data], ['Toko', 'Cabang', 'Root'])
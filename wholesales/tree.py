@@ -0,0 +1,104 @@
+from django.db.models import Q
+from .models import Wholesale
+
+
+def parse_tree_params(query_params):
+    """
+    Read `max_depth` and `active_only` from the query string.
+
+    max_depth: jumlah level di bawah root yang ikut diambil (kosong = semua).
+    active_only: default true, sama seperti tree lama yang hanya memuat children aktif.
+    Raises ValueError for a max_depth that is not a non-negative integer.
+    """
+    max_depth = query_params.get('max_depth')
+    if max_depth in (None, ''):
+        max_depth = None
+    else:
+        max_depth = int(max_depth)
+        if max_depth < 0:
+            raise ValueError('max_depth must be a non-negative integer')
+    active_only = query_params.get('active_only', 'true').lower() not in ('0', 'false', 'no')
+    return max_depth, active_only
+
+
+class WholesaleTree:
+    """
+    Subtrees of one or more wholesales, loaded with one query on the
+    materialized path and nested in memory.
+
+    Passed to WholesaleTreeSerializer via context['tree'] so children and
+    ancestors are looked up here instead of queried per node.
+    """
+
+    def __init__(self, roots, max_depth=None, active_only=True):
+        self.roots = list(roots)
+        self.active_only = active_only
+        self._children = {}
+        self._nodes = {}
+        self._outer_ancestors = {}
+        if not self.roots:
+            return
+
+        paths = Q()
+        for root in self.roots:
+            paths |= Q(path__startswith=root.path)
+        queryset = Wholesale.objects.filter(paths)
+        if max_depth is not None:
+            queryset = queryset.filter(level__lte=max(root.level for root in self.roots) + max_depth)
+        nodes = list(queryset.with_hierarchy().order_by('path'))
+
+        # Urut berdasarkan path: parent selalu diproses sebelum children-nya
+        depth_limit = {root.pk: root.level + max_depth if max_depth is not None else None for root in self.roots}
+        for node in nodes:
+            if node.pk in depth_limit:
+                self._nodes[node.pk] = node
+                self._children.setdefault(node.pk, [])
+                node.tree_root_id = node.pk
+                continue
+            parent = self._nodes.get(node.parent_id)
+            if parent is None or (active_only and not node.is_active):
+                continue
+            limit = depth_limit[parent.tree_root_id]
+            if limit is not None and node.level > limit:
+                continue
+            node.parent = parent
+            node.tree_root_id = parent.tree_root_id
+            self._nodes[node.pk] = node
+            self._children.setdefault(node.pk, [])
+            self._children[parent.pk].append(node)
+
+        for children in self._children.values():
+            children.sort(key=lambda child: child.pk)
+        self._load_outer_ancestors()
+
+    def _load_outer_ancestors(self):
+        """Ancestors above each root (outside the loaded subtrees), in one query"""
+        ancestor_ids = {root.pk: root.get_ancestor_ids() for root in self.roots}
+        wanted = {pk for ids in ancestor_ids.values() for pk in ids}
+        if not wanted:
+            return
+        ancestors = Wholesale.objects.with_hierarchy().in_bulk(wanted)
+        for ancestor in ancestors.values():
+            if ancestor.parent_id in ancestors:
+                ancestor.parent = ancestors[ancestor.parent_id]
+        for root_id, ids in ancestor_ids.items():
+            self._outer_ancestors[root_id] = [ancestors[pk] for pk in ids if pk in ancestors]
+            if root_id in self._nodes and self._outer_ancestors[root_id]:
+                self._nodes[root_id].parent = self._outer_ancestors[root_id][0]
+
+    def node(self, wholesale):
+        """The loaded (annotated) instance for `wholesale`"""
+        return self._nodes.get(wholesale.pk, wholesale)
+
+    def children_of(self, wholesale):
+        return self._children.get(wholesale.pk, [])
+
+    def ancestors_of(self, wholesale):
+        """Parent, grandparent, ... like Wholesale.get_ancestors()"""
+        node = self.node(wholesale)
+        ancestors = []
+        current = node
+        while current.pk != getattr(current, 'tree_root_id', current.pk):
+            current = current.parent
+            ancestors.append(current)
+        return ancestors + self._outer_ancestors.get(getattr(node, 'tree_root_id', node.pk), [])
@@ -2,6 +2,7 @@ from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Count
 from retailer.models import Voucher
 from .models import VoucherRedeem, Wholesale
@@ -11,6 +12,7 @@ from .serializers import (
     WholesaleHierarchySerializer, 
     VoucherRedeemSerializer
 )
+from .tree import WholesaleTree, parse_tree_params
 
 class WholesaleViewSet(viewsets.ModelViewSet):
     """ViewSet for Wholesale with hierarchy support"""
@@ -18,22 +20,35 @@ class WholesaleViewSet(viewsets.ModelViewSet):
     serializer_class = WholesaleSerializer
     
     def get_queryset(self):
-        """Optimize queryset with select_related for parent"""
-        return Wholesale.objects.select_related('parent').prefetch_related('children')
+        """Annotated with the hierarchy fields read by WholesaleSerializer (see with_hierarchy)"""
+        return Wholesale.objects.with_hierarchy()
     
+    def tree_response(self, request, roots, many):
+        """Serialize the subtrees of `roots`, loaded in one query (see WholesaleTree)"""
+        try:
+            max_depth, active_only = parse_tree_params(request.query_params)
+        except ValueError:
+            return Response(
+                {'error': 'max_depth must be a non-negative integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        tree = WholesaleTree(roots, max_depth=max_depth, active_only=active_only)
+        nodes = [tree.node(root) for root in tree.roots]
+        serializer = WholesaleTreeSerializer(nodes if many else nodes[0], many=many, context={'request': request, 'tree': tree})
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def roots(self, request):
-        """Get all root wholesales (no parent)"""
-        roots = self.get_queryset().filter(parent__isnull=True)
-        serializer = WholesaleTreeSerializer(roots, many=True)
-        return Response(serializer.data)
+        """Get all root wholesales (no parent), with their tree (?max_depth=&active_only=)"""
+        roots = Wholesale.objects.filter(parent__isnull=True).order_by('pk')
+        return self.tree_response(request, roots, many=True)
     
     @action(detail=False, methods=['get'])
     def leaves(self, request):
         """Get all leaf wholesales (no children)"""
         leaves = self.get_queryset().annotate(
-            children_count=Count('children')
-        ).filter(children_count=0)
+            children_count=Count('children', distinct=True)
+        ).filter(children_count=0).order_by('pk')
         serializer = self.get_serializer(leaves, many=True)
         return Response(serializer.data)
     
@@ -41,7 +56,7 @@ class WholesaleViewSet(viewsets.ModelViewSet):
     def children(self, request, pk=None):
         """Get direct children of a wholesale"""
         wholesale = self.get_object()
-        children = wholesale.get_children()
+        children = wholesale.get_children().with_hierarchy()
         serializer = self.get_serializer(children, many=True)
         return Response(serializer.data)
     
@@ -49,7 +64,7 @@ class WholesaleViewSet(viewsets.ModelViewSet):
     def descendants(self, request, pk=None):
         """Get all descendants of a wholesale"""
         wholesale = self.get_object()
-        descendants = wholesale.get_all_descendants()
+        descendants = wholesale.get_all_descendants().with_hierarchy()
         serializer = self.get_serializer(descendants, many=True)
         return Response(serializer.data)
     
@@ -70,10 +85,9 @@ class WholesaleViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def tree(self, request, pk=None):
-        """Get wholesale with full tree structure"""
+        """Get wholesale with full tree structure (?max_depth=&active_only=)"""
         wholesale = self.get_object()
-        serializer = WholesaleTreeSerializer(wholesale)
-        return Response(serializer.data)
+        return self.tree_response(request, [wholesale], many=False)
     
     @action(detail=False, methods=['get'])
     def by_level(self, request):
@@ -82,22 +96,19 @@ class WholesaleViewSet(viewsets.ModelViewSet):
         if level is not None:
             try:
                 level = int(level)
-                wholesales = []
-                for wholesale in self.get_queryset():
-                    if wholesale.get_level() == level:
-                        wholesales.append(wholesale)
-                serializer = self.get_serializer(wholesales, many=True)
-                return Response(serializer.data)
             except ValueError:
                 return Response(
                     {'error': 'Level must be an integer'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            wholesales = self.get_queryset().filter(level=level).order_by('pk')
+            serializer = self.get_serializer(wholesales, many=True)
+            return Response(serializer.data)
         
         # Return all levels if no specific level requested
         levels = {}
-        for wholesale in self.get_queryset():
-            level = wholesale.get_level()
+        for wholesale in self.get_queryset().order_by('level', 'pk'):
+            level = wholesale.level
             if level not in levels:
                 levels[level] = []
             levels[level].append(wholesale)
@@ -117,12 +128,14 @@ def redeem_voucher(request):
         try:
             voucher = Voucher.objects.get(code=voucher_code, redeemed=False)
             wholesaler = Wholesale.objects.get(name=ws_name)  # Asumsi user sudah login sebagai wholesaler
-            voucher.redeemed = True
-            voucher.save()
+            with transaction.atomic():
+                # Simpan redeem data
+                redeem = VoucherRedeem(voucher=voucher, wholesaler=wholesaler)
+                redeem.save()
 
-            # Simpan redeem data
-            redeem = VoucherRedeem(voucher=voucher, wholesaler=wholesaler)
-            redeem.save()
+                voucher.redeemed = True
+                voucher.set_lifecycle_state(Voucher.STATE_REDEEMED, redeem.redeemed_at)
+                voucher.save()
             return render(request, 'wholesales/redeem_success.html')
 
         except Voucher.DoesNotExist: